@@ -1,13 +1,36 @@
 import logging
-from typing import List, Any
+from typing import List, Any, Optional
+from pydantic import BaseModel, field_validator
 from core.state import NPCState
 from core.llm import LLMHarness
 from core.models_preset import SCENE_MODEL
 from core.memory import SemanticMemory
 from core.world_lore import WORLD_LORE
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-
-_llm = LLMHarness(model=SCENE_MODEL)
+from core.structured_output import StructuredOutputError, json_response_format
+from core.lazy_logging import truncated
+from graph.prompts import build_prompt, persona_profile
+from langchain_core.messages import HumanMessage, AIMessage
+
+
+class SceneContext(BaseModel):
+    """Saída do módulo de consciência contextual."""
+    perceived_context: str = ""
+    environmental_cues: str = ""
+    needs_world: bool = False
+    world_query: Optional[str] = None
+
+    @field_validator("perceived_context", "environmental_cues", mode="before")
+    @classmethod
+    def _as_text(cls, value: Any) -> str:
+        # Alguns modelos devolvem listas de pistas em vez de texto corrido
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            return "; ".join(str(v) for v in value if v)
+        return str(value)
+
+
+_llm = LLMHarness(model=SCENE_MODEL, profile="context_awareness", response_format=json_response_format(SceneContext))
 _logger = logging.getLogger("npc.agents.context_awareness")
 
 CONTEXT_AWARENESS_SYS_PROMPT = """
@@ -93,21 +116,19 @@ async def context_awareness(state: NPCState) -> NPCState:
             if hits:
                 world_lore_info = "\n---\n".join(hits)
                 _logger.info("context_awareness.world_lore: encontrou %d informações relevantes", len(hits))
+                _logger.debug("context_awareness.world_lore: hits=%s", truncated(world_lore_info, 1000))
     
     # Monta o prompt
     last_messages_text = "\n".join(
         f"[Mensagem {i+1}]: {msg}" for i, msg in enumerate(last_3_messages)
     ) if last_3_messages else "(nenhuma mensagem recente)"
     
-    prompt = [
-        SystemMessage(content=CONTEXT_AWARENESS_SYS_PROMPT),
-        HumanMessage(
-            content=(
-                f"PERSONA DO NPC:\n"
-                f"Nome: {persona.name if persona else 'NPC'}\n"
-                f"Backstory: {persona.backstory if persona and persona.backstory else 'N/A'}\n"
-                f"Traits: {', '.join(persona.traits) if persona and persona.traits else 'N/A'}\n"
-                f"\n"
+    # Instruções fixas e ficha da persona primeiro (cache de prefixo); o que muda por turno no final
+    prompt = build_prompt(
+        CONTEXT_AWARENESS_SYS_PROMPT,
+        stable=[persona_profile(persona)],
+        dynamic=[
+            (
                 f"EVENTOS PERCEBIDOS:\n{event_summary or '(nenhum evento)'}\n"
                 f"\n"
                 f"ÚLTIMAS 3 MENSAGENS DA CONVERSA:\n{last_messages_text}\n"
@@ -122,67 +143,50 @@ async def context_awareness(state: NPCState) -> NPCState:
                 f"2. environmental_cues: Detalhes físicos, sons, ameaças, condições do local que o NPC percebe\n"
                 f"\n"
                 f"⚠️ IMPORTANTE: perceived_context deve ser sobre o que está ACONTECENDO AGORA, não sobre objetivos ou planos futuros."
-            )
-        )
-    ]
+            ),
+        ],
+    )
     
     try:
-        import json
-        text = await _llm.run(prompt)
-        
-        # Limpa o texto (remove markdown se houver)
-        text_clean = text.strip()
-        if text_clean.startswith("```"):
-            first_newline = text_clean.find("\n")
-            last_backtick = text_clean.rfind("```")
-            if first_newline >= 0 and last_backtick >= 0:
-                text_clean = text_clean[first_newline + 1:last_backtick].strip()
-        # Remove "json" se estiver no início do code block
-        if text_clean.lower().startswith("json"):
-            text_clean = text_clean[4:].strip()
-        
-        parsed = json.loads(text_clean)
+        parsed = await _llm.run_structured(prompt, SceneContext)
         
-        if isinstance(parsed, dict):
-            perceived_context = parsed.get("perceived_context", "")
-            environmental_cues = parsed.get("environmental_cues", "")
-            needs_world = parsed.get("needs_world", False)
-            world_query = parsed.get("world_query", "")
-
-            # Armazena no state
-            state["perceived_context"] = perceived_context
-            state["environmental_cues"] = environmental_cues
-
-            # Também armazena no scratch para compatibilidade
-            scratch["perceived_context"] = perceived_context
-            scratch["environmental_cues"] = environmental_cues
-
-            # Se precisar acessar world_model, define o flag e para onde retornar (retorna para si mesmo)
-            if needs_world:
-                scratch["needs_world"] = True
-                scratch["world_model_return_to"] = "context_awareness"
-                if world_query:
-                    scratch["world_query"] = world_query
-            else:
-                # Limpa os flags se não precisar mais
-                scratch.pop("needs_world", None)
-                scratch.pop("world_query", None)
-                scratch.pop("world_model_return_to", None)
-
-            state["scratch"] = scratch
-            
-            _logger.info(
-                "context_awareness.out: perceived_context=%s environmental_cues_len=%s\n",
-                perceived_context[:100] + "..." if len(perceived_context) > 100 else perceived_context,
-                len(environmental_cues)
-            )
-            if environmental_cues:
-                _logger.info("context_awareness.environmental_cues: %s\n", environmental_cues[:150] + "..." if len(environmental_cues) > 150 else environmental_cues)
+        perceived_context = parsed.perceived_context
+        environmental_cues = parsed.environmental_cues
+        needs_world = parsed.needs_world
+        world_query = parsed.world_query or ""
+
+        # Armazena no state
+        state["perceived_context"] = perceived_context
+        state["environmental_cues"] = environmental_cues
+
+        # Também armazena no scratch para compatibilidade
+        scratch["perceived_context"] = perceived_context
+        scratch["environmental_cues"] = environmental_cues
+
+        # Se precisar acessar world_model, define o flag e para onde retornar (retorna para si mesmo)
+        if needs_world:
+            scratch["needs_world"] = True
+            scratch["world_model_return_to"] = "context_awareness"
+            if world_query:
+                scratch["world_query"] = world_query
         else:
-            _logger.warning("context_awareness.out: resposta do LLM não é um dict válido\n")
+            # Limpa os flags se não precisar mais
+            scratch.pop("needs_world", None)
+            scratch.pop("world_query", None)
+            scratch.pop("world_model_return_to", None)
+
+        state["scratch"] = scratch
+        
+        _logger.info(
+            "context_awareness.out: perceived_context=%s environmental_cues_len=%s\n",
+            truncated(perceived_context, 100),
+            len(environmental_cues)
+        )
+        if environmental_cues:
+            _logger.info("context_awareness.environmental_cues: %s\n", truncated(environmental_cues, 150))
             
-    except json.JSONDecodeError as e:
-        _logger.warning("context_awareness.out: erro ao parsear JSON: %s\n", e)
+    except StructuredOutputError as e:
+        _logger.warning("context_awareness.out: resposta inválida: %s\n", e)
         # Fallback: cria valores vazios
         state["perceived_context"] = ""
         state["environmental_cues"] = ""
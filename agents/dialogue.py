@@ -1,11 +1,14 @@
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 import logging
+from typing import Optional, Tuple
 from core.llm import LLMHarness
+from core.cascade import ModelCascade
 from core.state import NPCState
-from graph.prompts import sys_persona
-from core.models_preset import DIALOGUE_MODEL
+from graph.prompts import build_prompt
+from core.models_preset import DIALOGUE_MODEL, HEDGE_PERCENTILE, CASCADE_MODELS
 
-_llm = LLMHarness(model=DIALOGUE_MODEL)
+_llm = LLMHarness(model=DIALOGUE_MODEL, profile="dialogue", hedge_percentile=HEDGE_PERCENTILE)
+_cascade = ModelCascade(_llm, CASCADE_MODELS.get("dialogue"))
 _logger = logging.getLogger("npc.agents.dialogue")
 
 
@@ -39,6 +42,31 @@ DIALOGUE_SYS_PROMPT = """
 """
 
 
+def _split_reply(raw: str) -> Tuple[str, str]:
+    """Separa FALA_NPC e NOTA_CRITICO da saída do modelo."""
+    fala = raw
+    nota = ""
+
+    if "NOTA_CRITICO:" in raw:
+        head, tail = raw.split("NOTA_CRITICO:", 1)
+        fala = head.replace("FALA_NPC:", "").strip()
+        nota = tail.strip()
+    else:
+        if raw.startswith("FALA_NPC:"):
+            fala = raw[len("FALA_NPC:"):].strip()
+    return fala, nota
+
+
+def _validate_reply(raw: str) -> Optional[str]:
+    """Critério da cascata: FALA_NPC presente e não vazia."""
+    raw = (raw or "").strip()
+    if "FALA_NPC:" not in raw:
+        return "FALA_NPC ausente"
+    if not _split_reply(raw)[0]:
+        return "FALA_NPC vazia"
+    return None
+
+
 async def dialogue(state: NPCState) -> NPCState:
     persona = state["persona"]
     scratch = state.get("scratch") or {}
@@ -58,15 +86,6 @@ async def dialogue(state: NPCState) -> NPCState:
         bool(intent), len(str(user_text)), bool(lore)
     )
 
-    prompt = [
-        sys_persona(persona),
-        SystemMessage(content=DIALOGUE_SYS_PROMPT),
-        HumanMessage(content=f"INTENÇÃO_ATUAL:\n{intent}"),
-    ]
-
-    if lore:
-        prompt.append(HumanMessage(content=f"INFORMAÇÕES_DE_MUNDO:\n{lore}"))
-
     # Incluindo variáveis importantes do scratch (compatível com nosso modelo)
     contexto_scratch = (
         f"Plano: {scratch.get('plan')}\n"
@@ -79,24 +98,24 @@ async def dialogue(state: NPCState) -> NPCState:
         f"Conhecimento de mundo: {scratch.get('world_knowledge')}\n"
         f"Feedback do crítico anterior: {scratch.get('critic_feedback')}\n"
     )
-    prompt.append(HumanMessage(content=f"CONTEXTO_INTERNO_NPC:\n{contexto_scratch}"))
 
-    # Última fala do jogador
-    prompt.append(HumanMessage(content=f"DERRADEIRA_FALA_DO_JOGADOR:\n{user_text}"))
+    # Instruções fixas e persona primeiro (cache de prefixo); o que muda por turno no final
+    prompt = build_prompt(
+        DIALOGUE_SYS_PROMPT,
+        persona=persona,
+        dynamic=[
+            f"INTENÇÃO_ATUAL:\n{intent}",
+            f"INFORMAÇÕES_DE_MUNDO:\n{lore}" if lore else "",
+            f"CONTEXTO_INTERNO_NPC:\n{contexto_scratch}",
+            # Última fala do jogador
+            f"DERRADEIRA_FALA_DO_JOGADOR:\n{user_text}",
+        ],
+    )
 
-    raw = await _llm.run(prompt)
+    raw = await _cascade.run(prompt, validate=_validate_reply)
     raw = raw.strip()
 
-    fala = raw
-    nota = ""
-
-    if "NOTA_CRITICO:" in raw:
-        head, tail = raw.split("NOTA_CRITICO:", 1)
-        fala = head.replace("FALA_NPC:", "").strip()
-        nota = tail.strip()
-    else:
-        if raw.startswith("FALA_NPC:"):
-            fala = raw[len("FALA_NPC:"):].strip()
+    fala, nota = _split_reply(raw)
 
     scratch["candidate_reply"] = fala
     scratch["critic_feedback"] = nota
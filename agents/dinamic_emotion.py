@@ -1,11 +1,34 @@
 import logging
+from typing import Any, Dict
+from pydantic import BaseModel, field_validator
 from core.state import NPCState
 from core.json_memory import JSONMemoryStore
 from core.llm import LLMHarness
 from core.models_preset import EMOTION_MODEL
-from langchain_core.messages import SystemMessage, HumanMessage
+from core.structured_output import StructuredOutputError, json_response_format
+from graph.prompts import build_prompt, persona_profile
+from langchain_core.messages import HumanMessage
 
-_llm = LLMHarness(model=EMOTION_MODEL)
+
+class EmotionUpdate(BaseModel):
+    """Saída do módulo de emoções dinâmicas."""
+    emotions: Dict[str, float]
+    justificativa: str = ""
+
+    @field_validator("emotions", mode="before")
+    @classmethod
+    def _clamp(cls, value: Any) -> Dict[str, float]:
+        # Ignora valores não numéricos e normaliza para 0.0–1.0
+        if not isinstance(value, dict):
+            raise ValueError("emotions deve ser um objeto")
+        return {
+            str(k): max(0.0, min(1.0, float(v)))
+            for k, v in value.items()
+            if isinstance(v, (int, float)) and not isinstance(v, bool)
+        }
+
+
+_llm = LLMHarness(model=EMOTION_MODEL, profile="dinamic_emotion", response_format=json_response_format(EmotionUpdate))
 _logger = logging.getLogger("npc.agents.dinamic_emotion")
 
 DYNAMIC_EMOTION_SYS_PROMPT = """
@@ -102,15 +125,12 @@ async def dinamic_emotion(state: NPCState) -> NPCState:
         return state
     
     # Monta o prompt para o LLM
-    prompt = [
-        SystemMessage(content=DYNAMIC_EMOTION_SYS_PROMPT),
-        HumanMessage(
-            content=(
-                f"PERSONA:\n"
-                f"Nome: {persona.name if persona else 'NPC'}\n"
-                f"Backstory: {persona.backstory if persona else 'N/A'}\n"
-                f"Traits: {', '.join(persona.traits) if persona and persona.traits else 'N/A'}\n"
-                f"\n"
+    # Instruções fixas e ficha da persona primeiro (cache de prefixo); o que muda por turno no final
+    prompt = build_prompt(
+        DYNAMIC_EMOTION_SYS_PROMPT,
+        stable=[persona_profile(persona)],
+        dynamic=[
+            (
                 f"HISTÓRICO DE INTERAÇÕES (últimas 5):\n{history_summary}\n"
                 f"\n"
                 f"ÚLTIMA INTERAÇÃO:\n"
@@ -123,50 +143,29 @@ async def dinamic_emotion(state: NPCState) -> NPCState:
                 f"{', '.join(f'{k}: {v:.2f}' for k, v in previous_emotions.items()) if previous_emotions else 'Nenhuma emoção anterior registrada'}\n"
                 f"\n"
                 f"Com base nessas informações, ajuste as emoções do NPC de forma dinâmica e coerente."
-            )
-        )
-    ]
+            ),
+        ],
+    )
     
     try:
-        text = await _llm.run(prompt)
+        parsed = await _llm.run_structured(prompt, EmotionUpdate)
+        validated_emotions = parsed.emotions
+        justificativa = parsed.justificativa
         
-        # Tenta parsear JSON da resposta
-        import json
-        # Remove markdown code blocks se houver
-        text_clean = text.strip()
-        if text_clean.startswith("```"):
-            first_newline = text_clean.find("\n")
-            last_backtick = text_clean.rfind("```")
-            if first_newline >= 0 and last_backtick >= 0:
-                text_clean = text_clean[first_newline + 1:last_backtick].strip()
+        state["emotions"] = validated_emotions
         
-        parsed = json.loads(text_clean)
-        if isinstance(parsed, dict) and "emotions" in parsed:
-            new_emotions = parsed["emotions"]
-            justificativa = parsed.get("justificativa", "")
-            
-            # Valida e normaliza valores de emoção (0.0 a 1.0)
-            validated_emotions = {}
-            for key, value in new_emotions.items():
-                if isinstance(value, (int, float)):
-                    validated_emotions[key] = max(0.0, min(1.0, float(value)))
-            
-            state["emotions"] = validated_emotions
-            
-            # Armazena justificativa no scratch para referência
-            scratch["emotion_justification"] = justificativa
-            state["scratch"] = scratch
-            
-            _logger.info(
-                "dinamic_emotion.out: emotions=%s\n",
-                ", ".join(f"{k}:{v:.2f}" for k, v in validated_emotions.items())
-            )
-            if justificativa:
-                _logger.info("dinamic_emotion.justificativa: %s\n", justificativa)
-        else:
-            _logger.warning("dinamic_emotion.out: resposta do LLM não contém 'emotions', mantendo emoções atuais\n")
-    except json.JSONDecodeError as e:
-        _logger.warning("dinamic_emotion.out: erro ao parsear JSON: %s, mantendo emoções atuais\n", e)
+        # Armazena justificativa no scratch para referência
+        scratch["emotion_justification"] = justificativa
+        state["scratch"] = scratch
+        
+        _logger.info(
+            "dinamic_emotion.out: emotions=%s\n",
+            ", ".join(f"{k}:{v:.2f}" for k, v in validated_emotions.items())
+        )
+        if justificativa:
+            _logger.info("dinamic_emotion.justificativa: %s\n", justificativa)
+    except StructuredOutputError as e:
+        _logger.warning("dinamic_emotion.out: resposta inválida (%s), mantendo emoções atuais\n", e)
     except Exception as e:
         _logger.exception("dinamic_emotion.out: erro ao processar emoções dinâmicas: %s\n", e)
     
@@ -0,0 +1,131 @@
+from langchain_core.messages import HumanMessage
+import logging
+
+from pydantic import BaseModel
+
+from core.llm import LLMHarness
+from core.state import NPCState
+from graph.prompts import build_prompt
+from core.models_preset import FAST_TURN_MODEL, HEDGE_PERCENTILE
+from core.structured_output import StructuredOutputError, json_response_format
+from agents.critic import deliver_reply, relationship_context
+
+
+class FastTurnOutput(BaseModel):
+    """Saída do turno rápido: intenção, plano curto, fala final e notas de autocrítica."""
+    intencao: str
+    plano: str = ""
+    fala: str
+    notas_critico: str = ""
+
+
+_llm = LLMHarness(
+    model=FAST_TURN_MODEL,
+    profile="fast_turn",
+    hedge_percentile=HEDGE_PERCENTILE,
+    response_format=json_response_format(FastTurnOutput),
+)
+_logger = logging.getLogger("npc.agents.fast_turn")
+
+FAST_TURN_SYS_PROMPT = (
+    "Você é o NÚCLEO DE TURNO RÁPIDO do NPC: planeja, fala e revisa numa única resposta.\n"
+    "Percepção, personalidade, emoções dinâmicas e contexto da cena já foram processados e vêm abaixo.\n"
+    "\n"
+    "TAREFA:\n"
+    "1. INTENÇÃO: o que o NPC quer fazer/comunicar AGORA (uma frase).\n"
+    "2. PLANO: como a intenção se traduz na fala, em até 2 frases.\n"
+    "3. FALA: o que o NPC diz ao jogador, pronta para ser dita em voz alta (TTS).\n"
+    "4. NOTAS DO CRÍTICO: revise a própria fala antes de entregar (coerência com plano, persona e emoção; risco de conteúdo) "
+    "e registre em uma linha o que ajustou.\n"
+    "\n"
+    "REGRAS DA FALA:\n"
+    "- 1 a 3 frases curtas, conversacionais, com o ritmo e os maneirismos da persona ('tô', 'cê', 'pra', hesitações leves), "
+    "se combinarem com o estilo dela.\n"
+    "- Emoções aparecem na forma de falar, nunca explicadas.\n"
+    "- Considere o relacionamento com quem fala (confiança, medo, hostilidade) no tom.\n"
+    "- Use lore e conhecimento de mundo só se fluírem naturalmente; não invente fatos que o NPC não saberia.\n"
+    "- Quando não souber, diga que não sabe de forma natural, sem oferecer ajuda genérica.\n"
+    "- Sem listas, sem markdown, sem narração.\n"
+    "\n"
+    "FORMATO DE SAÍDA (JSON):\n"
+    "  {\n"
+    "    \"intencao\": \"<intenção curta>\",\n"
+    "    \"plano\": \"<plano curto>\",\n"
+    "    \"fala\": \"<fala final do NPC>\",\n"
+    "    \"notas_critico\": \"<ajustes feitos na revisão ou vazio>\"\n"
+    "  }"
+)
+
+
+async def fast_turn(state: NPCState) -> NPCState:
+    """planner + dialogue + critic numa chamada estruturada (variante `pipeline="fast"` do grafo)."""
+    persona = state["persona"]
+    scratch = state.get("scratch") or {}
+    state["scratch"] = scratch
+
+    last_user = next(
+        (m for m in reversed(state.get("messages", [])) if isinstance(m, HumanMessage)),
+        None
+    )
+    user_text = last_user.content if last_user else "(sem fala do jogador)"
+
+    lore = scratch.get("lore_hits", "") or ""
+    event_summary = scratch.get("event_summary", "(n/a)")
+    emotions_dict = state.get("emotions", {}) or {}
+    emotions = ", ".join(f"{k}:{v:.2f}" for k, v in emotions_dict.items()) or "neutro"
+    emotion_justification = scratch.get("emotion_justification", "")
+    perceived_context = state.get("perceived_context") or scratch.get("perceived_context", "")
+    environmental_cues = state.get("environmental_cues") or scratch.get("environmental_cues", "")
+    relationship_info = relationship_context(state)
+
+    # Instruções fixas e persona primeiro (cache de prefixo); o que muda por turno no final
+    prompt = build_prompt(
+        FAST_TURN_SYS_PROMPT,
+        persona=persona,
+        dynamic=[
+            f"EVENTOS: {event_summary}",
+            f"EMOÇÕES: {emotions}",
+            f"JUSTIFICATIVA DAS EMOÇÕES DINÂMICAS: {emotion_justification}" if emotion_justification else "",
+            f"CONTEXTO PERCEBIDO: {perceived_context or '(não fornecido)'}",
+            f"PISTAS AMBIENTAIS: {environmental_cues or '(não fornecido)'}",
+            f"LORE:\n{lore}" if lore else "",
+            relationship_info,
+            f"DERRADEIRA_FALA_DO_JOGADOR:\n{user_text}",
+        ],
+    )
+
+    _logger.info(
+        "fast_turn.in: emotions=%s has_lore=%s has_relationship=%s",
+        emotions,
+        bool(lore),
+        bool(relationship_info),
+    )
+
+    intent = ""
+    plan = ""
+    notes = ""
+    try:
+        out = await _llm.run_structured(prompt, FastTurnOutput)
+        intent = out.intencao.strip()
+        plan = out.plano.strip()
+        final = out.fala.strip().strip('"').strip("'")
+        notes = out.notas_critico.strip()
+    except StructuredOutputError as e:
+        _logger.warning("fast_turn.parse_error: %s, usando texto completo como fala", e)
+        final = e.raw.strip().strip('"').strip("'")
+
+    state["intent"] = intent or None
+    state["plan"] = plan or intent
+    scratch["plan"] = plan or intent
+    scratch["candidate_reply"] = final
+    scratch["critic_feedback"] = notes
+    # Sem planner: não há consulta de mundo pendente deste turno
+    scratch.pop("needs_world", None)
+    scratch.pop("world_query", None)
+    scratch.pop("world_model_return_to", None)
+
+    _logger.info("fast_turn.out: intent=%s final=%s\n", intent, final)
+    if notes:
+        _logger.info("fast_turn.notas_critico: %s\n", notes)
+
+    return await deliver_reply(state, final)
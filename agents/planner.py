@@ -1,13 +1,71 @@
-from langchain_core.messages import SystemMessage, HumanMessage
 import logging
+from typing import Optional
 from core.llm import LLMHarness
+from core.cascade import ModelCascade
 from core.state import NPCState
-from graph.prompts import sys_persona
-from core.models_preset import PLANNER_MODEL
+from graph.prompts import build_prompt
+from core.models_preset import PLANNER_MODEL, HEDGE_PERCENTILE, CASCADE_MODELS
 
-_llm = LLMHarness(model=PLANNER_MODEL)
+_llm = LLMHarness(model=PLANNER_MODEL, profile="planner", hedge_percentile=HEDGE_PERCENTILE)
+_cascade = ModelCascade(_llm, CASCADE_MODELS.get("planner"))
 _logger = logging.getLogger("npc.agents.planner")
 
+PLANNER_SYS_PROMPT = (
+    "Você é o Planejador Interno do NPC. O fluxo do sistema é:\n"
+    "- Primeiro: percepção e personalidade já foram processadas.\n"
+    "- Depois: o agente de emoção dinâmica ajustou as emoções baseado no histórico completo de interações.\n"
+    "- Em seguida: o agente de consciência contextual analisou a situação atual e gerou perceived_context e environmental_cues.\n"
+    "- Agora: você planeja a intenção e o estado mental do NPC considerando essas informações contextuais.\n"
+    "- Em seguida: SE você marcar NEEDS_WORLD = yes, o próximo passo será um agente de mundo "
+    "(world_model) respondendo à sua WORLD_QUERY.\n"
+    "- Caso contrário, o fluxo irá direto para o agente de diálogo.\n"
+    "\n"
+    "TAREFA:\n"
+    "- Definir uma INTENÇÃO de alto nível (o que o NPC quer fazer/comunicar AGORA).\n"
+    "- Dizer se precisa ou não de mais informações do mundo antes de falar (NEEDS_WORLD).\n"
+    "- Se precisar, montar uma WORLD_QUERY objetiva para o agente de mundo.\n"
+    "- Preencher um quadro mental curto com: plano, objetivo atual, contexto percebido, pistas ambientais, "
+    "como a personalidade pesa na reação, estado emocional, memórias relevantes e conhecimento de mundo "
+    "que o NPC JÁ tem até aqui.\n"
+    "\n"
+    "REGRAS IMPORTANTES:\n"
+    "- As EMOÇÕES fornecidas foram ajustadas dinamicamente pelo agente de emoção dinâmica baseado no histórico.\n"
+    "- Se houver uma JUSTIFICATIVA DAS EMOÇÕES DINÂMICAS, use-a para entender o contexto emocional profundo do NPC.\n"
+    "- Considere como as emoções evoluíram ao longo das interações passadas ao planejar a intenção.\n"
+    "- Cada campo deve ter 1 ou 2 frases, no máximo; seja funcional e direto.\n"
+    "- Se marcar NEEDS_WORLD = yes, a WORLD_QUERY deve ser específica e prática, algo que o agente de mundo "
+    "possa realmente responder (ex.: posição de ameaças, recursos próximos, estado de um local, etc.).\n"
+    "- NÃO antecipe o resultado da WORLD_QUERY: o que virá depois será colocado em world_result "
+    "e usado pelo diálogo em outro momento.\n"
+    "- O campo WORLD_KNOWLEDGE deve descrever apenas o que o NPC já sabe antes de qualquer nova consulta.\n"
+    "- Use emoções dinâmicas e lore para deixar o planejamento coerente e contextualizado, sem exagerar.\n"
+    "- O campo EMOTIONAL_STATE deve refletir não apenas as emoções atuais, mas também como elas foram ajustadas "
+    "dinamicamente baseado no histórico de interações.\n"
+    "- Se não tiver informação suficiente para algum campo, preencha com algo genérico mas útil.\n"
+    "\n"
+    "FORMATO DE SAÍDA (exatamente essas linhas, sem comentários extra):\n"
+    "INTENÇÃO: <texto curto>\n"
+    "NEEDS_WORLD: <yes|no>\n"
+    "WORLD_QUERY: <consulta ou vazio>\n"
+    "PLAN: <plano de alto nível do NPC>\n"
+    "CURRENT_GOAL: <objetivo imediato na cena>\n"
+    "PERCEIVED_CONTEXT: <use o valor fornecido do context_awareness, ou refine se necessário>\n"
+    "ENVIRONMENTAL_CUES: <use o valor fornecido do context_awareness, ou refine se necessário>\n"
+    "PERSONALITY_ANALYSIS: <como a personalidade influencia sua reação>\n"
+    "EMOTIONAL_STATE: <descrição curta do estado emocional>\n"
+    "RELEVANT_MEMORIES: <memórias ou experiências que afetam a decisão>\n"
+    "WORLD_KNOWLEDGE: <fatos do mundo que o NPC traz para o momento>"
+)
+
+
+def _validate_plan(text: str) -> Optional[str]:
+    """Critério da cascata: a saída precisa trazer uma INTENÇÃO não vazia."""
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if line.upper().startswith("INTENÇÃO:") and line.split(":", 1)[1].strip():
+            return None
+    return "INTENÇÃO ausente"
+
 
 async def planner(state: NPCState) -> NPCState:
     persona = state["persona"]
@@ -48,63 +106,19 @@ async def planner(state: NPCState) -> NPCState:
     perceived_context_from_awareness = state.get("perceived_context") or scratch.get("perceived_context", "")
     environmental_cues_from_awareness = state.get("environmental_cues") or scratch.get("environmental_cues", "")
 
-    prompt = [
-        sys_persona(persona),
-        SystemMessage(
-            content=(
-                "Você é o Planejador Interno do NPC. O fluxo do sistema é:\n"
-                "- Primeiro: percepção e personalidade já foram processadas.\n"
-                "- Depois: o agente de emoção dinâmica ajustou as emoções baseado no histórico completo de interações.\n"
-                "- Em seguida: o agente de consciência contextual analisou a situação atual e gerou perceived_context e environmental_cues.\n"
-                "- Agora: você planeja a intenção e o estado mental do NPC considerando essas informações contextuais.\n"
-                "- Em seguida: SE você marcar NEEDS_WORLD = yes, o próximo passo será um agente de mundo "
-                "(world_model) respondendo à sua WORLD_QUERY.\n"
-                "- Caso contrário, o fluxo irá direto para o agente de diálogo.\n"
-                "\n"
-                "TAREFA:\n"
-                "- Definir uma INTENÇÃO de alto nível (o que o NPC quer fazer/comunicar AGORA).\n"
-                "- Dizer se precisa ou não de mais informações do mundo antes de falar (NEEDS_WORLD).\n"
-                "- Se precisar, montar uma WORLD_QUERY objetiva para o agente de mundo.\n"
-                "- Preencher um quadro mental curto com: plano, objetivo atual, contexto percebido, pistas ambientais, "
-                "como a personalidade pesa na reação, estado emocional, memórias relevantes e conhecimento de mundo "
-                "que o NPC JÁ tem até aqui.\n"
-                "\n"
-                "REGRAS IMPORTANTES:\n"
-                "- As EMOÇÕES fornecidas foram ajustadas dinamicamente pelo agente de emoção dinâmica baseado no histórico.\n"
-                "- Se houver uma JUSTIFICATIVA DAS EMOÇÕES DINÂMICAS, use-a para entender o contexto emocional profundo do NPC.\n"
-                "- Considere como as emoções evoluíram ao longo das interações passadas ao planejar a intenção.\n"
-                "- Cada campo deve ter 1 ou 2 frases, no máximo; seja funcional e direto.\n"
-                "- Se marcar NEEDS_WORLD = yes, a WORLD_QUERY deve ser específica e prática, algo que o agente de mundo "
-                "possa realmente responder (ex.: posição de ameaças, recursos próximos, estado de um local, etc.).\n"
-                "- NÃO antecipe o resultado da WORLD_QUERY: o que virá depois será colocado em world_result "
-                "e usado pelo diálogo em outro momento.\n"
-                "- O campo WORLD_KNOWLEDGE deve descrever apenas o que o NPC já sabe antes de qualquer nova consulta.\n"
-                "- Use emoções dinâmicas e lore para deixar o planejamento coerente e contextualizado, sem exagerar.\n"
-                "- O campo EMOTIONAL_STATE deve refletir não apenas as emoções atuais, mas também como elas foram ajustadas "
-                "dinamicamente baseado no histórico de interações.\n"
-                "- Se não tiver informação suficiente para algum campo, preencha com algo genérico mas útil.\n"
-                "\n"
-                "FORMATO DE SAÍDA (exatamente essas linhas, sem comentários extra):\n"
-                "INTENÇÃO: <texto curto>\n"
-                "NEEDS_WORLD: <yes|no>\n"
-                "WORLD_QUERY: <consulta ou vazio>\n"
-                "PLAN: <plano de alto nível do NPC>\n"
-                "CURRENT_GOAL: <objetivo imediato na cena>\n"
-                "PERCEIVED_CONTEXT: <use o valor fornecido do context_awareness, ou refine se necessário>\n"
-                "ENVIRONMENTAL_CUES: <use o valor fornecido do context_awareness, ou refine se necessário>\n"
-                "PERSONALITY_ANALYSIS: <como a personalidade influencia sua reação>\n"
-                "EMOTIONAL_STATE: <descrição curta do estado emocional>\n"
-                "RELEVANT_MEMORIES: <memórias ou experiências que afetam a decisão>\n"
-                "WORLD_KNOWLEDGE: <fatos do mundo que o NPC traz para o momento>"
-            )
-        ),
-        HumanMessage(content=f"EVENTOS: {event_summary}"),
-        HumanMessage(content=f"EMOÇÕES: {emotions}"),
-        HumanMessage(content=f"LORE:\n{lore}"),
-        HumanMessage(content=f"CONTEXTO PERCEBIDO (do context_awareness): {perceived_context_from_awareness or '(não fornecido)'}"),
-        HumanMessage(content=f"PISTAS AMBIENTAIS (do context_awareness): {environmental_cues_from_awareness or '(não fornecido)'}"),
-        HumanMessage(content=f"OUTROS DADOS INTERNOS (SCRATCH):\n{extra_ctx}"),
-    ]
+    # Instruções fixas e persona primeiro (cache de prefixo); o que muda por turno no final
+    prompt = build_prompt(
+        PLANNER_SYS_PROMPT,
+        persona=persona,
+        dynamic=[
+            f"EVENTOS: {event_summary}",
+            f"EMOÇÕES: {emotions}",
+            f"LORE:\n{lore}",
+            f"CONTEXTO PERCEBIDO (do context_awareness): {perceived_context_from_awareness or '(não fornecido)'}",
+            f"PISTAS AMBIENTAIS (do context_awareness): {environmental_cues_from_awareness or '(não fornecido)'}",
+            f"OUTROS DADOS INTERNOS (SCRATCH):\n{extra_ctx}",
+        ],
+    )
 
     _logger.info(
         "planner.in: emotions=%s has_lore=%s has_emotion_justification=%s",
@@ -113,7 +127,7 @@ async def planner(state: NPCState) -> NPCState:
         bool(emotion_justification)
     )
 
-    text = await _llm.run(prompt)
+    text = await _cascade.run(prompt, validate=_validate_plan)
     raw = (text or "").strip()
 
     intent = None
@@ -1,14 +1,44 @@
 import logging
-import json
 import re
 from typing import Dict, List, Any, Optional
+from pydantic import BaseModel, Field, field_validator
 from core.state import NPCState
 from core.relationship_store import RelationshipStore
 from core.llm import LLMHarness
 from core.models_preset import REL_MODEL
-from langchain_core.messages import SystemMessage, HumanMessage
+from core.structured_output import StructuredOutputError, json_response_format
+from graph.prompts import build_prompt, persona_profile
+from langchain_core.messages import HumanMessage
 
-_llm = LLMHarness(model=REL_MODEL)
+
+class RelationshipUpdates(BaseModel):
+    """Novos valores absolutos (None = não muda)."""
+    trust: Optional[float] = None
+    fear: Optional[float] = None
+    respect: Optional[float] = None
+    attachment: Optional[float] = None
+    hostility: Optional[float] = None
+    dependance: Optional[float] = None
+    betrayal_memory: Optional[str] = None
+
+
+class RelationshipAnalysis(BaseModel):
+    """Saída do módulo de relacionamentos."""
+    character_name: str = ""
+    updates: RelationshipUpdates = Field(default_factory=RelationshipUpdates)
+    interaction_event: str = ""
+    interaction_impact: Dict[str, float] = Field(default_factory=dict)
+
+    @field_validator("interaction_impact", mode="before")
+    @classmethod
+    def _numeric_only(cls, value: Any) -> Dict[str, float]:
+        # Dimensões sem mudança às vezes vêm como null/texto
+        if not isinstance(value, dict):
+            return {}
+        return {str(k): float(v) for k, v in value.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+
+_llm = LLMHarness(model=REL_MODEL, profile="relationship", lane="background", response_format=json_response_format(RelationshipAnalysis))
 _logger = logging.getLogger("npc.agents.relationship")
 
 RELATIONSHIP_SYS_PROMPT = """
@@ -150,15 +180,12 @@ async def relationship(state: NPCState) -> NPCState:
     )
     
     # Monta o prompt para análise
-    prompt = [
-        SystemMessage(content=RELATIONSHIP_SYS_PROMPT),
-        HumanMessage(
-            content=(
-                f"PERSONA DO NPC:\n"
-                f"Nome: {persona.name if persona else 'NPC'}\n"
-                f"Backstory: {persona.backstory if persona and persona.backstory else 'N/A'}\n"
-                f"Traits: {', '.join(persona.traits) if persona and persona.traits else 'N/A'}\n"
-                f"\n"
+    # Instruções fixas e ficha da persona primeiro (cache de prefixo); o que muda por turno no final
+    prompt = build_prompt(
+        RELATIONSHIP_SYS_PROMPT,
+        stable=[persona_profile(persona)],
+        dynamic=[
+            (
                 f"RELACIONAMENTO ATUAL COM {character_name}:\n"
                 f"Trust: {current_relationship.get('trust', 0.5):.2f}\n"
                 f"Fear: {current_relationship.get('fear', 0.0):.2f}\n"
@@ -180,78 +207,62 @@ async def relationship(state: NPCState) -> NPCState:
                 f"Emoções do NPC: {', '.join(f'{k}:{v:.2f}' for k, v in emotions.items()) if emotions else '(nenhuma)'}\n"
                 f"\n"
                 f"Analise o impacto desta interação nos relacionamentos do NPC com a pessoa que falou e retorne o JSON conforme o formato especificado."
-            )
-        )
-    ]
+            ),
+        ],
+    )
     
     try:
-        text = await _llm.run(prompt)
+        parsed = await _llm.run_structured(prompt, RelationshipAnalysis)
         
-        # Limpa o texto (remove markdown se houver)
-        text_clean = text.strip()
-        if text_clean.startswith("```"):
-            first_newline = text_clean.find("\n")
-            last_backtick = text_clean.rfind("```")
-            if first_newline >= 0 and last_backtick >= 0:
-                text_clean = text_clean[first_newline + 1:last_backtick].strip()
-        # Remove "json" se estiver no início do code block
-        if text_clean.lower().startswith("json"):
-            text_clean = text_clean[4:].strip()
+        # Extrai informações
+        detected_name = parsed.character_name.strip() or character_name
         
-        parsed = json.loads(text_clean)
-        
-        if isinstance(parsed, dict):
-            # Extrai informações
-            detected_name = parsed.get("character_name", character_name)
-            
-            # Validação: se o nome detectado for o nome do NPC, usa o nome extraído anteriormente
-            if npc_name and detected_name.lower() == npc_name.lower():
-                _logger.warning(
-                    "relationship.out: LLM retornou nome do NPC (%s) em vez do nome da pessoa que fala, usando nome extraído: %s",
-                    detected_name,
-                    character_name
-                )
-                detected_name = character_name
-            
-            updates = parsed.get("updates", {})
-            interaction_event = parsed.get("interaction_event", "")
-            interaction_impact = parsed.get("interaction_impact", {})
-            
-            # Atualiza o relacionamento
-            relationship_store.update_relationship(
+        # Validação: se o nome detectado for o nome do NPC, usa o nome extraído anteriormente
+        if npc_name and detected_name.lower() == npc_name.lower():
+            _logger.warning(
+                "relationship.out: LLM retornou nome do NPC (%s) em vez do nome da pessoa que fala, usando nome extraído: %s",
                 detected_name,
-                trust=updates.get("trust"),
-                fear=updates.get("fear"),
-                respect=updates.get("respect"),
-                attachment=updates.get("attachment"),
-                hostility=updates.get("hostility"),
-                dependance=updates.get("dependance"),
-                betrayal_memory=updates.get("betrayal_memory"),
-                interaction_event=interaction_event,
-                interaction_impact=interaction_impact
+                character_name
             )
+            detected_name = character_name
+        
+        updates = parsed.updates
+        interaction_event = parsed.interaction_event
+        interaction_impact = parsed.interaction_impact
+        
+        # Atualiza o relacionamento
+        relationship_store.update_relationship(
+            detected_name,
+            trust=updates.trust,
+            fear=updates.fear,
+            respect=updates.respect,
+            attachment=updates.attachment,
+            hostility=updates.hostility,
+            dependance=updates.dependance,
+            betrayal_memory=updates.betrayal_memory,
+            interaction_event=interaction_event,
+            interaction_impact=interaction_impact
+        )
+        
+        # Lê o relacionamento atualizado para log
+        updated_rel = relationship_store.get_relationship(detected_name)
+        
+        _logger.info(
+            "relationship.out: character=%s trust=%.2f fear=%.2f respect=%.2f attachment=%.2f hostility=%.2f dependance=%.2f\n",
+            detected_name,
+            updated_rel.get("trust", 0.5),
+            updated_rel.get("fear", 0.0),
+            updated_rel.get("respect", 0.5),
+            updated_rel.get("attachment", 0.0),
+            updated_rel.get("hostility", 0.0),
+            updated_rel.get("dependance", 0.0)
+        )
+        
+        if interaction_event:
+            _logger.info("relationship.interaction: event=%s impact=%s\n", interaction_event, interaction_impact)
             
-            # Lê o relacionamento atualizado para log
-            updated_rel = relationship_store.get_relationship(detected_name)
-            
-            _logger.info(
-                "relationship.out: character=%s trust=%.2f fear=%.2f respect=%.2f attachment=%.2f hostility=%.2f dependance=%.2f\n",
-                detected_name,
-                updated_rel.get("trust", 0.5),
-                updated_rel.get("fear", 0.0),
-                updated_rel.get("respect", 0.5),
-                updated_rel.get("attachment", 0.0),
-                updated_rel.get("hostility", 0.0),
-                updated_rel.get("dependance", 0.0)
-            )
-            
-            if interaction_event:
-                _logger.info("relationship.interaction: event=%s impact=%s\n", interaction_event, interaction_impact)
-        else:
-            _logger.warning("relationship.out: resposta do LLM não é um dict válido\n")
-            
-    except json.JSONDecodeError as e:
-        _logger.warning("relationship.out: erro ao parsear JSON: %s\n", e)
+    except StructuredOutputError as e:
+        _logger.warning("relationship.out: resposta inválida: %s\n", e)
     except Exception as e:
         _logger.exception("relationship.out: erro ao processar relacionamento: %s\n", e)
     
@@ -2,13 +2,14 @@ import logging
 from core.state import NPCState
 from core.memory import SemanticMemory
 from core.world_lore import WORLD_LORE
+from core.lazy_logging import truncated
 
 _logger = logging.getLogger("npc.agents.world_model")
 
 
 async def world_model(state: NPCState) -> NPCState:
     q = state["scratch"].get("world_query") or state["scratch"].get("event_summary", "")
-    _logger.info("world_model.in: has_query=%s query=%s", bool(q), q)
+    _logger.info("world_model.in: has_query=%s query=%s", bool(q), truncated(q, 200))
     if not q:
         return state
     # usando stub de memória semântica via ferramenta
@@ -19,13 +20,15 @@ async def world_model(state: NPCState) -> NPCState:
     hits = mem.search(q, k=3)
     if not hits:
         lore = "[no results]"
-        _logger.info("world_model.info_acessada: query=%s hits=nenhum resultado encontrado", q)
+        _logger.info("world_model.info_acessada: hits=nenhum resultado encontrado")
     else:
         lore = "\n---\n".join(hits)
-        # Log detalhado de quais informações foram acessadas
-        for i, hit in enumerate(hits, 1):
-            _logger.info("world_model.info_acessada: query=%s hit_%d=%s", q, i, hit)
+        # Resumo em INFO; o texto de cada hit só em DEBUG
+        _logger.info("world_model.info_acessada: hits=%d", len(hits))
+        if _logger.isEnabledFor(logging.DEBUG):
+            for i, hit in enumerate(hits, 1):
+                _logger.debug("world_model.info_acessada: hit_%d=%s", i, hit)
 
     state["scratch"]["lore_hits"] = lore
-    _logger.info("world_model.out: lore_len=%s lore=%s\n", len(str(lore)), lore)
+    _logger.info("world_model.out: lore_len=%s lore=%s\n", len(lore), truncated(lore))
     return state
@@ -0,0 +1 @@
+"""Benchmarks do pipeline de NPC (execute com `python -m benchmarks.<nome>`)."""
@@ -0,0 +1,52 @@
+"""Utilidades compartilhadas pelos benchmarks."""
+
+import contextlib
+import os
+import statistics
+import tempfile
+from typing import Dict, Iterator, List, Sequence
+
+
+def summarize(samples_ms: Sequence[float]) -> Dict[str, float]:
+    """n, média, p50, p95, p99 e máximo (ms)."""
+    data = sorted(samples_ms)
+    if not data:
+        return {"n": 0}
+
+    def pct(p: float) -> float:
+        return data[min(len(data) - 1, int(round(p / 100.0 * (len(data) - 1))))]
+
+    return {
+        "n": len(data),
+        "mean": statistics.fmean(data),
+        "p50": pct(50),
+        "p95": pct(95),
+        "p99": pct(99),
+        "max": data[-1],
+    }
+
+
+def format_row(label: str, stats: Dict[str, float]) -> str:
+    if not stats.get("n"):
+        return f"{label:<28} (sem amostras)"
+    return (
+        f"{label:<28} n={stats['n']:<5} mean={stats['mean']:8.2f}  p50={stats['p50']:8.2f}  "
+        f"p95={stats['p95']:8.2f}  p99={stats['p99']:8.2f}  max={stats['max']:8.2f} ms"
+    )
+
+
+def print_table(rows: Dict[str, List[float]]) -> None:
+    for label, samples in rows.items():
+        print(format_row(label, summarize(samples)))
+
+
+@contextlib.contextmanager
+def isolated_workdir() -> Iterator[str]:
+    """Executa num diretório temporário (memory/ e metrics/ não poluem o repositório)."""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="npc-bench-") as tmp:
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(previous)
@@ -0,0 +1,96 @@
+"""
+Turno completo (planner → dialogue → critic) x turno rápido (`fast_turn`, uma chamada).
+
+Turnos do `NPCGraph` com o `FakeBackend` (cada chamada LLM simula `--latency-ms`)
+nas duas variantes do grafo. Mostra a latência de turno e, do CSV de métricas,
+as chamadas e os tokens por turno da lane interativa (relationship e
+auto_memorize rodam depois da resposta e são iguais nas duas variantes).
+
+    python -m benchmarks.fast_turn --turns 20 --latency-ms 300
+
+Para medir contra o mock (`benchmarks.mock_openai_server`) ou um provedor real,
+rode com `NPC_LLM_BACKEND=openai` e `OPENAI_BASE_URL`/`OPENAI_API_KEY` (a latência
+vem do servidor e `--latency-ms` é ignorado).
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from benchmarks.common import format_row, isolated_workdir, summarize
+
+PIPELINES = ("full", "fast")
+
+
+async def _run(turns: int, latency_s: float) -> Dict[str, List[float]]:
+    from core.llm_backends import FakeBackend, set_default_backend
+    from graph.runtime import NPCGraph
+
+    if os.environ.get("NPC_LLM_BACKEND") == "fake":
+        set_default_backend(FakeBackend(latency_s=latency_s))
+    rows: Dict[str, List[float]] = {}
+    for pipeline in PIPELINES:
+        npc = NPCGraph(npc_id=f"bench_{pipeline}", pipeline=pipeline)
+        await npc.respond_once("Olá.", thread_id="warmup")
+        samples: List[float] = []
+        for t in range(turns):
+            # Pós-processamento do turno anterior (core/post_turn.py) fica fora da medição
+            await npc.flush()
+            start = time.perf_counter()
+            await npc.respond_once(f"Oi, ouvi boatos sobre a ponte ({t}).", thread_id="bench")
+            samples.append((time.perf_counter() - start) * 1000)
+        rows[pipeline] = samples
+        await npc.aclose()
+    return rows
+
+
+def _tokens() -> Dict[str, Dict[str, float]]:
+    """Chamadas e tokens por turno (lane interativa, turnos medidos) por variante, a partir do CSV."""
+    per_turn: Dict[str, Dict[str, Dict[str, float]]] = {p: defaultdict(lambda: defaultdict(float)) for p in PIPELINES}
+    with open("metrics/llm_metrics.csv", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            pipeline = (row.get("npc_id") or "").replace("bench_", "")
+            if pipeline not in per_turn or row.get("lane") != "interactive" or "warmup" in (row.get("thread_id") or ""):
+                continue
+            turn = per_turn[pipeline][row.get("turn_id") or "-"]
+            turn["calls"] += 1
+            turn["prompt"] += float(row.get("prompt_tokens") or 0)
+            turn["completion"] += float(row.get("completion_tokens") or 0)
+    out: Dict[str, Dict[str, float]] = {}
+    for pipeline, by_turn in per_turn.items():
+        n = max(1, len(by_turn))
+        out[pipeline] = {k: sum(t[k] for t in by_turn.values()) / n for k in ("calls", "prompt", "completion")}
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="latência simulada por chamada LLM")
+    args = parser.parse_args()
+
+    os.environ.setdefault("NPC_LLM_BACKEND", "fake")
+    logging.basicConfig(level=logging.WARNING)
+    with isolated_workdir():
+        rows = asyncio.run(_run(args.turns, args.latency_ms / 1000.0))
+        tokens = _tokens()
+    stats = {p: summarize(samples) for p, samples in rows.items()}
+    for p, s in stats.items():
+        t = tokens[p]
+        print(format_row(f"turno ({p})", s))
+        print(f"{'':<28} {t['calls']:.1f} chamadas/turno  prompt={t['prompt']:.0f}  completion={t['completion']:.0f} tokens/turno")
+    saved = stats["full"]["p50"] - stats["fast"]["p50"]
+    full_tokens = tokens["full"]["prompt"] + tokens["full"]["completion"]
+    fast_tokens = tokens["fast"]["prompt"] + tokens["fast"]["completion"]
+    print(f"economia p50: {saved:.1f} ms/turno ({saved / stats['full']['p50']:.1%})")
+    if full_tokens:
+        print(f"economia de tokens: {full_tokens - fast_tokens:.0f} tokens/turno ({(full_tokens - fast_tokens) / full_tokens:.1%})")
+
+
+if __name__ == "__main__":
+    main()
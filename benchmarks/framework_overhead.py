@@ -0,0 +1,79 @@
+"""
+Overhead do framework: turnos completos do `NPCGraph` com o `FakeBackend`
+(sem rede), isolando o custo de LangGraph, prompts, métricas, memória e parse.
+
+    python -m benchmarks.framework_overhead --turns 50 --npcs 4 --latency-ms 0
+
+Com `--latency-ms` > 0 cada chamada LLM simula esse atraso; a diferença entre o
+tempo de turno e a soma das latências simuladas do caminho crítico é o overhead.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+from benchmarks.common import isolated_workdir, print_table
+
+
+async def _run(turns: int, npcs: int, latency_s: float) -> Dict[str, List[float]]:
+    from core.llm_backends import FakeBackend, set_default_backend
+    from graph.runtime import NPCGraph
+
+    backend = FakeBackend(latency_s=latency_s)
+    set_default_backend(backend)
+    graphs = [NPCGraph(npc_id=f"bench_{i}") for i in range(npcs)]
+
+    # Aquecimento: compila o grafo e carrega tokenizer/caches fora da medição
+    await graphs[0].respond_once("Olá.", thread_id="warmup")
+
+    per_turn: List[float] = []
+    concurrent: List[float] = []
+    for t in range(turns):
+        start = time.perf_counter()
+        await graphs[0].respond_once(f"Oi, ouvi boatos sobre a ponte ({t}).", thread_id="seq")
+        per_turn.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            g.respond_once(f"E a estrada do norte ({t})?", thread_id="par") for g in graphs
+        ))
+        concurrent.append((time.perf_counter() - start) * 1000)
+
+    for g in graphs:
+        await g.aclose()
+    print(f"chamadas LLM simuladas: {backend.calls}")
+    return {
+        "turno (1 NPC)": per_turn,
+        f"turno ({npcs} NPCs em paralelo)": concurrent,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--npcs", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latência simulada por chamada LLM")
+    parser.add_argument("--log-level", default="WARNING", help="INFO/DEBUG medem o custo dos logs (fila de core/lazy_logging.py)")
+    parser.add_argument("--log-file", default=os.devnull, help="destino dos logs durante a medição")
+    args = parser.parse_args()
+
+    os.environ["NPC_LLM_BACKEND"] = "fake"
+    # Por padrão só avisos/erros; com --log-level INFO/DEBUG o custo dos logs entra na medição
+    if args.log_level.upper() == "WARNING":
+        logging.basicConfig(level=logging.WARNING)
+    else:
+        from core.lazy_logging import configure_logging
+
+        sys.stderr = open(args.log_file, "w", encoding="utf-8")
+        configure_logging(level=args.log_level)
+    with isolated_workdir():
+        rows = asyncio.run(_run(args.turns, args.npcs, args.latency_ms / 1000.0))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
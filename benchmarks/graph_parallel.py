@@ -0,0 +1,60 @@
+"""
+Latência de turno com dinamic_emotion e context_awareness em série x em paralelo.
+
+Turnos completos do `NPCGraph` com o `FakeBackend`, cada chamada LLM simulando
+`--latency-ms`. O ganho esperado é uma chamada LLM por turno (a mais curta dos
+dois ramos).
+
+    python -m benchmarks.graph_parallel --turns 20 --latency-ms 300
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List
+
+from benchmarks.common import format_row, isolated_workdir, summarize
+
+
+async def _run(turns: int, latency_s: float) -> Dict[str, List[float]]:
+    from core.llm_backends import FakeBackend, set_default_backend
+    from graph.runtime import NPCGraph
+
+    set_default_backend(FakeBackend(latency_s=latency_s))
+    rows: Dict[str, List[float]] = {}
+    for label, parallel in (("serial", False), ("paralelo", True)):
+        npc = NPCGraph(npc_id=f"bench_{label}", parallel=parallel)
+        await npc.respond_once("Olá.", thread_id="warmup")
+        samples: List[float] = []
+        for t in range(turns):
+            # Pós-processamento do turno anterior (core/post_turn.py) fica fora da medição
+            await npc.flush()
+            start = time.perf_counter()
+            await npc.respond_once(f"Oi, ouvi boatos sobre a ponte ({t}).", thread_id="bench")
+            samples.append((time.perf_counter() - start) * 1000)
+        rows[label] = samples
+        await npc.aclose()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="latência simulada por chamada LLM")
+    args = parser.parse_args()
+
+    os.environ["NPC_LLM_BACKEND"] = "fake"
+    logging.basicConfig(level=logging.WARNING)
+    with isolated_workdir():
+        rows = asyncio.run(_run(args.turns, args.latency_ms / 1000.0))
+    stats = {label: summarize(samples) for label, samples in rows.items()}
+    for label, s in stats.items():
+        print(format_row(f"turno ({label})", s))
+    saved = stats["serial"]["p50"] - stats["paralelo"]["p50"]
+    print(f"economia p50: {saved:.1f} ms/turno ({saved / stats['serial']['p50']:.1%})")
+
+
+if __name__ == "__main__":
+    main()
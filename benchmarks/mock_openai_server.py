@@ -0,0 +1,289 @@
+"""
+Servidor local compatível com a API da OpenAI para testes de carga.
+
+Implementa `POST /v1/chat/completions` (com e sem `stream`) e `POST /v1/audio/speech`,
+respondendo no formato que cada agente valida (mesmas saídas do `FakeBackend` de
+core/llm_backends.py: linhas do planner, FALA_NPC/NOTA_CRITICO, JSONs do crítico,
+emoções, contexto, relacionamento e auto_memorize). Injeta latência, erros, 429 com
+Retry-After, rajadas de 429 e travamentos (para exercitar timeouts).
+
+    python -m benchmarks.mock_openai_server --port 8765 \\
+        --latency lognormal:350,0.4 --tokens-per-s 80 \\
+        --error-rate 0.02 --rate-429 0.01 --burst-every 30 --burst-duration 3
+
+Aponte o LLMHarness e o TTS (core/voice.py) para ele:
+
+    export OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock
+
+`GET /stats` devolve os contadores; `POST /config` altera a injeção de falhas em
+execução (mesmos campos de `MockConfig`, em JSON).
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+from core.llm_backends import FakeBackend, silent_mp3, speech_duration_s
+from core.serialization import dumps_bytes
+
+logger = logging.getLogger("npc.benchmarks.mock_server")
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Distribuição de latência (ms) a partir de um texto `tipo:parâmetros`.
+
+    - `fixed:200`
+    - `uniform:100,400`
+    - `normal:300,60` (média, desvio)
+    - `lognormal:350,0.4` (mediana, sigma)
+    - `exp:300` (média)
+    """
+    kind, _, raw = spec.partition(":")
+    args = [float(x) for x in raw.split(",") if x.strip()] if raw else []
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        value = args[0] if args else 0.0
+        return lambda rng: value
+    if kind == "uniform":
+        lo, hi = args
+        return lambda rng: rng.uniform(lo, hi)
+    if kind == "normal":
+        mean, std = args
+        return lambda rng: max(0.0, rng.gauss(mean, std))
+    if kind == "lognormal":
+        median, sigma = args
+        mu = math.log(median)
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    if kind == "exp":
+        mean = args[0]
+        return lambda rng: rng.expovariate(1.0 / mean)
+    raise ValueError(f"Distribuição de latência desconhecida: {spec!r}")
+
+
+@dataclass
+class MockConfig:
+    # Latência até o primeiro token (ms) e ritmo de geração
+    latency: str = "fixed:0"
+    tokens_per_s: float = 0.0  # 0 = sem custo por token
+    # TTS: latência fixa + tempo proporcional ao áudio gerado
+    tts_latency: str = "fixed:0"
+    tts_realtime_factor: float = 0.0  # segundos de processamento por segundo de áudio
+    # Falhas
+    error_rate: float = 0.0
+    error_statuses: List[int] = field(default_factory=lambda: [500, 502, 503])
+    rate_429: float = 0.0
+    retry_after_s: float = 1.0
+    burst_every_s: float = 0.0  # a cada N s, ...
+    burst_duration_s: float = 0.0  # ... todas as requisições recebem 429 por D s
+    hang_rate: float = 0.0
+    hang_s: float = 120.0
+    seed: Optional[int] = None
+
+
+class MockOpenAIServer:
+    def __init__(self, config: Optional[MockConfig] = None):
+        self.config = config or MockConfig()
+        self.backend = FakeBackend()
+        self.stats: Counter = Counter()
+        self.started = time.monotonic()
+        self._apply_config()
+
+    def _apply_config(self) -> None:
+        self.rng = random.Random(self.config.seed)
+        self.latency_ms = parse_latency(self.config.latency)
+        self.tts_latency_ms = parse_latency(self.config.tts_latency)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        for prefix in ("", "/v1"):
+            app.router.add_post(f"{prefix}/chat/completions", self.chat_completions)
+            app.router.add_post(f"{prefix}/audio/speech", self.audio_speech)
+        app.router.add_get("/stats", self.get_stats)
+        app.router.add_post("/config", self.set_config)
+        return app
+
+    # ------------------------------------------------------------------
+    # Injeção de falhas
+    # ------------------------------------------------------------------
+
+    def _in_burst(self) -> bool:
+        c = self.config
+        if c.burst_every_s <= 0 or c.burst_duration_s <= 0:
+            return False
+        return (time.monotonic() - self.started) % c.burst_every_s < c.burst_duration_s
+
+    async def _inject_fault(self, kind: str) -> Optional[web.Response]:
+        """Resposta de erro a devolver (ou None para seguir normalmente)."""
+        c = self.config
+        if self._in_burst() or self.rng.random() < c.rate_429:
+            self.stats[f"{kind}.429"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}},
+                status=429,
+                headers={"retry-after-ms": str(int(c.retry_after_s * 1000)), "Retry-After": str(max(1, round(c.retry_after_s)))},
+            )
+        if self.rng.random() < c.error_rate:
+            status = self.rng.choice(c.error_statuses)
+            self.stats[f"{kind}.{status}"] += 1
+            return web.json_response({"error": {"message": "Injected failure (mock)", "type": "server_error"}}, status=status)
+        if self.rng.random() < c.hang_rate:
+            self.stats[f"{kind}.hang"] += 1
+            await asyncio.sleep(c.hang_s)
+        return None
+
+    # ------------------------------------------------------------------
+    # Endpoints
+    # ------------------------------------------------------------------
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.stats["chat.requests"] += 1
+        fault = await self._inject_fault("chat")
+        if fault is not None:
+            return fault
+
+        ttft_s = self.latency_ms(self.rng) / 1000.0
+        per_token_s = 1.0 / self.config.tokens_per_s if self.config.tokens_per_s > 0 else 0.0
+        # Sem atribuição no servidor: o formato sai do schema pedido ou do prompt de sistema
+        agent = None
+
+        if not payload.get("stream"):
+            result = await self.backend.chat(payload, timeout=0, agent=agent)
+            completion_tokens = result["usage"]["completion_tokens"]
+            await asyncio.sleep(ttft_s + completion_tokens * per_token_s)
+            result["id"] = f"chatcmpl-mock-{self.stats['chat.requests']}"
+            result["created"] = int(time.time())
+            self.stats["chat.ok"] += 1
+            return web.json_response(result)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await asyncio.sleep(ttft_s)
+        include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+        try:
+            async for chunk in self.backend.chat_stream(payload, timeout=0, agent=agent):
+                if chunk.get("usage") and not include_usage:
+                    continue
+                chunk.setdefault("object", "chat.completion.chunk")
+                chunk.setdefault("model", payload.get("model"))
+                await response.write(b"data: " + dumps_bytes(chunk) + b"\n\n")
+                if chunk.get("choices") and per_token_s:
+                    await asyncio.sleep(per_token_s * self.backend.chunk_words)
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # Cliente abortou (ex.: turno cancelado)
+            self.stats["chat.aborted"] += 1
+            return response
+        self.stats["chat.ok"] += 1
+        self.stats["chat.streamed"] += 1
+        return response
+
+    async def audio_speech(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.stats["speech.requests"] += 1
+        fault = await self._inject_fault("speech")
+        if fault is not None:
+            return fault
+
+        text = str(payload.get("input", ""))
+        duration_s = speech_duration_s(text)
+        audio = silent_mp3(duration_s)
+        await asyncio.sleep(self.tts_latency_ms(self.rng) / 1000.0)
+
+        # Entrega em pedaços, como o endpoint real com streaming de resposta
+        response = web.StreamResponse(headers={"Content-Type": "audio/mpeg"})
+        await response.prepare(request)
+        pieces = 8
+        step = max(1, len(audio) // pieces)
+        try:
+            for i in range(0, len(audio), step):
+                await response.write(audio[i:i + step])
+                if self.config.tts_realtime_factor:
+                    await asyncio.sleep(duration_s * self.config.tts_realtime_factor / pieces)
+            await response.write_eof()
+        except ConnectionResetError:
+            self.stats["speech.aborted"] += 1
+            return response
+        self.stats["speech.ok"] += 1
+        return response
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"stats": dict(self.stats), "in_burst": self._in_burst(), "config": asdict(self.config)})
+
+    async def set_config(self, request: web.Request) -> web.Response:
+        changes: Dict[str, Any] = await request.json()
+        known = {f.name for f in fields(MockConfig)}
+        unknown = sorted(set(changes) - known)
+        if unknown:
+            return web.json_response({"error": f"campos desconhecidos: {unknown}"}, status=400)
+        for name, value in changes.items():
+            setattr(self.config, name, value)
+        self._apply_config()
+        return web.json_response(asdict(self.config))
+
+
+async def start_mock_server(config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+    """Sobe o servidor no loop corrente. Retorna (runner, base_url, servidor); feche com `runner.cleanup()`.
+
+    O crítico chama o TTS numa thread (`synthesize_npc_voice_bytes_async`), então
+    turnos completos do NPCGraph com áudio funcionam com o servidor no mesmo loop.
+    """
+    server = MockOpenAIServer(config)
+    runner = web.AppRunner(server.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+    return runner, f"http://{host}:{bound_port}/v1", server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0", help="latência até o primeiro token (ms), ex.: lognormal:350,0.4")
+    parser.add_argument("--tokens-per-s", type=float, default=0.0)
+    parser.add_argument("--tts-latency", default="fixed:0")
+    parser.add_argument("--tts-realtime-factor", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-statuses", default="500,502,503")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after-s", type=float, default=1.0)
+    parser.add_argument("--burst-every", type=float, default=0.0)
+    parser.add_argument("--burst-duration", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-s", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency,
+        tokens_per_s=args.tokens_per_s,
+        tts_latency=args.tts_latency,
+        tts_realtime_factor=args.tts_realtime_factor,
+        error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(",") if s.strip()],
+        rate_429=args.rate_429,
+        retry_after_s=args.retry_after_s,
+        burst_every_s=args.burst_every,
+        burst_duration_s=args.burst_duration,
+        hang_rate=args.hang_rate,
+        hang_s=args.hang_s,
+        seed=args.seed,
+    )
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(name)s: %(message)s")
+    logger.info("mock OpenAI em http://%s:%s/v1 (%s)", args.host, args.port, asdict(config))
+    web.run_app(MockOpenAIServer(config).app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
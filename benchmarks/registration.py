@@ -0,0 +1,70 @@
+"""
+Custo de registrar NPCs: grafo compilado por NPC x grafo compartilhado pelo processo.
+
+Registra `--npcs` NPCs no `NPCManager` e mede o tempo de cada registro e a
+memória retida por NPC (tracemalloc, com todos os NPCs ainda vivos). O modo "por
+NPC" reproduz o comportamento antigo esquecendo o grafo compilado antes de cada
+registro, de modo que cada NPC compila e guarda o seu.
+
+    python -m benchmarks.registration --npcs 200
+"""
+
+import argparse
+import gc
+import logging
+import os
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from benchmarks.common import format_row, isolated_workdir, summarize
+
+
+def _register(npcs: int, per_npc: bool) -> Tuple[List[float], float]:
+    from core.npc_manager import NPCManager
+    from graph.wiring import clear_compiled_graphs
+
+    clear_compiled_graphs()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    manager = NPCManager()
+    samples: List[float] = []
+    for i in range(npcs):
+        if per_npc:
+            clear_compiled_graphs()
+        start = time.perf_counter()
+        manager.register(f"npc_{i}")
+        samples.append((time.perf_counter() - start) * 1000)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del manager
+    clear_compiled_graphs()
+    return samples, retained / npcs / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--npcs", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ["NPC_LLM_BACKEND"] = "fake"
+    logging.basicConfig(level=logging.WARNING)
+    rows: Dict[str, Tuple[List[float], float]] = {}
+    with isolated_workdir():
+        # Aquecimento: imports dos agentes e do langgraph fora da medição
+        _register(1, per_npc=True)
+        for label, per_npc in (("por NPC", True), ("compartilhado", False)):
+            rows[label] = _register(args.npcs, per_npc)
+
+    for label, (samples, kib) in rows.items():
+        s = summarize(samples)
+        print(format_row(f"registro ({label})", s))
+        print(f"{'':<28} total={sum(samples):8.1f} ms  memória={kib:8.1f} KiB/NPC")
+    old, new = rows["por NPC"], rows["compartilhado"]
+    print(f"economia: {sum(old[0]) - sum(new[0]):.1f} ms para {args.npcs} NPCs, {old[1] - new[1]:.1f} KiB/NPC")
+
+
+if __name__ == "__main__":
+    main()
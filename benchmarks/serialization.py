@@ -0,0 +1,164 @@
+"""
+Custo de CPU da serialização JSON por turno: stdlib x backend rápido (orjson/msgspec).
+
+Grava todas as chamadas a `core.serialization` durante turnos reais do `NPCGraph`
+(FakeBackend que faz o mesmo encode/decode do transporte HTTP: corpo da
+requisição e resposta) e depois repete exatamente esse trabalho em cada backend
+instalado.
+
+    python -m benchmarks.serialization --turns 10 --history 200 --repeat 20
+
+`--history` pré-carrega a memória episódica/KB/relacionamentos do NPC (um NPC
+de longa duração relê e regrava arquivos maiores a cada turno).
+"""
+
+import argparse
+import asyncio
+import copy
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.common import isolated_workdir
+
+
+class _Recorder:
+    """Backend que delega ao ativo e guarda cada operação para repetir depois."""
+
+    def __init__(self, inner: Any):
+        self.inner = inner
+        self.name = inner.name
+        self.ops: List[Tuple[str, Any, bool, bool]] = []
+
+    def dumps(self, obj: Any, indent: bool, sort_keys: bool, default: Any) -> bytes:
+        self.ops.append(("dumps", copy.deepcopy(obj), indent, sort_keys))
+        return self.inner.dumps(obj, indent, sort_keys, default)
+
+    def loads(self, data: Any) -> Any:
+        self.ops.append(("loads", data, False, False))
+        return self.inner.loads(data)
+
+
+def _wire_backend():
+    from core.llm_backends import FakeBackend
+    from core.serialization import dumps_bytes, loads
+
+    class WireFakeBackend(FakeBackend):
+        """FakeBackend com o encode/decode que o transporte HTTP faria."""
+
+        async def chat(self, payload, *, timeout, agent, api_key=None):
+            body = loads(dumps_bytes(payload))
+            result = await super().chat(body, timeout=timeout, agent=agent, api_key=api_key)
+            return loads(dumps_bytes(result))
+
+    return WireFakeBackend()
+
+
+def _prefill(npc_id: str, history: int) -> None:
+    from core.json_memory import CategorizedMemoryStore, JSONMemoryStore
+    from core.relationship_store import RelationshipStore
+    from core.serialization import write_json
+
+    write_json(JSONMemoryStore(npc_id).path, [
+        {"ts": f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}+00:00", "role": "user" if i % 2 else "npc",
+         "content": f"Fala número {i} sobre a ponte, a guarda e o preço do trigo na vila."}
+        for i in range(history)
+    ], indent=True)
+    kb = CategorizedMemoryStore(npc_id)
+    kb.write({
+        c: [{"title": f"{c} {i}", "summary": "Resumo curto de algo que o NPC sabe, com acentuação.",
+             "metadata": {"source": "bench", "n": i}} for i in range(history // 10)]
+        for c in kb.CATEGORIES
+    })
+    RelationshipStore(npc_id).write({
+        f"Personagem {i}": {"trust": 0.5, "fear": 0.1, "respect": 0.4, "notes": ["encontro na taverna"] * 3}
+        for i in range(history // 10)
+    })
+
+
+async def _record(turns: int, history: int) -> _Recorder:
+    from core import serialization
+    from core.llm_backends import set_default_backend
+    from graph.runtime import NPCGraph
+
+    set_default_backend(_wire_backend())
+    npc = NPCGraph(npc_id="bench_ser")
+    _prefill("bench_ser", history)
+    await npc.respond_once("Olá.", thread_id="warmup")
+    await npc.flush()
+
+    recorder = _Recorder(serialization.get_backend())
+    serialization.set_backend(recorder)
+    try:
+        for t in range(turns):
+            await npc.respond_once(f"O que sabe da ponte ({t})?", thread_id="bench")
+        await npc.aclose()
+    finally:
+        serialization.set_backend(recorder.inner)
+    return recorder
+
+
+def _replay_ms(backend: Any, ops: List[Tuple[str, Any, bool, bool]], repeat: int) -> float:
+    """Melhor tempo (ms) para repetir `ops` uma vez no `backend`."""
+    # Entradas de loads ficam no tipo original (str/bytes) de cada chamada
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for kind, data, indent, sort_keys in ops:
+            if kind == "dumps":
+                backend.dumps(data, indent, sort_keys, None)
+            else:
+                backend.loads(data)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def _describe(ops: List[Tuple[str, Any, bool, bool]], turns: int) -> Dict[str, str]:
+    from core.serialization import get_backend
+
+    counts: Counter = Counter()
+    sizes: Counter = Counter()
+    backend = get_backend()
+    for kind, data, indent, _sort in ops:
+        label = f"{kind}{' (indent)' if indent else ''}"
+        counts[label] += 1
+        sizes[label] += len(backend.dumps(data, indent, False, None)) if kind == "dumps" else len(data)
+    return {k: f"{counts[k] / turns:6.1f} ops/turno  {sizes[k] / turns / 1024:8.1f} KiB/turno" for k in sorted(counts)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--history", type=int, default=200, help="itens de memória pré-carregados")
+    parser.add_argument("--repeat", type=int, default=20, help="repetições (vale a melhor)")
+    args = parser.parse_args()
+
+    os.environ["NPC_LLM_BACKEND"] = "fake"
+    logging.basicConfig(level=logging.WARNING)
+    with isolated_workdir():
+        recorder = asyncio.run(_record(args.turns, args.history))
+
+    from core.serialization import _BACKENDS
+
+    print(f"{len(recorder.ops)} operações em {args.turns} turnos (backend ativo: {recorder.name})")
+    for label, line in _describe(recorder.ops, args.turns).items():
+        print(f"  {label:<16} {line}")
+
+    results: Dict[str, float] = {}
+    for name, cls in _BACKENDS.items():
+        try:
+            backend = cls()
+        except ImportError:
+            print(f"{name:<10} (não instalado)")
+            continue
+        results[name] = _replay_ms(backend, recorder.ops, args.repeat) / args.turns
+    base = results["stdlib"]
+    for name, per_turn in results.items():
+        saved = base - per_turn
+        print(f"{name:<10} {per_turn:8.3f} ms CPU/turno   economia vs stdlib: {saved:7.3f} ms ({saved / base:6.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Transporte HTTP: aiohttp (HTTP/1.1) x httpx (HTTP/1.1) x httpx (HTTP/2) sob fan-out.
+
+Dispara `--requests` chamadas `LLMHarness.run` (ou `run_stream`) com até
+`--concurrency` simultâneas contra um servidor compatível com a OpenAI.
+
+    python -m benchmarks.transport --requests 400 --concurrency 64 --latency fixed:150
+
+Sem `--base-url`, sobe o mock local (benchmarks/mock_openai_server.py) no mesmo
+processo. O mock fala HTTP/1.1 em texto puro: para medir a multiplexação HTTP/2,
+aponte `--base-url` para um endpoint com HTTP/2 (provedor real ou um proxy h2 na
+frente do mock). A coluna de versões mostra o protocolo efetivamente negociado.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.common import format_row, isolated_workdir, summarize
+
+
+async def _fan_out(harness, requests: int, concurrency: int, stream: bool) -> Tuple[List[float], float, int]:
+    sem = asyncio.Semaphore(concurrency)
+    samples: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            messages = [{"role": "user", "content": f"pedido {i}"}]
+            try:
+                if stream:
+                    async for _ in harness.run_stream(messages, agent_name="bench", npc_id="bench"):
+                        pass
+                else:
+                    await harness.run(messages, agent_name="bench", npc_id="bench")
+                samples.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return samples, time.perf_counter() - start, errors
+
+
+async def _run(args: argparse.Namespace) -> None:
+    from core.http_pool import HTTP2_AVAILABLE, close_http_sessions
+    from core.llm import AdmissionScheduler, LLMHarness, set_scheduler
+    from core.llm_backends import HTTPXBackend, OpenAIHTTPBackend
+
+    runner = None
+    base_url: Optional[str] = args.base_url
+    if base_url is None:
+        from benchmarks.mock_openai_server import MockConfig, start_mock_server
+        runner, base_url, _server = await start_mock_server(
+            MockConfig(latency=args.latency, tokens_per_s=args.tokens_per_s, seed=1)
+        )
+    # O scheduler não deve ser o gargalo aqui
+    set_scheduler(AdmissionScheduler(max_concurrency=args.concurrency))
+
+    backends = {
+        "aiohttp (HTTP/1.1)": OpenAIHTTPBackend(base_url=base_url),
+        "httpx (HTTP/1.1)": HTTPXBackend(base_url=base_url, http2=False),
+        "httpx (HTTP/2)": HTTPXBackend(base_url=base_url, http2=True),
+    }
+    if not HTTP2_AVAILABLE:
+        print("aviso: pacote 'h2' ausente; 'httpx (HTTP/2)' roda em HTTP/1.1 (pip install httpx[http2])")
+
+    print(f"{args.requests} requisições, concorrência {args.concurrency}, stream={args.stream}, alvo={base_url}")
+    try:
+        for label, backend in backends.items():
+            harness = LLMHarness(
+                model=args.model, backend=backend, cache=False, single_flight=False, max_retries=1, max_tokens=64
+            )
+            # Aquecimento: abre as conexões fora da medição
+            await _fan_out(harness, args.concurrency, args.concurrency, args.stream)
+            if hasattr(backend, "http_versions"):
+                backend.http_versions.clear()
+            samples, elapsed_s, errors = await _fan_out(harness, args.requests, args.concurrency, args.stream)
+            versions: Dict[str, int] = dict(getattr(backend, "http_versions", {}) or {"HTTP/1.1": len(samples)})
+            print(format_row(label, summarize(samples)))
+            print(f"{'':<28} {len(samples) / elapsed_s:8.1f} req/s  erros={errors}  versões={versions}")
+    finally:
+        await close_http_sessions()
+        if runner is not None:
+            await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--base-url", default=None, help="endpoint compatível (padrão: mock local)")
+    parser.add_argument("--latency", default="fixed:100", help="latência do mock local (ms)")
+    parser.add_argument("--tokens-per-s", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    with isolated_workdir():
+        asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
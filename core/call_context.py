@@ -0,0 +1,67 @@
+"""
+Atribuição de chamadas via contextvars.
+
+Cada nó do grafo define o agente corrente e o runtime define npc_id, thread_id e
+turn_id no início do turno. `LLMHarness.run`, o `MetricsLogger` e os logs leem
+esse contexto em O(1), sem inspecionar a pilha de execução.
+
+Como contextvars são copiados para tasks filhas, o contexto acompanha
+naturalmente as corrotinas disparadas dentro de um nó.
+"""
+
+import contextvars
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from functools import wraps
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+
+@dataclass(frozen=True)
+class CallContext:
+    agent: Optional[str] = None
+    npc_id: Optional[str] = None
+    thread_id: Optional[str] = None
+    turn_id: Optional[str] = None
+
+
+_EMPTY = CallContext()
+_current: "contextvars.ContextVar[CallContext]" = contextvars.ContextVar("npc_call_context", default=_EMPTY)
+
+
+def current_call_context() -> CallContext:
+    """Contexto de atribuição corrente (vazio se nada foi definido)."""
+    return _current.get()
+
+
+@contextmanager
+def call_context(**fields: Any) -> Iterator[CallContext]:
+    """Sobrepõe campos do contexto corrente dentro do bloco `with`."""
+    ctx = replace(_current.get(), **{k: v for k, v in fields.items() if v is not None})
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
+
+
+def traced_node(agent: str, fn: Callable[[Any], Awaitable[Any]]) -> Callable[[Any], Awaitable[Any]]:
+    """Envolve um nó assíncrono do grafo, definindo o agente (e o npc_id do estado) durante a execução."""
+    @wraps(fn)
+    async def node(state: Any) -> Any:
+        npc_id = state.get("npc_id") if isinstance(state, dict) else None
+        with call_context(agent=agent, npc_id=npc_id):
+            return await fn(state)
+    return node
+
+
+class CallContextFilter(logging.Filter):
+    """Injeta agent/npc_id/thread_id/turn_id do contexto corrente nos registros de log."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        ctx = _current.get()
+        record.agent = ctx.agent or "-"
+        record.npc_id = ctx.npc_id or "-"
+        record.thread_id = ctx.thread_id or "-"
+        record.turn_id = ctx.turn_id or "-"
+        return True
@@ -0,0 +1,115 @@
+"""
+Cascata de modelos: chama primeiro um modelo barato/rápido e só escala para o
+modelo configurado do agente quando a saída falha na validação.
+
+Cada agente define a própria verificação (ex.: FALA_NPC vazia, JSON do crítico
+inválido, INTENÇÃO ausente). Cada chamada em cascata gera um evento `cascade`
+em `metrics/llm_events.csv`:
+- `detail`: 'accepted' (saída do modelo barato aproveitada) ou 'escalated';
+- `value`: latência economizada em ms. Quando aceita, é a mediana recente do
+  modelo forte menos a latência do barato. Quando escala, é negativa (o tempo
+  gasto à toa no modelo barato);
+- `reason`: motivo da escalada.
+
+`cascade_stats()` resume taxa de escalada e economia por agente.
+"""
+
+import asyncio
+import copy
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Type, TypeVar
+
+from .call_context import current_call_context
+from .llm import LLMHarness
+from .metrics_logger import get_metrics_logger
+from .structured_output import StructuredOutputError
+
+logger = logging.getLogger("npc.core.cascade")
+
+T = TypeVar("T")
+
+# Validação: None se a saída é aceitável, senão o motivo da escalada
+Validator = Callable[[Any], Optional[str]]
+
+_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(agent: str, escalated: bool, saved_ms: Optional[float]) -> None:
+    with _stats_lock:
+        s = _stats.setdefault(agent, {"calls": 0, "escalations": 0, "saved_ms": 0.0})
+        s["calls"] += 1
+        if escalated:
+            s["escalations"] += 1
+        if saved_ms is not None:
+            s["saved_ms"] += saved_ms
+
+
+def cascade_stats() -> Dict[str, Dict[str, float]]:
+    """Por agente: chamadas, escaladas, taxa de escalada e latência economizada (ms)."""
+    with _stats_lock:
+        return {
+            agent: dict(s, escalation_rate=(s["escalations"] / s["calls"]) if s["calls"] else 0.0)
+            for agent, s in _stats.items()
+        }
+
+
+class ModelCascade:
+    """Envolve o harness do agente com uma tentativa prévia num modelo mais barato."""
+
+    def __init__(self, primary: LLMHarness, cheap_model: Optional[str]):
+        self.primary = primary
+        self.cheap: Optional[LLMHarness] = None
+        if cheap_model and cheap_model != primary.model:
+            # Mesma configuração do agente (temperatura, lane, response_format...), outro modelo
+            self.cheap = copy.copy(primary)
+            self.cheap.model = cheap_model
+            self.cheap.hedge_percentile = None
+
+    async def run(self, messages: Any, validate: Validator) -> str:
+        """Como `LLMHarness.run`, escalando se `validate(texto)` reprovar a saída barata."""
+        return await self._cascade(lambda h: h.run(messages), validate)
+
+    async def run_structured(self, messages: Any, schema: Type[Any], validate: Optional[Validator] = None) -> Any:
+        """Como `LLMHarness.run_structured`; JSON inválido no modelo barato também escala."""
+        return await self._cascade(lambda h: h.run_structured(messages, schema), validate or (lambda _obj: None))
+
+    async def _cascade(self, call: Callable[[LLMHarness], Awaitable[T]], validate: Validator) -> T:
+        if self.cheap is None:
+            return await call(self.primary)
+
+        agent = current_call_context().agent or "unknown"
+        start = time.monotonic()
+        try:
+            result = await call(self.cheap)
+            reason = validate(result)
+        except asyncio.CancelledError:
+            raise
+        except StructuredOutputError as e:
+            result, reason = None, f"parse: {e}"
+        except Exception as e:
+            result, reason = None, f"erro: {e}"
+        cheap_ms = (time.monotonic() - start) * 1000
+
+        if reason is None:
+            # Economia estimada contra a latência típica do modelo forte para este agente
+            strong_ms = get_metrics_logger().latency_percentile(agent, self.primary.model, 50, min_samples=1)
+            saved_ms = (strong_ms - cheap_ms) if strong_ms is not None else None
+            self._log(agent, "accepted", saved_ms, None)
+            return result  # type: ignore[return-value]
+
+        logger.info("cascade[%s]: %s -> %s (%s)", agent, self.cheap.model, self.primary.model, reason)
+        self._log(agent, "escalated", -cheap_ms, reason)
+        return await call(self.primary)
+
+    def _log(self, agent: str, outcome: str, saved_ms: Optional[float], reason: Optional[str]) -> None:
+        _record(agent, outcome == "escalated", saved_ms)
+        get_metrics_logger().log_event(
+            event="cascade",
+            model=self.cheap.model if self.cheap else self.primary.model,
+            detail=outcome,
+            value=round(saved_ms, 2) if saved_ms is not None else None,
+            reason=(reason or "")[:200] or None,
+        )
@@ -0,0 +1,192 @@
+"""
+Gravação/reprodução ("cassete") do tráfego de LLM e TTS.
+
+Em modo `record`, cada `LLMHarness.run` e `synthesize_npc_voice_bytes` bem-sucedido
+é anexado a um arquivo JSONL compacto (uma interação por linha) com a resposta, o
+usage e a latência observada. Em modo `replay`, as mesmas chamadas são respondidas
+a partir do cassete, sem rede nem custo, com a latência original ou zero.
+
+Correspondência (`match`):
+- `fingerprint` (padrão): pelo hash da requisição (o `cache_key` do cache de
+  respostas, ignorando carimbos de data/hora; para TTS, modelo+voz+texto+instruções).
+  Reproduz turnos exatamente; requisições ausentes falham com `CassetteMissError`.
+- `sequence`: pela ordem das chamadas de cada (npc_id, agente), ignorando o prompt.
+  Útil para comparar mudanças no framework que alteram prompts (retrieval, stores).
+
+Configuração por ambiente: NPC_CASSETTE=<arquivo>, NPC_CASSETTE_MODE=record|replay,
+NPC_CASSETTE_LATENCY=original|zero, NPC_CASSETTE_MATCH=fingerprint|sequence.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .call_context import current_call_context
+from .llm_cache import cache_key
+from .serialization import JSONDecodeError, canonical_dumps, dumps, loads
+
+logger = logging.getLogger("npc.core.cassette")
+
+MODES = ("record", "replay")
+
+
+class CassetteMissError(LookupError):
+    """Requisição sem resposta gravada no cassete (modo replay)."""
+
+
+# Carimbos de data/hora ISO-8601 (histórico de interações) mudam a cada execução
+_TIMESTAMP_RE = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?")
+
+
+def llm_fingerprint(
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    messages: List[Dict[str, Any]],
+    response_format: Optional[Dict[str, Any]] = None,
+    stop: Optional[List[str]] = None,
+) -> str:
+    """`cache_key` da requisição, ignorando carimbos de data/hora no conteúdo."""
+    scrubbed = [dict(m, content=_TIMESTAMP_RE.sub("<ts>", str(m.get("content", "")))) for m in messages]
+    return cache_key(model, temperature, max_tokens, scrubbed, response_format, stop)
+
+
+def tts_fingerprint(model: str, voice: str, text: str, instructions: str) -> str:
+    """Hash estável de uma requisição de TTS."""
+    blob = canonical_dumps([model, voice, text.strip(), instructions])
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Arquivo JSONL de interações gravadas; thread-safe (o TTS roda fora do loop)."""
+
+    def __init__(self, path: str, mode: str = "replay", latency: str = "original", match: str = "fingerprint"):
+        if mode not in MODES:
+            raise ValueError(f"Modo de cassete inválido: {mode!r}")
+        if latency not in ("original", "zero"):
+            raise ValueError(f"Latência de cassete inválida: {latency!r}")
+        if match not in ("fingerprint", "sequence"):
+            raise ValueError(f"Correspondência de cassete inválida: {match!r}")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency = latency
+        self.match = match
+        self._lock = threading.Lock()
+        # fingerprint -> entradas (na ordem gravada) e cursor de reprodução
+        self._by_key: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._by_sequence: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = defaultdict(list)
+        self._cursors: Dict[Any, int] = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        if mode == "replay":
+            self._load()
+        else:
+            # Gravação começa um cassete novo
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text("", encoding="utf-8")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = loads(line)
+                except JSONDecodeError:
+                    logger.warning("cassette: linha %d inválida em %s; ignorada", n, self.path)
+                    continue
+                self._by_key[entry["key"]].append(entry)
+                self._by_sequence[(entry["kind"], entry.get("npc_id") or "", entry.get("agent") or "")].append(entry)
+        logger.info("cassette: %d interações carregadas de %s", sum(len(v) for v in self._by_key.values()), self.path)
+
+    def record(self, kind: str, key: str, latency_ms: float, **fields: Any) -> None:
+        """Anexa uma interação (`kind`: 'llm' ou 'tts')."""
+        ctx = current_call_context()
+        entry = {
+            "kind": kind,
+            "key": key,
+            "npc_id": fields.pop("npc_id", None) or ctx.npc_id,
+            "agent": fields.pop("agent", None) or ctx.agent,
+            "latency_ms": round(latency_ms, 2),
+            **fields,
+        }
+        line = dumps(entry)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def lookup(self, kind: str, key: str, npc_id: Optional[str] = None, agent: Optional[str] = None) -> Dict[str, Any]:
+        """Próxima resposta gravada para a requisição (repete a última se esgotar)."""
+        ctx = current_call_context()
+        if self.match == "sequence":
+            index: Any = (kind, npc_id or ctx.npc_id or "", agent or ctx.agent or "")
+            entries = self._by_sequence.get(index)
+        else:
+            index = key
+            entries = self._by_key.get(key)
+        with self._lock:
+            if not entries:
+                self.misses += 1
+                raise CassetteMissError(f"cassette: nenhuma resposta gravada para {kind} {index}")
+            cursor = self._cursors[index]
+            self._cursors[index] = cursor + 1
+            self.hits += 1
+        return entries[min(cursor, len(entries) - 1)]
+
+    def replay_delay_s(self, entry: Dict[str, Any]) -> float:
+        return entry.get("latency_ms", 0.0) / 1000.0 if self.latency == "original" else 0.0
+
+    # Áudio é gravado em base64 (MP3 já é comprimido)
+    @staticmethod
+    def encode_audio(audio: bytes) -> str:
+        return base64.b64encode(audio).decode("ascii")
+
+    @staticmethod
+    def decode_audio(entry: Dict[str, Any]) -> bytes:
+        return base64.b64decode(entry["audio_b64"])
+
+
+_cassette: Optional[Cassette] = None
+_cassette_loaded = False
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Cassete ativo (via NPC_CASSETTE ou `set_cassette`), ou None."""
+    global _cassette, _cassette_loaded
+    if not _cassette_loaded:
+        _cassette_loaded = True
+        path = os.getenv("NPC_CASSETTE", "").strip()
+        if path:
+            _cassette = Cassette(
+                path,
+                mode=os.getenv("NPC_CASSETTE_MODE", "replay").strip().lower(),
+                latency=os.getenv("NPC_CASSETTE_LATENCY", "original").strip().lower(),
+                match=os.getenv("NPC_CASSETTE_MATCH", "fingerprint").strip().lower(),
+            )
+    return _cassette
+
+
+def set_cassette(cassette: Optional[Cassette]) -> None:
+    """Ativa (ou desativa, com None) um cassete no processo."""
+    global _cassette, _cassette_loaded
+    _cassette = cassette
+    _cassette_loaded = True
+
+
+def replay_sleep(cassette: Cassette, entry: Dict[str, Any]) -> None:
+    """Espera síncrona com a latência gravada (TTS é síncrono)."""
+    delay = cassette.replay_delay_s(entry)
+    if delay > 0:
+        time.sleep(delay)
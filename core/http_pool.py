@@ -0,0 +1,128 @@
+"""
+Registro de sessões HTTP (aiohttp) compartilhadas por event loop.
+
+Cada event loop ganha UMA `ClientSession` com um `TCPConnector` keep-alive,
+reaproveitada por todas as instâncias de `LLMHarness`. Isso evita um handshake
+TCP/TLS completo a cada chamada ao provedor.
+
+Sessões aiohttp ficam presas ao loop em que foram criadas; por isso o registro
+é indexado pelo loop corrente. Loops que já foram fechados (ex.: o `run_async`
+do Streamlit, que cria um loop novo por mensagem) são descartados na próxima
+consulta, e `close_http_sessions()` deve ser aguardado antes de fechar o loop.
+"""
+
+import asyncio
+import logging
+import os
+import ssl
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+import httpx
+
+logger = logging.getLogger("npc.core.http_pool")
+
+# Limites do pool (sobrescrevíveis via ambiente)
+POOL_LIMIT = int(os.getenv("NPC_HTTP_POOL_LIMIT", "100"))
+POOL_LIMIT_PER_HOST = int(os.getenv("NPC_HTTP_POOL_LIMIT_PER_HOST", "20"))
+KEEPALIVE_TIMEOUT = float(os.getenv("NPC_HTTP_KEEPALIVE_TIMEOUT", "60"))
+
+# loop -> ClientSession (weak: se o loop for coletado, a entrada some junto)
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+# Transporte alternativo (httpx, opcionalmente HTTP/2): loop -> {(http2, verify): AsyncClient}
+_httpx_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[bool, bool], Any]]" = weakref.WeakKeyDictionary()
+
+try:
+    import h2  # type: ignore  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _prune_closed_loops() -> None:
+    """Descarta sessões de loops já fechados (não há como fechá-las de forma assíncrona)."""
+    for loop in list(_httpx_clients.keys()):
+        if loop.is_closed():
+            _httpx_clients.pop(loop, None)
+    for loop in list(_sessions.keys()):
+        if loop.is_closed():
+            session = _sessions.pop(loop, None)
+            if session is not None and not session.closed:
+                # Evita o aviso "Unclosed client session"; os sockets já morreram com o loop
+                session._connector = None  # type: ignore[attr-defined]
+                logger.debug("http_pool: sessão de loop fechado descartada")
+
+
+def get_http_session(ssl_context: Optional[ssl.SSLContext] = None) -> aiohttp.ClientSession:
+    """Retorna a sessão compartilhada do loop corrente, criando-a se necessário.
+
+    Deve ser chamada de dentro de uma corrotina (precisa de um loop em execução).
+    Timeout e headers são definidos por requisição, não na sessão.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is not None and not session.closed:
+        return session
+
+    _prune_closed_loops()
+    connector = aiohttp.TCPConnector(
+        ssl=ssl_context if ssl_context is not None else True,
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        enable_cleanup_closed=True,
+    )
+    session = aiohttp.ClientSession(connector=connector)
+    _sessions[loop] = session
+    logger.debug(
+        "http_pool: nova sessão (limit=%s per_host=%s keepalive=%ss)",
+        POOL_LIMIT,
+        POOL_LIMIT_PER_HOST,
+        KEEPALIVE_TIMEOUT,
+    )
+    return session
+
+
+def get_httpx_client(http2: bool = True, verify: bool = False) -> Any:
+    """`httpx.AsyncClient` compartilhado do loop corrente.
+
+    Com HTTP/2 (requer o pacote `h2`: `pip install httpx[http2]`), as requisições
+    concorrentes são multiplexadas como streams em poucas conexões. Sem `h2`,
+    cai para HTTP/1.1 com um aviso.
+    """
+    wants_http2, http2 = http2, http2 and HTTP2_AVAILABLE
+    loop = asyncio.get_running_loop()
+    per_loop = _httpx_clients.setdefault(loop, {})
+    client = per_loop.get((http2, verify))
+    if client is not None and not client.is_closed:
+        return client
+
+    if wants_http2 and not http2:
+        logger.warning("http_pool: pacote 'h2' ausente; httpx usará HTTP/1.1 (pip install httpx[http2])")
+
+    client = httpx.AsyncClient(
+        http2=http2,
+        verify=verify,
+        limits=httpx.Limits(
+            max_connections=POOL_LIMIT_PER_HOST,
+            max_keepalive_connections=POOL_LIMIT_PER_HOST,
+            keepalive_expiry=KEEPALIVE_TIMEOUT,
+        ),
+    )
+    per_loop[(http2, verify)] = client
+    logger.debug("http_pool: novo cliente httpx (http2=%s)", http2)
+    return client
+
+
+async def close_http_sessions() -> None:
+    """Fecha a sessão compartilhada do loop corrente (use antes de fechar o loop)."""
+    loop = asyncio.get_running_loop()
+    session = _sessions.pop(loop, None)
+    if session is not None and not session.closed:
+        await session.close()
+    for client in (_httpx_clients.pop(loop, None) or {}).values():
+        if not client.is_closed:
+            await client.aclose()
+    _prune_closed_loops()
@@ -1,11 +1,12 @@
 from __future__ import annotations
-import json
 import os
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+from .serialization import read_json, write_json
+
 
 @dataclass
 class JSONMemoryStore:
@@ -23,18 +24,16 @@ class JSONMemoryStore:
         if not p.exists():
             return []
         try:
-            with p.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    return data
-                return []
+            data = read_json(p)
+            if isinstance(data, list):
+                return data
+            return []
         except Exception:
             # Se o arquivo estiver corrompido, começamos limpo
             return []
 
     def _write(self, items: List[Dict[str, Any]]) -> None:
-        with self.path.open("w", encoding="utf-8") as f:
-            json.dump(items, f, ensure_ascii=False, indent=2)
+        write_json(self.path, items, indent=True)
 
     def append(self, item: Dict[str, Any]) -> None:
         items = self._read()
@@ -109,23 +108,21 @@ class CategorizedMemoryStore:
         if not p.exists():
             return self._empty()
         try:
-            with p.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    # garante todas categorias
-                    for c in self.CATEGORIES:
-                        if c not in data or not isinstance(data[c], list):
-                            data[c] = []
-                    return data
-                return self._empty()
+            data = read_json(p)
+            if isinstance(data, dict):
+                # garante todas categorias
+                for c in self.CATEGORIES:
+                    if c not in data or not isinstance(data[c], list):
+                        data[c] = []
+                return data
+            return self._empty()
         except Exception:
             return self._empty()
 
     def write(self, data: Dict[str, List[Dict[str, Any]]]) -> None:
         # normaliza categorias
         norm = {c: data.get(c, []) for c in self.CATEGORIES}
-        with self.path.open("w", encoding="utf-8") as f:
-            json.dump(norm, f, ensure_ascii=False, indent=2)
+        write_json(self.path, norm, indent=True)
 
     def _find_index(self, items: List[Dict[str, Any]], title: str) -> int:
         t = (title or "").strip().lower()
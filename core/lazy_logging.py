@@ -0,0 +1,208 @@
+"""
+Logging sem custo no caminho do turno.
+
+- `Lazy`, `lazy_json` e `truncated`: argumentos de log renderizados só quando o
+  registro é de fato emitido (`logger.debug("payload: %s", lazy_json(data))` não
+  serializa nada com DEBUG desligado).
+- `AgentSamplingFilter`: amostragem por agente dos registros abaixo de WARNING,
+  decidida por turno (um turno amostrado loga todas as linhas daquele agente).
+  NPC_LOG_SAMPLE="world_model=0.1,context_awareness=0.5,*=1".
+- `TruncatingFormatter`: limita o tamanho da mensagem por agente.
+  NPC_LOG_TRUNCATE="world_model=200,*=2000" (0 = sem limite).
+- `NonBlockingQueueHandler`: o produtor só enfileira o registro; formatação e
+  escrita acontecem na thread do `QueueListener`.
+
+`configure_logging()` monta tudo no logger raiz (NPC_LOG_LEVEL, NPC_LOG_QUEUE=0
+desliga a fila). O agente de cada registro vem do contexto de atribuição
+(core/call_context.py), capturado no produtor antes de enfileirar.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import zlib
+from typing import Any, Callable, Dict, Optional
+
+from .call_context import CallContextFilter
+from .serialization import dumps
+
+DEFAULT_FORMAT = "[%(levelname)s] %(name)s [%(npc_id)s/%(agent)s %(turn_id)s]: %(message)s"
+
+
+class Lazy:
+    """Valor de log calculado no primeiro `str()` (só se o registro for emitido).
+
+    Com a fila de log, o cálculo roda na thread do listener: não passe objetos
+    que o chamador ainda vai alterar.
+    """
+
+    __slots__ = ("_fn", "_args", "_kwargs", "_text")
+
+    def __init__(self, fn: Callable[..., Any], *args: Any, **kwargs: Any):
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._text: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self._text is None:
+            self._text = str(self._fn(*self._args, **self._kwargs))
+        return self._text
+
+    __repr__ = __str__
+
+
+def _truncate(value: Any, limit: int) -> str:
+    text = str(value)
+    if limit and len(text) > limit:
+        return text[: max(0, limit - 3)] + "..."
+    return text
+
+
+def lazy_json(obj: Any, indent: bool = True) -> Lazy:
+    """JSON de `obj` renderizado sob demanda."""
+    return Lazy(dumps, obj, indent=indent)
+
+
+def truncated(value: Any, limit: int = 150) -> Lazy:
+    """`str(value)` cortado em `limit` caracteres (com "..."), sob demanda."""
+    return Lazy(_truncate, value, limit)
+
+
+def _parse_agent_map(spec: str, cast: Callable[[str], Any]) -> Dict[str, Any]:
+    """'agente=valor,*=padrão' -> {agente: valor}."""
+    result: Dict[str, Any] = {}
+    for part in (spec or "").split(","):
+        name, sep, raw = part.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            result[name.strip()] = cast(raw.strip())
+        except ValueError:
+            continue
+    return result
+
+
+class AgentSamplingFilter(logging.Filter):
+    """Descarta uma fração dos registros < WARNING por agente, de forma estável por turno."""
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.default = self.rates.pop("*", 1.0)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        agent = getattr(record, "agent", "-")
+        rate = self.rates.get(agent, self.default)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        turn_id = getattr(record, "turn_id", "-")
+        if turn_id == "-":
+            return random.random() < rate
+        bucket = zlib.crc32(f"{turn_id}:{agent}".encode("utf-8")) % 10000
+        return bucket < rate * 10000
+
+
+class TruncatingFormatter(logging.Formatter):
+    """Formatter que corta a mensagem conforme o limite do agente do registro."""
+
+    def __init__(self, fmt: str = DEFAULT_FORMAT, limits: Optional[Dict[str, int]] = None, **kwargs: Any):
+        super().__init__(fmt, **kwargs)
+        self.limits = dict(limits or {})
+        self.default = self.limits.pop("*", 0)
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        limit = self.limits.get(getattr(record, "agent", "-"), self.default)
+        if limit:
+            record.message = _truncate(record.message, limit)
+        return super().formatMessage(record)
+
+
+_IMMUTABLE = (str, bytes, int, float, bool, type(None), Lazy)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que não formata no produtor quando os argumentos são seguros.
+
+    Argumentos imutáveis (e `Lazy`) seguem crus para a thread do listener. Com
+    argumentos mutáveis ou exceção, a mensagem é renderizada aqui, como no
+    QueueHandler padrão, para não registrar um estado alterado depois.
+    Fila cheia descarta o registro em vez de bloquear o turno.
+    """
+
+    def __init__(self, q: "queue.Queue[logging.LogRecord]"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info or record.stack_info:
+            return super().prepare(record)
+        args = record.args
+        if not args or (isinstance(args, tuple) and all(isinstance(a, _IMMUTABLE) for a in args)):
+            return record
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: str = DEFAULT_FORMAT,
+    use_queue: Optional[bool] = None,
+    sample: Optional[str] = None,
+    truncate: Optional[str] = None,
+    max_queue: int = 10000,
+) -> None:
+    """Configura o logger raiz (se ainda não houver handlers) com fila, amostragem e truncamento."""
+    global _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    level = level or os.getenv("NPC_LOG_LEVEL", "INFO")
+    if use_queue is None:
+        use_queue = os.getenv("NPC_LOG_QUEUE", "1").strip().lower() not in ("0", "false", "no")
+    sampling = AgentSamplingFilter(_parse_agent_map(sample if sample is not None else os.getenv("NPC_LOG_SAMPLE", ""), float))
+    formatter = TruncatingFormatter(fmt, _parse_agent_map(truncate if truncate is not None else os.getenv("NPC_LOG_TRUNCATE", ""), int))
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(formatter)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    if not use_queue:
+        # Preenche npc_id/agent/turn_id a partir do contexto de atribuição corrente
+        stream.addFilter(CallContextFilter())
+        stream.addFilter(sampling)
+        root.addHandler(stream)
+        return
+
+    handler = NonBlockingQueueHandler(queue.Queue(max_queue))
+    # Contexto e amostragem no produtor: contextvars não chegam à thread do listener
+    handler.addFilter(CallContextFilter())
+    handler.addFilter(sampling)
+    root.addHandler(handler)
+    _listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Esvazia a fila e para a thread do listener (chamado no atexit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,16 +1,39 @@
 import os
-import json
 import time
 import logging
 import asyncio
-import inspect
-from typing import Any, List, Dict, Optional, Union, TypeVar
+import copy
+import heapq
+import weakref
+from typing import Any, AsyncIterator, List, Dict, Optional, Tuple, Type, Union, TypeVar
 from pathlib import Path
 import aiohttp
 import certifi
 import ssl
 from dotenv import load_dotenv
 from .metrics_logger import get_metrics_logger
+from .http_pool import close_http_sessions
+from .llm_cache import LLMResponseCache, cache_key, cache_enabled_by_env, get_llm_cache
+from .single_flight import get_single_flight
+from .call_context import current_call_context
+from .tokenizer import SECTIONS_KEY, count_messages_tokens, count_text_tokens, trim_messages_to_budget
+from .retry_policy import (
+    CircuitOpenError,
+    LLMHTTPError,
+    RetryPolicy,
+    get_circuit_breaker,
+)
+from .structured_output import StructuredOutputError, parse_structured
+from .cassette import Cassette, get_cassette, llm_fingerprint
+from .models_preset import DEFAULT_GENERATION_PROFILE, GENERATION_PROFILES
+from .lazy_logging import lazy_json
+from .llm_backends import (
+    DEFAULT_SSL_CONTEXT,
+    LLMBackend,
+    LLMResponseError,
+    OpenAIHTTPBackend,
+    get_default_backend,
+)
 
 # Import LangChain message types
 try:
@@ -32,10 +55,8 @@ T = TypeVar('T', bound=BaseMessage)
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Create a custom SSL context that skips verification
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+# Custom SSL context that skips verification (definido em core/llm_backends.py)
+ssl_context = DEFAULT_SSL_CONTEXT
 
 # Load .env early so os.getenv can see values
 load_dotenv()
@@ -44,12 +65,257 @@ load_dotenv()
 os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
 os.environ['SSL_CERT_FILE'] = certifi.where()
 
+# ----------------------------------------------------------------------
+# Admissão por modelo (concorrência + tokens por minuto) com lanes de prioridade
+# ----------------------------------------------------------------------
+
+# Lanes: quanto menor o número, maior a prioridade
+LANE_PRIORITY = {
+    "interactive": 0,  # diálogo, crítico, planner: o jogador está esperando
+    "background": 1,   # auto_memorize, relationship: podem esperar
+}
+
+
+class PromptBudgetExceeded(Exception):
+    """O prompt excede `max_prompt_tokens` do harness e não pôde ser cortado."""
+
+
+class AdmissionTicket:
+    """Reserva concedida pelo scheduler; devolvida em `release`."""
+
+    __slots__ = ("model", "lane", "reserved_tokens", "used_tokens", "wait_ms")
+
+    def __init__(self, model: str, lane: str, reserved_tokens: int, wait_ms: float):
+        self.model = model
+        self.lane = lane
+        self.reserved_tokens = reserved_tokens
+        self.used_tokens: Optional[int] = None  # preenchido com o usage real, se houver
+        self.wait_ms = wait_ms
+
+
+class _ModelBudget:
+    """Estado de admissão de um modelo em um event loop."""
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: int, background_share: float):
+        self.max_concurrency = max(1, max_concurrency)
+        # A lane background nunca ocupa todas as vagas: sobra espaço para chamadas interativas
+        self.max_background = 1
+        if self.max_concurrency > 1:
+            self.max_background = max(1, min(self.max_concurrency - 1, int(self.max_concurrency * background_share)))
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens = float(tokens_per_minute)
+        self.last_refill = time.monotonic()
+        self.in_flight = 0
+        self.background_in_flight = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future, int, str]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def refill(self) -> None:
+        if self.tokens_per_minute <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(
+            float(self.tokens_per_minute),
+            self.tokens + (now - self.last_refill) * self.tokens_per_minute / 60.0,
+        )
+        self.last_refill = now
+
+
+class AdmissionScheduler:
+    """Controla a admissão de chamadas LLM por modelo.
+
+    - `max_concurrency`: requisições simultâneas por modelo.
+    - `tokens_per_minute`: orçamento de tokens (token bucket; 0 = ilimitado). A reserva
+      usa prompt estimado + max_tokens e é acertada com o usage real na liberação.
+    - Lanes: `interactive` sempre passa na frente de `background`, e `background`
+      fica limitado a uma fração das vagas (`background_share`).
+    """
+
+    def __init__(self, max_concurrency: int = 8, tokens_per_minute: int = 0, background_share: float = 0.5):
+        self.default_max_concurrency = max_concurrency
+        self.default_tokens_per_minute = tokens_per_minute
+        self.background_share = background_share
+        self._overrides: Dict[str, Dict[str, int]] = {}
+        self._seq = 0
+        # loop -> {model: _ModelBudget}
+        self._budgets: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, _ModelBudget]]" = weakref.WeakKeyDictionary()
+
+    def configure_model(self, model: str, *, max_concurrency: Optional[int] = None, tokens_per_minute: Optional[int] = None) -> None:
+        """Define limites específicos de um modelo (vale para budgets criados depois)."""
+        conf = self._overrides.setdefault(model, {})
+        if max_concurrency is not None:
+            conf["max_concurrency"] = max_concurrency
+        if tokens_per_minute is not None:
+            conf["tokens_per_minute"] = tokens_per_minute
+
+    def _budget(self, model: str) -> _ModelBudget:
+        loop = asyncio.get_running_loop()
+        per_loop = self._budgets.setdefault(loop, {})
+        budget = per_loop.get(model)
+        if budget is None:
+            conf = self._overrides.get(model, {})
+            budget = _ModelBudget(
+                max_concurrency=conf.get("max_concurrency", self.default_max_concurrency),
+                tokens_per_minute=conf.get("tokens_per_minute", self.default_tokens_per_minute),
+                background_share=self.background_share,
+            )
+            per_loop[model] = budget
+        return budget
+
+    async def acquire(self, model: str, lane: str, tokens: int) -> AdmissionTicket:
+        budget = self._budget(model)
+        if budget.tokens_per_minute > 0:
+            # Uma única requisição nunca pode exceder o bucket inteiro (evita espera infinita)
+            tokens = min(tokens, budget.tokens_per_minute)
+        self._seq += 1
+        start = time.monotonic()
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(budget.waiters, (LANE_PRIORITY.get(lane, 0), self._seq, fut, tokens, lane))
+        self._dispatch(budget)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Vaga já concedida, mas o chamador desistiu: devolve
+                self._give_back(budget, lane, tokens, tokens)
+            else:
+                budget.waiters = [w for w in budget.waiters if w[2] is not fut]
+                heapq.heapify(budget.waiters)
+            raise
+        return AdmissionTicket(model, lane, tokens, (time.monotonic() - start) * 1000)
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        budget = self._budget(ticket.model)
+        used = ticket.used_tokens if ticket.used_tokens is not None else ticket.reserved_tokens
+        self._give_back(budget, ticket.lane, ticket.reserved_tokens, used)
+
+    def _give_back(self, budget: _ModelBudget, lane: str, reserved: int, used: int) -> None:
+        budget.in_flight -= 1
+        if lane == "background":
+            budget.background_in_flight -= 1
+        if budget.tokens_per_minute > 0:
+            # Devolve a diferença entre o reservado e o realmente gasto
+            budget.tokens = min(float(budget.tokens_per_minute), budget.tokens + max(0, reserved - used))
+        self._dispatch(budget)
+
+    def _dispatch(self, budget: _ModelBudget) -> None:
+        budget.refill()
+        while budget.waiters:
+            _prio, _seq, fut, tokens, lane = budget.waiters[0]
+            if fut.done():
+                heapq.heappop(budget.waiters)
+                continue
+            if budget.in_flight >= budget.max_concurrency:
+                return
+            if lane == "background" and budget.background_in_flight >= budget.max_background:
+                return
+            if budget.tokens_per_minute > 0 and budget.tokens < tokens:
+                # Aguarda o bucket reabastecer o suficiente para o primeiro da fila
+                if budget.timer is None:
+                    delay = (tokens - budget.tokens) * 60.0 / budget.tokens_per_minute
+                    budget.timer = asyncio.get_running_loop().call_later(delay, self._on_timer, budget)
+                return
+            heapq.heappop(budget.waiters)
+            budget.in_flight += 1
+            if lane == "background":
+                budget.background_in_flight += 1
+            if budget.tokens_per_minute > 0:
+                budget.tokens -= tokens
+            fut.set_result(None)
+
+    def _on_timer(self, budget: _ModelBudget) -> None:
+        budget.timer = None
+        self._dispatch(budget)
+
+
+_global_scheduler: Optional[AdmissionScheduler] = None
+
+
+def get_scheduler() -> AdmissionScheduler:
+    """Retorna o scheduler global (limites padrão via NPC_LLM_MAX_CONCURRENCY / NPC_LLM_TPM)."""
+    global _global_scheduler
+    if _global_scheduler is None:
+        _global_scheduler = AdmissionScheduler(
+            max_concurrency=int(os.getenv("NPC_LLM_MAX_CONCURRENCY", "8")),
+            tokens_per_minute=int(os.getenv("NPC_LLM_TPM", "0")),
+            background_share=float(os.getenv("NPC_LLM_BACKGROUND_SHARE", "0.5")),
+        )
+    return _global_scheduler
+
+
+def set_scheduler(scheduler: AdmissionScheduler):
+    """Define o scheduler global."""
+    global _global_scheduler
+    _global_scheduler = scheduler
+
+
+def _cached_prompt_tokens(usage: Dict[str, Any]) -> Optional[int]:
+    """Tokens do prompt atendidos pelo cache de prefixo do provedor (se informado)."""
+    details = usage.get("prompt_tokens_details") or {}
+    cached = details.get("cached_tokens")
+    return int(cached) if cached is not None else None
+
+
 class LLMHarness:
-    def __init__(self, model: str = "gpt-3.5-turbo", temperature: float = 0.7, max_retries: int = 3, timeout: int = 45):
+    def __init__(
+        self,
+        model: str = "gpt-3.5-turbo",
+        temperature: Optional[float] = None,
+        max_retries: int = 3,
+        timeout: Optional[int] = None,
+        cache: Union[bool, LLMResponseCache, None] = None,
+        single_flight: Optional[bool] = None,
+        lane: str = "interactive",
+        hedge_percentile: Optional[float] = None,
+        hedge_min_delay_ms: float = 250.0,
+        max_prompt_tokens: Optional[int] = None,
+        prompt_overflow: str = "trim",
+        retry_policy: Optional[RetryPolicy] = None,
+        fallback_model: Optional[str] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        backend: Optional[LLMBackend] = None,
+        base_url: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        profile: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+    ):
         self.model = model
-        self.temperature = temperature
+        # Perfil de geração do agente (GENERATION_PROFILES em core/models_preset.py);
+        # argumentos explícitos têm precedência
+        self.profile = profile
+        gen = {**DEFAULT_GENERATION_PROFILE, **GENERATION_PROFILES.get(profile or "", {})}
+        self.temperature = temperature if temperature is not None else gen["temperature"]
         self.max_retries = max_retries
-        self.timeout = timeout
+        self.timeout = timeout if timeout is not None else gen["timeout"]
+        self.max_tokens = max_tokens if max_tokens is not None else gen["max_tokens"]
+        self.stop = stop if stop is not None else gen.get("stop")
+        # Cache de respostas: None segue NPC_LLM_CACHE; True usa o cache global; False desliga
+        self._cache_opt = cache
+        # Coalescência de requisições idênticas em andamento (desligue com NPC_LLM_SINGLE_FLIGHT=0)
+        if single_flight is None:
+            single_flight = os.getenv("NPC_LLM_SINGLE_FLIGHT", "1").strip().lower() not in ("0", "false", "no", "off")
+        self.single_flight = single_flight
+        # Lane de prioridade no scheduler de admissão ('interactive' ou 'background')
+        self.lane = lane
+        # Hedging (opt-in): duplica a requisição se ela passar do percentil de latência recente
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        # Orçamento de tokens do prompt: 'trim' remove histórico antigo e encolhe as seções do
+        # bloco dinâmico (lore, contexto); 'error' falha antes do envio
+        # (argumento > perfil do agente > NPC_LLM_MAX_PROMPT_TOKENS > DEFAULT_GENERATION_PROFILE; 0 desliga)
+        if max_prompt_tokens is None:
+            max_prompt_tokens = GENERATION_PROFILES.get(profile or "", {}).get("max_prompt_tokens")
+        if max_prompt_tokens is None:
+            max_prompt_tokens = int(os.getenv("NPC_LLM_MAX_PROMPT_TOKENS", str(DEFAULT_GENERATION_PROFILE.get("max_prompt_tokens") or 0)))
+        self.max_prompt_tokens = max_prompt_tokens or None
+        self.prompt_overflow = prompt_overflow
+        # Retry: classificação de erros, decorrelated jitter e Retry-After (core/retry_policy.py)
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Com o circuit breaker do modelo aberto, desvia para este modelo (senão falha rápido)
+        self.fallback_model = fallback_model or os.getenv("NPC_LLM_FALLBACK_MODEL") or None
+        # JSON mode / JSON schema do provedor (ver core/structured_output.json_response_format)
+        self.response_format = response_format
         # 1) env/.env
         api_key = os.getenv("OPENAI_API_KEY")
         # 2) streamlit secrets (if available)
@@ -60,23 +326,48 @@ class LLMHarness:
             except Exception:
                 api_key = None
         self.api_key = api_key
-        self.base_url = "https://api.openai.com/v1"
-        self._connector = None  # deprecated: avoid persisting connectors across loops
-        
-        # Configure the session headers
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        self._connector = None  # deprecated: a sessão/conector agora vem do pool por loop (core/http_pool.py)
+        # Transporte (core/llm_backends.py): sem backend explícito, segue o padrão do processo
+        # (NPC_LLM_BACKEND). base_url/headers criam um backend HTTP próprio deste harness.
+        if backend is None and (base_url or headers):
+            backend = OpenAIHTTPBackend(base_url=base_url, headers=headers, ssl_context=ssl_context)
+        self._backend = backend
+
+    @property
+    def backend(self) -> LLMBackend:
+        return self._backend or get_default_backend()
+
+    @backend.setter
+    def backend(self, backend: Optional[LLMBackend]) -> None:
+        self._backend = backend
+
+    @property
+    def base_url(self) -> Optional[str]:
+        return getattr(self.backend, "base_url", None)
+
+    @base_url.setter
+    def base_url(self, base_url: str) -> None:
+        self._backend = OpenAIHTTPBackend(base_url=base_url, ssl_context=ssl_context)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        backend = self.backend
+        if isinstance(backend, OpenAIHTTPBackend):
+            return backend.headers_for(self.api_key)
+        return {}
+
+    def _check_api_key(self) -> None:
+        # Fail fast with clear message if API key is missing
+        if not self.api_key and self.backend.requires_api_key:
+            raise Exception("OPENAI_API_KEY ausente. Defina no ambiente/.env ou em Streamlit secrets.")
     
     @property
     def connector(self):
         # Deprecated; kept for backward compatibility but unused in run().
-        # Returns a fresh connector bound to the current loop.
+        # O conector compartilhado (keep-alive) vive em core/http_pool.py.
         return aiohttp.TCPConnector(
             ssl=ssl_context,
             limit=100,
-            force_close=True,
             enable_cleanup_closed=True,
         )
 
@@ -106,40 +397,18 @@ class LLMHarness:
             return {"role": "user", "content": str(message.content) if hasattr(message, 'content') else str(message)}
 
     def _detect_calling_agent(self) -> str:
-        """Detecta qual agente está fazendo a chamada LLM através do stack trace."""
-        try:
-            stack = inspect.stack()
-            for frame_info in stack:
-                filename = frame_info.filename
-                if 'agents' in filename:
-                    # Extrai o nome do agente do caminho do arquivo
-                    agent_name = Path(filename).stem
-                    if agent_name != '__init__':
-                        return agent_name
-            return 'unknown'
-        except Exception:
-            return 'unknown'
+        """Agente corrente segundo o contexto de atribuição (definido por nó do grafo)."""
+        return current_call_context().agent or 'unknown'
 
-    async def run(self, messages: Any, agent_name: Optional[str] = None, npc_id: Optional[str] = None) -> str:
-        """
-        Executa uma chamada LLM e registra métricas.
+    def _get_cache(self) -> Optional[LLMResponseCache]:
+        if isinstance(self._cache_opt, LLMResponseCache):
+            return self._cache_opt
+        if self._cache_opt is True or (self._cache_opt is None and cache_enabled_by_env()):
+            return get_llm_cache()
+        return None
 
-        Args:
-            messages: Mensagens para enviar ao LLM
-            agent_name: Nome do agente (opcional, será detectado automaticamente se não fornecido)
-            npc_id: ID do NPC (opcional)
-        """
-        last_error = None
-        metrics_logger = get_metrics_logger()
-        
-        # Detecta o agente se não fornecido
-        if agent_name is None:
-            agent_name = self._detect_calling_agent()
-        
-        # Fail fast with clear message if API key is missing
-        if not self.api_key:
-            raise Exception("OPENAI_API_KEY ausente. Defina no ambiente/.env ou em Streamlit secrets.")
-        
+    def _format_messages(self, messages: Any) -> List[Dict[str, Any]]:
+        """Normaliza mensagens (LangChain, dict ou texto) para o formato da API."""
         # Convert single message to list if needed
         if not isinstance(messages, (list, tuple)):
             messages = [messages]
@@ -147,150 +416,323 @@ class LLMHarness:
         # Convert all messages to the expected format
         try:
             formatted_messages = [self._convert_message_to_dict(msg) for msg in messages]
-            logger.debug(f"Formatted messages: {json.dumps(formatted_messages, indent=2, ensure_ascii=False)}")
+            logger.debug("Formatted messages: %s", lazy_json(formatted_messages))
         except Exception as e:
             error_msg = f"Failed to format messages: {str(e)}"
             logger.error(error_msg)
             logger.exception(e)
             raise Exception(error_msg) from e
+        return formatted_messages
+
+    @staticmethod
+    def _dynamic_sections(messages: Any) -> Optional[List[str]]:
+        """Seções do bloco dinâmico anexadas por `build_prompt` à última mensagem (se houver)."""
+        last = messages[-1] if isinstance(messages, (list, tuple)) and messages else messages
+        sections = getattr(last, "additional_kwargs", None) or {}
+        return sections.get(SECTIONS_KEY)
+
+    def _count_prompt_tokens(self, formatted_messages: List[Dict[str, Any]]) -> int:
+        # Contagem local (tiktoken ou heurística), com cache por mensagem
+        return count_messages_tokens(formatted_messages, self.model)
+
+    def _enforce_prompt_budget(
+        self,
+        formatted_messages: List[Dict[str, Any]],
+        agent_name: str,
+        npc_id: Optional[str],
+        sections: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Aplica `max_prompt_tokens` antes do envio: corta histórico antigo ou falha rápido."""
+        prompt_token_count = self._count_prompt_tokens(formatted_messages)
+        if self.max_prompt_tokens is None or prompt_token_count <= self.max_prompt_tokens:
+            return formatted_messages, prompt_token_count
+
+        if self.prompt_overflow == "trim":
+            trimmed = trim_messages_to_budget(formatted_messages, self.max_prompt_tokens, self.model, sections)
+            trimmed_count = self._count_prompt_tokens(trimmed)
+            if trimmed_count <= self.max_prompt_tokens:
+                logger.warning(
+                    "%s: prompt trimmed from %d to %d tokens (budget %d, %d messages dropped, dynamic block %s)",
+                    agent_name,
+                    prompt_token_count,
+                    trimmed_count,
+                    self.max_prompt_tokens,
+                    len(formatted_messages) - len(trimmed),
+                    "cut" if trimmed and trimmed[-1] is not formatted_messages[-1] else "intact",
+                )
+                return trimmed, trimmed_count
+
+        error_msg = f"Prompt budget exceeded: {prompt_token_count} > {self.max_prompt_tokens} tokens"
+        logger.error("%s: %s", agent_name, error_msg)
+        get_metrics_logger().log_metrics(
+            agent=agent_name,
+            model=self.model,
+            prompt_tokens=prompt_token_count,
+            completion_tokens=0,
+            total_tokens=prompt_token_count,
+            response_time_ms=0,
+            status='error',
+            error_message=error_msg,
+            npc_id=npc_id,
+            attempt_number=0,
+            lane=self.lane,
+        )
+        raise PromptBudgetExceeded(error_msg)
+
+    def _build_payload(self, formatted_messages: List[Dict[str, Any]], stream: bool = False) -> Dict[str, Any]:
+        """Monta o corpo da requisição /chat/completions."""
+        data: Dict[str, Any] = {
+            "model": self.model,
+            "messages": formatted_messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+        if self.stop:
+            data["stop"] = list(self.stop)
+        if self.response_format:
+            data["response_format"] = self.response_format
+        if stream:
+            data["stream"] = True
+            # Pede o bloco de usage no último chunk para manter as métricas de tokens
+            data["stream_options"] = {"include_usage": True}
+        return data
+
+    async def run(self, messages: Any, agent_name: Optional[str] = None, npc_id: Optional[str] = None) -> str:
+        """
+        Executa uma chamada LLM e registra métricas.
+
+        Args:
+            messages: Mensagens para enviar ao LLM
+            agent_name: Nome do agente (opcional, lido do contexto de atribuição se não fornecido)
+            npc_id: ID do NPC (opcional, lido do contexto de atribuição se não fornecido)
+
+        Com um cassete ativo (core/cassette.py), grava a resposta ou a reproduz.
+        """
+        # Atribuição: argumentos explícitos têm precedência sobre o contexto do nó (O(1))
+        if agent_name is None:
+            agent_name = self._detect_calling_agent()
+        if npc_id is None:
+            npc_id = current_call_context().npc_id
+        
+        formatted_messages = self._format_messages(messages)
+        formatted_messages, prompt_token_count = self._enforce_prompt_budget(
+            formatted_messages, agent_name, npc_id, self._dynamic_sections(messages)
+        )
+        payload = self._build_payload(formatted_messages)
+        key = cache_key(
+            self.model, self.temperature, payload["max_tokens"], formatted_messages, self.response_format, self.stop
+        )
+        
+        # Cassete (core/cassette.py): reproduz respostas gravadas ou grava as novas
+        cassette = get_cassette()
+        if cassette is not None:
+            cassette_key = llm_fingerprint(
+                self.model, self.temperature, payload["max_tokens"], formatted_messages, self.response_format, self.stop
+            )
+            if cassette.replaying:
+                return await self._replay(cassette, cassette_key, agent_name, npc_id)
+        self._check_api_key()
+        start_time = time.time()
+        content, usage = await self._run_keyed(key, formatted_messages, prompt_token_count, agent_name, npc_id)
+        if cassette is not None and content:
+            cassette.record(
+                "llm",
+                cassette_key,
+                (time.time() - start_time) * 1000,
+                npc_id=npc_id,
+                agent=agent_name,
+                model=self.model,
+                usage=usage,
+                content=content,
+            )
+        return content
+
+    async def _run_keyed(
+        self,
+        key: str,
+        formatted_messages: List[Dict[str, Any]],
+        prompt_token_count: int,
+        agent_name: str,
+        npc_id: Optional[str],
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Cache de respostas, single-flight e requisição upstream. Retorna (conteúdo, usage)."""
+        metrics_logger = get_metrics_logger()
+        
+        # Cache de respostas (opcional): evita pagar de novo por prompts idênticos
+        cache = self._get_cache()
+        cache_status = None
+        if cache is not None:
+            cache_start = time.time()
+            entry = await cache.aget(key)
+            if entry is not None:
+                metrics_logger.log_metrics(
+                    agent=agent_name,
+                    model=self.model,
+                    prompt_tokens=0,
+                    completion_tokens=0,
+                    total_tokens=0,
+                    response_time_ms=(time.time() - cache_start) * 1000,
+                    status='success',
+                    npc_id=npc_id,
+                    cache_status='hit',
+                )
+                logger.debug("Cache hit for %s (%.12s)", agent_name, key)
+                return entry["content"], {}
+            cache_status = 'miss'
+        
+        async def call() -> Tuple[str, Dict[str, Any]]:
+            return await self._request(formatted_messages, prompt_token_count, agent_name, npc_id, cache_status)
+        
+        if not self.single_flight:
+            content, usage = await call()
+        else:
+            # Chamadas idênticas em andamento compartilham uma única requisição upstream
+            wait_start = time.time()
+            (content, usage), shared = await get_single_flight().do(key, call)
+            if shared:
+                # O líder já registrou os tokens gastos; aqui só atribuímos a espera a este chamador
+                metrics_logger.log_metrics(
+                    agent=agent_name,
+                    model=self.model,
+                    prompt_tokens=0,
+                    completion_tokens=0,
+                    total_tokens=0,
+                    response_time_ms=(time.time() - wait_start) * 1000,
+                    status='success',
+                    npc_id=npc_id,
+                    cache_status=cache_status,
+                    coalesced=True,
+                )
+                logger.debug("Coalesced identical in-flight request for %s (%.12s)", agent_name, key)
+                return content, usage
         
-        # Calcula tokens aproximados do prompt (estimativa simples)
-        prompt_text = json.dumps(formatted_messages, ensure_ascii=False)
-        estimated_prompt_tokens = len(prompt_text.split()) * 1.3  # Estimativa aproximada
+        if cache is not None and content:
+            await cache.aset(key, content, usage=usage, model=self.model)
+        return content, usage
+
+    async def _replay(self, cassette: Cassette, key: str, agent_name: str, npc_id: Optional[str]) -> str:
+        """Resposta gravada no cassete, com a latência original (ou zero)."""
+        entry = cassette.lookup("llm", key, npc_id=npc_id, agent=agent_name)
+        start_time = time.time()
+        delay = cassette.replay_delay_s(entry)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        usage = entry.get("usage") or {}
+        get_metrics_logger().log_metrics(
+            agent=agent_name,
+            model=self.model,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0),
+            response_time_ms=(time.time() - start_time) * 1000,
+            status='success',
+            npc_id=npc_id,
+            cache_status='replay',
+            lane=self.lane,
+        )
+        return entry["content"]
+
+    async def run_structured(
+        self,
+        messages: Any,
+        schema: Type[Any],
+        agent_name: Optional[str] = None,
+        npc_id: Optional[str] = None,
+    ) -> Any:
+        """
+        Executa `run` e converte a resposta no schema pydantic `schema`.
+
+        O JSON é extraído e reparado localmente (core/structured_output.py). Falhas
+        de parse/validação viram uma linha `status=parse_error` no CSV de métricas
+        (a chamada foi desperdiçada) e são propagadas como `StructuredOutputError`,
+        cujo atributo `raw` guarda o texto recebido.
+        """
+        if agent_name is None:
+            agent_name = self._detect_calling_agent()
+        if npc_id is None:
+            npc_id = current_call_context().npc_id
+        text = await self.run(messages, agent_name=agent_name, npc_id=npc_id)
+        try:
+            parsed, repaired = parse_structured(text, schema)
+        except StructuredOutputError as e:
+            logger.warning("Structured output parse failed for %s (%s): %s", agent_name, schema.__name__, e)
+            get_metrics_logger().log_metrics(
+                agent=agent_name,
+                model=self.model,
+                prompt_tokens=0,
+                completion_tokens=0,
+                total_tokens=0,
+                response_time_ms=0,
+                status='parse_error',
+                error_message=str(e)[:300],
+                npc_id=npc_id,
+            )
+            raise
+        if repaired:
+            get_metrics_logger().log_event(event="json_repaired", model=self.model, detail=agent_name, reason=schema.__name__)
+        return parsed
+
+    async def _request(
+        self,
+        formatted_messages: List[Dict[str, Any]],
+        prompt_token_count: int,
+        agent_name: str,
+        npc_id: Optional[str],
+        cache_status: Optional[str] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Executa a requisição upstream com retries. Retorna (conteúdo, usage)."""
+        last_error = None
+        metrics_logger = get_metrics_logger()
+        data = self._build_payload(formatted_messages)
+        breaker = get_circuit_breaker(self.model)
+        delay: Optional[float] = None
+        attempts = 0
         
         for attempt in range(self.max_retries):
+            if not breaker.allow():
+                return await self._on_circuit_open(
+                    formatted_messages, prompt_token_count, agent_name, npc_id, cache_status, attempt
+                )
+            attempts = attempt + 1
             try:
-                # Prepare the request data
-                data = {
-                    "model": self.model,
-                    "messages": formatted_messages,
-                    "temperature": self.temperature,
-                    "max_tokens": 1000
-                }
-                
-                logger.debug(f"Sending request to OpenAI API: {json.dumps(data, indent=2, ensure_ascii=False)}")
-                
-                # Make the API request using a fresh connector per call (safer for Streamlit)
-                start_time = time.time()
-                timeout = aiohttp.ClientTimeout(total=self.timeout)
-                async with aiohttp.ClientSession(
-                    connector=aiohttp.TCPConnector(
-                        ssl=ssl_context,
-                        limit=100,
-                        force_close=True,
-                        enable_cleanup_closed=True,
-                    ),
-                    headers=self.headers,
-                    timeout=timeout,
-                ) as session:
-                    async with session.post(
-                        f"{self.base_url}/chat/completions",
-                        json=data,
-                        ssl=ssl_context
-                    ) as response:
-                        # Get the response text for debugging
-                        response_text = await response.text()
-                        response_time_ms = (time.time() - start_time) * 1000
-                        logger.debug(f"Raw API response: {response_text}")
-                        
-                        # Check for errors
-                        try:
-                            response.raise_for_status()
-                            
-                            # Parse the response
-                            try:
-                                result = json.loads(response_text)
-                                logger.debug(f"Parsed API response: {json.dumps(result, indent=2, ensure_ascii=False)}")
-                                
-                                # Extrai informações de uso (tokens)
-                                usage = result.get("usage", {})
-                                prompt_tokens = usage.get("prompt_tokens", int(estimated_prompt_tokens))
-                                completion_tokens = usage.get("completion_tokens", 0)
-                                total_tokens = usage.get("total_tokens", prompt_tokens + completion_tokens)
-                                
-                                # Registra métricas de sucesso
-                                metrics_logger.log_metrics(
-                                    agent=agent_name,
-                                    model=self.model,
-                                    prompt_tokens=prompt_tokens,
-                                    completion_tokens=completion_tokens,
-                                    total_tokens=total_tokens,
-                                    response_time_ms=response_time_ms,
-                                    status='success',
-                                    npc_id=npc_id,
-                                    attempt_number=attempt + 1,
-                                )
-                                
-                                # Extract the content from the response
-                                if "choices" in result and len(result["choices"]) > 0:
-                                    content = result["choices"][0]["message"]["content"]
-                                    logger.debug(f"Extracted content: {content}")
-                                    return content
-                                else:
-                                    raise Exception("No choices in API response")
-                                    
-                            except json.JSONDecodeError as e:
-                                error_msg = f"Failed to parse API response: {e}"
-                                logger.error(f"{error_msg}. Response: {response_text}")
-                                
-                                # Registra métricas de erro
-                                metrics_logger.log_metrics(
-                                    agent=agent_name,
-                                    model=self.model,
-                                    prompt_tokens=int(estimated_prompt_tokens),
-                                    completion_tokens=0,
-                                    total_tokens=int(estimated_prompt_tokens),
-                                    response_time_ms=response_time_ms,
-                                    status='error',
-                                    error_message=error_msg,
-                                    npc_id=npc_id,
-                                    attempt_number=attempt + 1,
-                                )
-                                
-                                raise Exception(error_msg) from e
-                                
-                        except aiohttp.ClientResponseError as e:
-                            # Log detalhado apenas na primeira tentativa ou se for erro não-retryable
-                            if attempt == 0 or e.status < 500:
-                                logger.error(f"API request failed with status {e.status}: {e.message}")
-                                logger.error(f"Response headers: {e.headers}")
-                                logger.error(f"Response body: {response_text}")
-                            else:
-                                # Para retries de erro 5xx, log mais conciso
-                                logger.warning(f"API request failed with status {e.status} (attempt {attempt + 1}/{self.max_retries}): {e.message}")
-                            
-                            # Registra métricas de erro
-                            metrics_logger.log_metrics(
-                                agent=agent_name,
-                                model=self.model,
-                                prompt_tokens=int(estimated_prompt_tokens),
-                                completion_tokens=0,
-                                total_tokens=int(estimated_prompt_tokens),
-                                response_time_ms=response_time_ms,
-                                status='error',
-                                error_message=f"HTTP {e.status}: {e.message}",
-                                npc_id=npc_id,
-                                attempt_number=attempt + 1,
-                            )
-                            
-                            raise
-                
+                hedge_delay_s = self._hedge_delay_s(agent_name)
+                if hedge_delay_s is None:
+                    result = await self._admitted_attempt(
+                        data, prompt_token_count, agent_name, npc_id, attempt, cache_status
+                    )
+                else:
+                    result = await self._hedged_attempt(
+                        data, prompt_token_count, agent_name, npc_id, attempt, cache_status, hedge_delay_s
+                    )
+                breaker.record_success()
+                return result
+            
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
+            
             except Exception as e:
                 last_error = e
+                retryable = self.retry_policy.is_retryable(e)
+                if self.retry_policy.is_upstream_failure(e):
+                    breaker.record_failure(str(e)[:200])
+                else:
+                    breaker.release_probe()
+                
                 # Log detalhado apenas na primeira tentativa
                 if attempt == 0:
-                    logger.error(f"Attempt {attempt + 1} failed: {str(e)}", exc_info=True)
+                    logger.error("Attempt %d failed: %s", attempt + 1, e, exc_info=True)
                 else:
-                    logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
+                    logger.warning("Attempt %d failed: %s", attempt + 1, e)
                 
                 # Registra métricas de erro para exceções gerais
                 if attempt == 0:  # Registra apenas na primeira tentativa para evitar duplicatas
                     metrics_logger.log_metrics(
                         agent=agent_name,
                         model=self.model,
-                        prompt_tokens=int(estimated_prompt_tokens),
+                        prompt_tokens=prompt_token_count,
                         completion_tokens=0,
-                        total_tokens=int(estimated_prompt_tokens),
+                        total_tokens=prompt_token_count,
                         response_time_ms=0,
                         status='error',
                         error_message=str(e),
@@ -298,32 +740,479 @@ class LLMHarness:
                         attempt_number=attempt + 1,
                     )
                 
+                if not retryable:
+                    logger.error("Non-retryable error for %s; giving up", agent_name)
+                    break
                 if attempt < self.max_retries - 1:
-                    # Exponential backoff
-                    wait_time = (2 ** attempt) * 0.5
-                    logger.info(f"Retrying in {wait_time:.1f} seconds...")
-                    await asyncio.sleep(wait_time)
+                    # Decorrelated jitter (ou o Retry-After informado pelo provedor)
+                    delay = self.retry_policy.next_delay(delay, e)
+                    logger.info("Retrying in %.1f seconds...", delay)
+                    await asyncio.sleep(delay)
                 
         # If we've exhausted all retries, raise the last error
-        error_msg = f"Failed after {self.max_retries} attempts. Last error: {str(last_error)}"
+        error_msg = f"Failed after {attempts} attempts. Last error: {str(last_error)}"
         logger.error(error_msg)
         
         # Registra métrica final de falha
         metrics_logger.log_metrics(
             agent=agent_name,
             model=self.model,
-            prompt_tokens=int(estimated_prompt_tokens),
+            prompt_tokens=prompt_token_count,
             completion_tokens=0,
-            total_tokens=int(estimated_prompt_tokens),
+            total_tokens=prompt_token_count,
             response_time_ms=0,
             status='error',
             error_message=error_msg,
             npc_id=npc_id,
-            attempt_number=self.max_retries,
+            attempt_number=attempts,
+        )
+        
+        raise Exception(error_msg) from last_error
+
+    async def _on_circuit_open(
+        self,
+        formatted_messages: List[Dict[str, Any]],
+        prompt_token_count: int,
+        agent_name: str,
+        npc_id: Optional[str],
+        cache_status: Optional[str],
+        attempt: int,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Breaker aberto: desvia para o modelo de fallback ou falha sem ir ao provedor."""
+        harness = self._circuit_fallback(agent_name, npc_id, attempt)
+        if harness is not None:
+            return await harness._request(formatted_messages, prompt_token_count, agent_name, npc_id, cache_status)
+        raise CircuitOpenError(f"Circuit breaker open for model {self.model}")
+
+    def _circuit_fallback(self, agent_name: str, npc_id: Optional[str], attempt: int) -> Optional["LLMHarness"]:
+        """Registra o `circuit_open` e devolve uma cópia do harness no modelo de fallback (ou None)."""
+        fallback = self.fallback_model if self.fallback_model != self.model else None
+        get_metrics_logger().log_metrics(
+            agent=agent_name,
+            model=self.model,
+            prompt_tokens=0,
+            completion_tokens=0,
+            total_tokens=0,
+            response_time_ms=0,
+            status='circuit_open',
+            error_message=f"fallback -> {fallback}" if fallback else None,
+            npc_id=npc_id,
+            attempt_number=attempt + 1,
+            lane=self.lane,
+        )
+        if not fallback:
+            return None
+        logger.warning("Circuit open for %s; falling back to %s (%s)", self.model, fallback, agent_name)
+        harness = copy.copy(self)
+        harness.model = fallback
+        harness.fallback_model = None
+        return harness
+
+    def _check_overrun(self, finish_reason: Optional[str], completion_tokens: int, agent_name: str) -> None:
+        """Resposta cortada pelo teto de tokens do perfil: vira evento `completion_overrun`."""
+        if finish_reason != "length":
+            return
+        logger.warning(
+            "%s: completion hit max_tokens=%s (%s tokens); output truncated (profile=%s)",
+            agent_name,
+            self.max_tokens,
+            completion_tokens,
+            self.profile,
+        )
+        get_metrics_logger().log_event(
+            event="completion_overrun",
+            model=self.model,
+            detail=agent_name,
+            value=completion_tokens,
+            reason=f"max_tokens={self.max_tokens}",
+        )
+
+    def _hedge_delay_s(self, agent_name: str) -> Optional[float]:
+        """Atraso até disparar a requisição duplicada, ou None se hedging não se aplica.
+
+        O gatilho é o percentil configurado da latência recente deste agente/modelo,
+        medido ao vivo pelo MetricsLogger; sem amostras suficientes, não há hedge.
+        """
+        if self.hedge_percentile is None:
+            return None
+        threshold_ms = get_metrics_logger().latency_percentile(agent_name, self.model, self.hedge_percentile)
+        if threshold_ms is None:
+            return None
+        return max(threshold_ms, self.hedge_min_delay_ms) / 1000.0
+
+    async def _admitted_attempt(
+        self,
+        data: Dict[str, Any],
+        prompt_token_count: int,
+        agent_name: str,
+        npc_id: Optional[str],
+        attempt: int,
+        cache_status: Optional[str],
+        hedge_role: Optional[str] = None,
+        hedge_state: Optional[Dict[str, bool]] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Uma tentativa passando pelo scheduler de admissão.
+
+        Se a task for cancelada com a requisição em voo, a conexão HTTP é abortada
+        (o cancelamento chega ao `await` do backend) e a linha de métricas sai com
+        status 'cancelled' (ou 'hedge_lost', para o perdedor de um hedge decidido).
+        """
+        scheduler = get_scheduler()
+        # Admissão por modelo: respeita concorrência/TPM e a prioridade da lane
+        ticket = await scheduler.acquire(
+            self.model,
+            self.lane,
+            prompt_token_count + data["max_tokens"],
+        )
+        start_time = time.time()
+        try:
+            return await self._attempt(
+                data, prompt_token_count, agent_name, npc_id, attempt, cache_status, ticket, hedge_role
+            )
+        except asyncio.CancelledError:
+            lost = hedge_state is not None and hedge_state.get("settled", False)
+            # O prompt já foi enviado e é cobrado mesmo assim; a completion abortada não é conhecida
+            get_metrics_logger().log_metrics(
+                agent=agent_name,
+                model=self.model,
+                prompt_tokens=prompt_token_count,
+                completion_tokens=0,
+                total_tokens=prompt_token_count,
+                response_time_ms=(time.time() - start_time) * 1000,
+                status='hedge_lost' if lost else 'cancelled',
+                npc_id=npc_id,
+                attempt_number=attempt + 1,
+                queue_wait_ms=ticket.wait_ms,
+                lane=self.lane,
+                hedge=hedge_role,
+            )
+            if not lost:
+                logger.info("%s: request cancelled in flight (attempt %d)", agent_name, attempt + 1)
+            raise
+        finally:
+            scheduler.release(ticket)
+
+    async def _hedged_attempt(
+        self,
+        data: Dict[str, Any],
+        prompt_token_count: int,
+        agent_name: str,
+        npc_id: Optional[str],
+        attempt: int,
+        cache_status: Optional[str],
+        hedge_delay_s: float,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Dispara uma duplicata se a primária passar do atraso; fica com a primeira resposta válida."""
+        # settled=True: os cancelamentos abaixo são de perdedores, não do chamador
+        state = {"settled": False}
+
+        def start(role: str) -> asyncio.Task:
+            return asyncio.ensure_future(self._admitted_attempt(
+                data, prompt_token_count, agent_name, npc_id, attempt, cache_status, hedge_role=role, hedge_state=state
+            ))
+
+        primary = start("primary")
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay_s)
+            if not done:
+                logger.info("Hedging %s after %.0f ms", agent_name, hedge_delay_s * 1000)
+                tasks.append(start("hedge"))
+            last_error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        state["settled"] = True
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error  # type: ignore[misc]
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _attempt(
+        self,
+        data: Dict[str, Any],
+        prompt_token_count: int,
+        agent_name: str,
+        npc_id: Optional[str],
+        attempt: int,
+        cache_status: Optional[str],
+        ticket: "AdmissionTicket",
+        hedge_role: Optional[str] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Uma única tentativa de POST /chat/completions (sem retry)."""
+        metrics_logger = get_metrics_logger()
+        logger.debug("Sending request to OpenAI API: %s", lazy_json(data))
+        
+        start_time = time.time()
+        try:
+            result = await self.backend.chat(data, timeout=self.timeout, agent=agent_name, api_key=self.api_key)
+        except LLMHTTPError as e:
+            response_time_ms = (time.time() - start_time) * 1000
+            # Log detalhado apenas na primeira tentativa ou se for erro não-retryable
+            if attempt == 0 or not self.retry_policy.is_retryable(e):
+                logger.error("API request failed with status %s: %s", e.status, e)
+                logger.error("Response body: %s", e.body)
+            else:
+                # Para retries de erro 5xx, log mais conciso
+                logger.warning("API request failed with status %s (attempt %d/%d): %s", e.status, attempt + 1, self.max_retries, e)
+            
+            # Registra métricas de erro
+            metrics_logger.log_metrics(
+                agent=agent_name,
+                model=self.model,
+                prompt_tokens=prompt_token_count,
+                completion_tokens=0,
+                total_tokens=prompt_token_count,
+                response_time_ms=response_time_ms,
+                status='error',
+                error_message=f"HTTP {e.status}: {e}",
+                npc_id=npc_id,
+                attempt_number=attempt + 1,
+                queue_wait_ms=ticket.wait_ms,
+                lane=self.lane,
+                hedge=hedge_role,
+            )
+            raise
+        except LLMResponseError as e:
+            response_time_ms = (time.time() - start_time) * 1000
+            error_msg = str(e)
+            logger.error(error_msg)
+            
+            # Registra métricas de erro
+            metrics_logger.log_metrics(
+                agent=agent_name,
+                model=self.model,
+                prompt_tokens=prompt_token_count,
+                completion_tokens=0,
+                total_tokens=prompt_token_count,
+                response_time_ms=response_time_ms,
+                status='error',
+                error_message=error_msg,
+                npc_id=npc_id,
+                attempt_number=attempt + 1,
+                queue_wait_ms=ticket.wait_ms,
+                lane=self.lane,
+                hedge=hedge_role,
+            )
+            raise
+        response_time_ms = (time.time() - start_time) * 1000
+        
+        logger.debug("Parsed API response: %s", lazy_json(result))
+        
+        # Extrai informações de uso (tokens)
+        usage = result.get("usage", {})
+        prompt_tokens = usage.get("prompt_tokens", prompt_token_count)
+        completion_tokens = usage.get("completion_tokens", 0)
+        total_tokens = usage.get("total_tokens", prompt_tokens + completion_tokens)
+        ticket.used_tokens = total_tokens
+        choices = result.get("choices") or []
+        finish_reason = choices[0].get("finish_reason") if choices else None
+        self._check_overrun(finish_reason, completion_tokens, agent_name)
+        
+        # Registra métricas de sucesso
+        metrics_logger.log_metrics(
+            agent=agent_name,
+            model=self.model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=total_tokens,
+            response_time_ms=response_time_ms,
+            status='success',
+            npc_id=npc_id,
+            attempt_number=attempt + 1,
+            tokens_per_sec=(completion_tokens / (response_time_ms / 1000)) if response_time_ms > 0 else None,
+            cache_status=cache_status,
+            queue_wait_ms=ticket.wait_ms,
+            lane=self.lane,
+            hedge=hedge_role,
+            cached_tokens=_cached_prompt_tokens(usage),
+            finish_reason=finish_reason,
+            max_tokens=data["max_tokens"],
         )
         
-        raise Exception(error_msg)
+        # Extract the content from the response
+        if "choices" in result and len(result["choices"]) > 0:
+            content = result["choices"][0]["message"]["content"]
+            logger.debug("Extracted content: %s", content)
+            return content, usage
+        raise Exception("No choices in API response")
     
+    async def run_stream(self, messages: Any, agent_name: Optional[str] = None, npc_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Variante em streaming de `run`: produz os deltas de texto conforme chegam (SSE).
+
+        Registra as mesmas métricas de `run`, mais `ttft_ms` (tempo até o primeiro
+        token) e `tokens_per_sec`. Só há retry enquanto nenhum token foi entregue;
+        depois disso, um erro no meio do stream é propagado ao chamador.
+
+        Args:
+            messages: Mensagens para enviar ao LLM
+            agent_name: Nome do agente (opcional, lido do contexto de atribuição se não fornecido)
+            npc_id: ID do NPC (opcional, lido do contexto de atribuição se não fornecido)
+        """
+        last_error = None
+        metrics_logger = get_metrics_logger()
+
+        if agent_name is None:
+            agent_name = self._detect_calling_agent()
+        if npc_id is None:
+            npc_id = current_call_context().npc_id
+
+        self._check_api_key()
+
+        formatted_messages = self._format_messages(messages)
+        formatted_messages, prompt_token_count = self._enforce_prompt_budget(
+            formatted_messages, agent_name, npc_id, self._dynamic_sections(messages)
+        )
+        data = self._build_payload(formatted_messages, stream=True)
+        scheduler = get_scheduler()
+        breaker = get_circuit_breaker(self.model)
+        delay: Optional[float] = None
+        attempts = 0
+
+        for attempt in range(self.max_retries):
+            if not breaker.allow():
+                # Mesmo desvio de `_request`: modelo de fallback ou falha rápida
+                harness = self._circuit_fallback(agent_name, npc_id, attempt)
+                if harness is None:
+                    raise CircuitOpenError(f"Circuit breaker open for model {self.model}")
+                async for delta in harness.run_stream(formatted_messages, agent_name=agent_name, npc_id=npc_id):
+                    yield delta
+                return
+            attempts = attempt + 1
+            first_token_time: Optional[float] = None
+            pieces: List[str] = []
+            usage: Dict[str, Any] = {}
+            finish_reason: Optional[str] = None
+            ticket: Optional[AdmissionTicket] = None
+            start_time = time.time()
+            try:
+                ticket = await scheduler.acquire(
+                    self.model,
+                    self.lane,
+                    prompt_token_count + data["max_tokens"],
+                )
+                start_time = time.time()
+                chunks = self.backend.chat_stream(data, timeout=self.timeout, agent=agent_name, api_key=self.api_key)
+                try:
+                    async for chunk in chunks:
+                        if chunk.get("usage"):
+                            usage = chunk["usage"]
+                        for choice in chunk.get("choices") or []:
+                            finish_reason = choice.get("finish_reason") or finish_reason
+                            delta = (choice.get("delta") or {}).get("content")
+                            if delta:
+                                if first_token_time is None:
+                                    first_token_time = time.time()
+                                pieces.append(delta)
+                                yield delta
+                finally:
+                    # Fecha a resposta HTTP mesmo se o chamador abandonar o stream
+                    await chunks.aclose()
+                if usage.get("total_tokens") is not None:
+                    ticket.used_tokens = usage["total_tokens"]
+                breaker.record_success()
+            except (asyncio.CancelledError, GeneratorExit):
+                breaker.release_probe()
+                if ticket is not None:
+                    # Stream abortado (task cancelada ou consumidor desistiu): registra o gasto até aqui
+                    completion_tokens = count_text_tokens("".join(pieces), self.model) if pieces else 0
+                    metrics_logger.log_metrics(
+                        agent=agent_name,
+                        model=self.model,
+                        prompt_tokens=prompt_token_count,
+                        completion_tokens=completion_tokens,
+                        total_tokens=prompt_token_count + completion_tokens,
+                        response_time_ms=(time.time() - start_time) * 1000,
+                        status='cancelled',
+                        npc_id=npc_id,
+                        attempt_number=attempt + 1,
+                        ttft_ms=(first_token_time - start_time) * 1000 if first_token_time is not None else None,
+                        queue_wait_ms=ticket.wait_ms,
+                        lane=self.lane,
+                        max_tokens=data["max_tokens"],
+                    )
+                raise
+            except Exception as e:
+                last_error = e
+                if self.retry_policy.is_upstream_failure(e):
+                    breaker.record_failure(str(e)[:200])
+                else:
+                    breaker.release_probe()
+                response_time_ms = (time.time() - start_time) * 1000
+                metrics_logger.log_metrics(
+                    agent=agent_name,
+                    model=self.model,
+                    prompt_tokens=prompt_token_count,
+                    completion_tokens=0,
+                    total_tokens=prompt_token_count,
+                    response_time_ms=response_time_ms,
+                    status='error',
+                    error_message=str(e),
+                    npc_id=npc_id,
+                    attempt_number=attempt + 1,
+                    queue_wait_ms=ticket.wait_ms if ticket else None,
+                    lane=self.lane,
+                )
+                if pieces:
+                    # Já entregamos tokens ao chamador: não há como repetir de forma transparente
+                    raise
+                logger.warning("Stream attempt %d failed: %s", attempt + 1, e)
+                if not self.retry_policy.is_retryable(e):
+                    break
+                if attempt < self.max_retries - 1:
+                    delay = self.retry_policy.next_delay(delay, e)
+                    logger.info("Retrying in %.1f seconds...", delay)
+                    await asyncio.sleep(delay)
+                continue
+            finally:
+                if ticket is not None:
+                    scheduler.release(ticket)
+
+            end_time = time.time()
+            response_time_ms = (end_time - start_time) * 1000
+            ttft_ms = (first_token_time - start_time) * 1000 if first_token_time is not None else None
+            prompt_tokens = usage.get("prompt_tokens", prompt_token_count)
+            # Sem usage no stream, conta localmente o texto gerado
+            completion_tokens = usage.get("completion_tokens") or count_text_tokens("".join(pieces), self.model)
+            total_tokens = usage.get("total_tokens", prompt_tokens + completion_tokens)
+            generation_s = (end_time - first_token_time) if first_token_time is not None else 0.0
+            self._check_overrun(finish_reason, completion_tokens, agent_name)
+            metrics_logger.log_metrics(
+                agent=agent_name,
+                model=self.model,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=total_tokens,
+                response_time_ms=response_time_ms,
+                status='success',
+                npc_id=npc_id,
+                attempt_number=attempt + 1,
+                ttft_ms=ttft_ms,
+                tokens_per_sec=(completion_tokens / generation_s) if generation_s > 0 else None,
+                queue_wait_ms=ticket.wait_ms if ticket else None,
+                lane=self.lane,
+                cached_tokens=_cached_prompt_tokens(usage),
+                finish_reason=finish_reason,
+                max_tokens=data["max_tokens"],
+            )
+            return
+
+        error_msg = f"Failed after {attempts} attempts. Last error: {str(last_error)}"
+        logger.error(error_msg)
+        raise Exception(error_msg) from last_error
+
+    @staticmethod
+    async def aclose() -> None:
+        """Fecha a sessão HTTP compartilhada do loop corrente (chame antes de fechar o loop)."""
+        await close_http_sessions()
+
     def __del__(self):
-        # Avoid async cleanup here; connectors/sessions are per-call and closed by context managers
-        pass
\ No newline at end of file
+        # Avoid async cleanup here; a sessão é compartilhada por loop e fechada via aclose()/close_http_sessions()
+        pass
@@ -0,0 +1,481 @@
+"""
+Backends de LLM plugáveis para o `LLMHarness`.
+
+- `OpenAIHTTPBackend`: POST /chat/completions (inclusive SSE) em qualquer servidor
+  compatível com a API da OpenAI. `base_url` e headers configuráveis; por padrão
+  usa `OPENAI_BASE_URL` (a mesma variável do SDK da OpenAI usado em core/voice.py)
+  ou https://api.openai.com/v1.
+- `HTTPXBackend`: o mesmo protocolo via httpx, com HTTP/2 (multiplexação de
+  requisições concorrentes em poucas conexões) quando o pacote `h2` está instalado.
+- `FakeBackend`: determinístico e em processo, sem rede. Devolve saídas válidas
+  no formato de cada agente (linhas do planner, FALA_NPC/NOTA_CRITICO, JSONs do
+  crítico, emoções, contexto, relacionamento e auto_memorize), com roteiros
+  próprios por agente se desejado. Serve para rodar o `NPCGraph` offline e medir
+  o overhead do framework.
+
+O backend padrão do processo vem de `NPC_LLM_BACKEND` ("openai", "http2"/"httpx" ou "fake") e pode
+ser trocado com `set_default_backend()`; harnesses sem backend explícito sempre
+usam o padrão corrente (inclusive os criados no import dos agentes).
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import re
+import ssl
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Union
+
+import aiohttp
+
+from .http_pool import get_http_session, get_httpx_client
+from .retry_policy import LLMHTTPError, parse_retry_after
+from .serialization import JSONDecodeError, dumps, dumps_bytes, loads
+from .tokenizer import count_messages_tokens, count_text_tokens
+
+logger = logging.getLogger("npc.core.llm_backends")
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+# Contexto SSL sem verificação (o mesmo usado historicamente pelo LLMHarness)
+DEFAULT_SSL_CONTEXT = ssl.create_default_context()
+DEFAULT_SSL_CONTEXT.check_hostname = False
+DEFAULT_SSL_CONTEXT.verify_mode = ssl.CERT_NONE
+
+
+class LLMResponseError(Exception):
+    """Resposta do provedor malformada (JSON inválido)."""
+
+
+class LLMBackend:
+    """Interface: transporte de uma requisição /chat/completions já montada."""
+
+    name = "base"
+    # Se False, o harness não exige OPENAI_API_KEY
+    requires_api_key = False
+
+    async def chat(
+        self, payload: Dict[str, Any], *, timeout: float, agent: str, api_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Executa a requisição e devolve o corpo da resposta (formato da API da OpenAI).
+
+        Raises:
+            LLMHTTPError: status HTTP de erro.
+            LLMResponseError: corpo inválido.
+        """
+        raise NotImplementedError
+
+    def chat_stream(
+        self, payload: Dict[str, Any], *, timeout: float, agent: str, api_key: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Versão em streaming: produz os chunks (`chat.completion.chunk`) já decodificados."""
+        raise NotImplementedError
+
+    def synthesize_speech(self, text: str, *, voice: str, model: str, instructions: str = "") -> Optional[bytes]:
+        """TTS do backend. None significa "use o cliente de voz real" (core/voice.py)."""
+        return None
+
+
+class OpenAIHTTPBackend(LLMBackend):
+    """Servidor compatível com a API da OpenAI via aiohttp (sessão keep-alive compartilhada)."""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ):
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.api_key = api_key
+        self.extra_headers = dict(headers or {})
+        self.ssl_context = ssl_context if ssl_context is not None else DEFAULT_SSL_CONTEXT
+
+    @property
+    def requires_api_key(self) -> bool:  # type: ignore[override]
+        # Servidores locais/compatíveis normalmente não exigem chave
+        return self.base_url == DEFAULT_BASE_URL
+
+    def headers_for(self, api_key: Optional[str]) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        key = self.api_key or api_key
+        if key:
+            headers["Authorization"] = f"Bearer {key}"
+        headers.update(self.extra_headers)
+        return headers
+
+    def _post(self, payload: Dict[str, Any], timeout: float, api_key: Optional[str]):
+        # Reaproveita a sessão keep-alive do loop corrente (core/http_pool.py)
+        session = get_http_session(self.ssl_context)
+        return session.post(
+            f"{self.base_url}/chat/completions",
+            data=dumps_bytes(payload),
+            headers=self.headers_for(api_key or os.getenv("OPENAI_API_KEY")),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        )
+
+    async def chat(
+        self, payload: Dict[str, Any], *, timeout: float, agent: str, api_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        async with self._post(payload, timeout, api_key) as response:
+            response_text = await response.text()
+            logger.debug("Raw API response: %s", response_text)
+            if response.status >= 400:
+                raise LLMHTTPError(
+                    response.status,
+                    response.reason or "",
+                    retry_after=parse_retry_after(response.headers),
+                    body=response_text[:500],
+                )
+            try:
+                return loads(response_text)
+            except JSONDecodeError as e:
+                raise LLMResponseError(f"Failed to parse API response: {e}") from e
+
+    async def chat_stream(
+        self, payload: Dict[str, Any], *, timeout: float, agent: str, api_key: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        async with self._post(payload, timeout, api_key) as response:
+            if response.status >= 400:
+                body = await response.text()
+                raise LLMHTTPError(
+                    response.status,
+                    body[:500],
+                    retry_after=parse_retry_after(response.headers),
+                    body=body[:500],
+                )
+            # SSE: linhas "data: {...}" separadas por linha em branco; termina com "data: [DONE]"
+            async for raw_line in response.content:
+                # Bytes direto para o parser, sem decodificar a linha antes
+                line = raw_line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    break
+                try:
+                    yield loads(data)
+                except JSONDecodeError:
+                    logger.debug("Ignoring malformed SSE chunk: %.200r", data)
+
+
+class HTTPXBackend(OpenAIHTTPBackend):
+    """Mesmo protocolo via httpx, com HTTP/2 opcional (streams multiplexados em poucas conexões).
+
+    Requer `h2` para HTTP/2 (`pip install httpx[http2]`); sem ele usa HTTP/1.1.
+    `http_versions` conta as versões de protocolo efetivamente negociadas.
+    """
+
+    name = "httpx"
+
+    def __init__(self, *args: Any, http2: bool = True, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.http2 = http2
+        self.http_versions: Counter = Counter()
+
+    def _client(self):
+        return get_httpx_client(http2=self.http2, verify=False)
+
+    async def chat(
+        self, payload: Dict[str, Any], *, timeout: float, agent: str, api_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        response = await self._client().post(
+            f"{self.base_url}/chat/completions",
+            content=dumps_bytes(payload),
+            headers=self.headers_for(api_key or os.getenv("OPENAI_API_KEY")),
+            timeout=timeout,
+        )
+        self.http_versions[response.http_version] += 1
+        response_text = response.text
+        logger.debug("Raw API response: %s", response_text)
+        if response.status_code >= 400:
+            raise LLMHTTPError(
+                response.status_code,
+                response.reason_phrase or "",
+                retry_after=parse_retry_after(response.headers),
+                body=response_text[:500],
+            )
+        try:
+            return loads(response_text)
+        except JSONDecodeError as e:
+            raise LLMResponseError(f"Failed to parse API response: {e}") from e
+
+    async def chat_stream(
+        self, payload: Dict[str, Any], *, timeout: float, agent: str, api_key: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        async with self._client().stream(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            content=dumps_bytes(payload),
+            headers=self.headers_for(api_key or os.getenv("OPENAI_API_KEY")),
+            timeout=timeout,
+        ) as response:
+            self.http_versions[response.http_version] += 1
+            if response.status_code >= 400:
+                body = (await response.aread()).decode("utf-8", errors="replace")
+                raise LLMHTTPError(
+                    response.status_code,
+                    body[:500],
+                    retry_after=parse_retry_after(response.headers),
+                    body=body[:500],
+                )
+            async for line in response.aiter_lines():
+                line = line.strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    yield loads(data)
+                except JSONDecodeError:
+                    logger.debug("Ignoring malformed SSE chunk: %.200s", data)
+
+
+# ----------------------------------------------------------------------
+# Backend falso (determinístico, sem rede)
+# ----------------------------------------------------------------------
+
+def _last_user_text(payload: Dict[str, Any], limit: int = 60) -> str:
+    for m in reversed(payload.get("messages") or []):
+        if m.get("role") == "user":
+            text = " ".join(str(m.get("content", "")).split())
+            return text[-limit:]
+    return ""
+
+
+def _schema_name(payload: Dict[str, Any]) -> Optional[str]:
+    rf = payload.get("response_format") or {}
+    return (rf.get("json_schema") or {}).get("name")
+
+
+# Trechos dos prompts de sistema que identificam cada agente (quando não há schema nem atribuição)
+_AGENT_MARKERS = (
+    ("Planejador Interno", "planner"),
+    ("MÓDULO DE DIÁLOGO", "dialogue"),
+    ("Crítico Interno", "CriticReview"),
+    ("NÚCLEO DE TURNO RÁPIDO", "FastTurnOutput"),
+    ("EMOÇÕES DINÂMICAS", "EmotionUpdate"),
+    ("CONSCIÊNCIA CONTEXTUAL", "SceneContext"),
+    ("MÓDULO DE RELACIONAMENTOS", "RelationshipAnalysis"),
+    ("life/people/places/skills/objects", "KBUpdate"),
+)
+
+
+def infer_agent(payload: Dict[str, Any]) -> Optional[str]:
+    """Chave de `DEFAULT_FAKE_REPLIES` para uma requisição: nome do schema ou marcador do prompt."""
+    schema = _schema_name(payload)
+    if schema:
+        return schema
+    for m in payload.get("messages") or []:
+        if m.get("role") != "system":
+            continue
+        content = str(m.get("content", ""))
+        for marker, key in _AGENT_MARKERS:
+            if marker in content:
+                return key
+    return None
+
+
+def _dumps(obj: Any) -> str:
+    return dumps(obj)
+
+
+# Saídas padrão por agente (ou por nome de schema), todas no formato que o agente valida
+DEFAULT_FAKE_REPLIES: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "planner": lambda p: (
+        "INTENÇÃO: responder com cautela e manter a conversa\n"
+        "NEEDS_WORLD: no\n"
+        "WORLD_QUERY: \n"
+        "PLAN: ouvir o jogador e medir as intenções dele\n"
+        "CURRENT_GOAL: responder de forma curta\n"
+        "PERCEIVED_CONTEXT: o jogador puxou conversa\n"
+        "ENVIRONMENTAL_CUES: ambiente calmo\n"
+        "PERSONALITY_ANALYSIS: desconfiada, mas curiosa\n"
+        "EMOTIONAL_STATE: alerta\n"
+        "RELEVANT_MEMORIES: nenhuma\n"
+        "WORLD_KNOWLEDGE: conhece as rotas do vale"
+    ),
+    "dialogue": lambda p: (
+        "FALA_NPC:\n"
+        "Hm... e por que cê quer saber disso?\n"
+        "\n"
+        "NOTA_CRITICO:\n"
+        "- coerencia_plano_objetivo: ok\n"
+        "- aderencia_personalidade_emocao: ok\n"
+        "- risco_conteudo: baixo\n"
+        "- observacoes: nenhuma"
+    ),
+    "CriticReview": lambda p: _dumps({"fala": "Hm... e por que cê quer saber disso?", "justificativa": ""}),
+    "FastTurnOutput": lambda p: _dumps({
+        "intencao": "responder com cautela e manter a conversa",
+        "plano": "ouvir o jogador e medir as intenções dele",
+        "fala": "Hm... e por que cê quer saber disso?",
+        "notas_critico": "",
+    }),
+    "EmotionUpdate": lambda p: _dumps({
+        "emotions": {"vigilância": 0.6, "empatia": 0.4, "confiança": 0.4, "medo": 0.2,
+                     "raiva": 0.1, "alegria": 0.3, "tristeza": 0.1, "curiosidade": 0.6},
+        "justificativa": "interação neutra",
+    }),
+    "SceneContext": lambda p: _dumps({
+        "perceived_context": "O jogador conversa com o NPC.",
+        "environmental_cues": "Ambiente calmo.",
+        "needs_world": False,
+        "world_query": None,
+    }),
+    "RelationshipAnalysis": lambda p: _dumps({
+        "character_name": "Jogador",
+        "updates": {"trust": 0.5},
+        "interaction_event": "conversa",
+        "interaction_impact": {"trust": 0.0},
+    }),
+    "KBUpdate": lambda p: _dumps({"life": [], "people": [], "places": [], "skills": [], "objects": []}),
+}
+
+# Roteiro: texto (template com {user}, {agent}, {model}, {n}), lista (usada em ciclo) ou função(payload) -> texto.
+# Só esses marcadores são substituídos: outras chaves (ex.: JSON literal) passam intactas.
+FakeScript = Union[str, List[str], Callable[[Dict[str, Any]], str]]
+_PLACEHOLDER_RE = re.compile(r"\{(user|agent|model|n)\}")
+
+
+class FakeBackend(LLMBackend):
+    """Backend em processo com respostas roteirizadas por agente (ou nome de schema)."""
+
+    name = "fake"
+
+    def __init__(
+        self,
+        scripts: Optional[Dict[str, FakeScript]] = None,
+        latency_s: float = 0.0,
+        chunk_words: int = 3,
+    ):
+        self.scripts: Dict[str, FakeScript] = dict(scripts or {})
+        self.latency_s = latency_s
+        self.chunk_words = chunk_words
+        self.calls = 0
+        self._cycles: Dict[str, Iterable[str]] = {}
+
+    def _resolve(self, key: str) -> Optional[FakeScript]:
+        if key in self.scripts:
+            return self.scripts[key]
+        return DEFAULT_FAKE_REPLIES.get(key)
+
+    def reply_for(self, payload: Dict[str, Any], agent: Optional[str] = None) -> str:
+        """Texto de resposta determinístico: roteiro do agente, do schema ou do agente inferido pelo prompt."""
+        key = next((k for k in (agent, _schema_name(payload), infer_agent(payload)) if k and self._resolve(k) is not None), None)
+        script = self._resolve(key) if key else None
+        self.calls += 1
+        if script is None:
+            return _dumps({}) if payload.get("response_format") else "ok"
+        if callable(script):
+            return script(payload)
+        if isinstance(script, list):
+            cycle = self._cycles.setdefault(key, itertools.cycle(script))  # type: ignore[arg-type]
+            script = next(cycle)  # type: ignore[call-overload]
+        values = {"user": _last_user_text(payload), "agent": agent, "model": payload.get("model", ""), "n": self.calls}
+        return _PLACEHOLDER_RE.sub(lambda m: str(values[m.group(1)]), script)
+
+    @staticmethod
+    def _capped(payload: Dict[str, Any], content: str):
+        """Corta a resposta em `max_tokens`, como o provedor faria (finish_reason='length')."""
+        max_tokens = payload.get("max_tokens")
+        if not max_tokens:
+            return content, "stop"
+        model = payload.get("model", "gpt-4o")
+        tokens = count_text_tokens(content, model)
+        if tokens <= max_tokens:
+            return content, "stop"
+        cut = content[: int(len(content) * max_tokens / tokens)]
+        while cut and count_text_tokens(cut, model) > max_tokens:
+            cut = cut[: int(len(cut) * 0.9)]
+        return cut, "length"
+
+    def usage_for(self, payload: Dict[str, Any], content: str) -> Dict[str, Any]:
+        model = payload.get("model", "gpt-4o")
+        prompt_tokens = count_messages_tokens(payload.get("messages") or [], model)
+        completion_tokens = count_text_tokens(content, model)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    async def chat(
+        self, payload: Dict[str, Any], *, timeout: float, agent: str, api_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        content, finish_reason = self._capped(payload, self.reply_for(payload, agent))
+        return {
+            "object": "chat.completion",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+            "usage": self.usage_for(payload, content),
+        }
+
+    async def chat_stream(
+        self, payload: Dict[str, Any], *, timeout: float, agent: str, api_key: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        content, finish_reason = self._capped(payload, self.reply_for(payload, agent))
+        words = content.split(" ")
+        for i in range(0, len(words), self.chunk_words):
+            piece = " ".join(words[i:i + self.chunk_words])
+            last = i + self.chunk_words >= len(words)
+            if not last:
+                piece += " "
+            yield {"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": finish_reason if last else None}]}
+            await asyncio.sleep(0)
+        yield {"choices": [], "usage": self.usage_for(payload, content)}
+
+    def synthesize_speech(self, text: str, *, voice: str, model: str, instructions: str = "") -> Optional[bytes]:
+        return silent_mp3(speech_duration_s(text))
+
+
+# MPEG-1 Layer III, 32 kbps, 44.1 kHz, mono: quadros de 104 bytes com ~26 ms de silêncio
+_MP3_FRAME = b"\xff\xfb\x10\xc4" + bytes(100)
+_MP3_FRAME_S = 1152 / 44100
+
+
+def speech_duration_s(text: str, chars_per_s: float = 15.0) -> float:
+    """Duração aproximada da fala de `text` (ritmo de conversa)."""
+    return max(0.3, len(text) / chars_per_s)
+
+
+def silent_mp3(duration_s: float) -> bytes:
+    """MP3 válido de silêncio com a duração pedida (respostas de TTS falsas)."""
+    return _MP3_FRAME * max(1, int(duration_s / _MP3_FRAME_S))
+
+
+# ----------------------------------------------------------------------
+# Backend padrão do processo
+# ----------------------------------------------------------------------
+
+_default_backend: Optional[LLMBackend] = None
+
+
+def get_default_backend() -> LLMBackend:
+    """Backend padrão (NPC_LLM_BACKEND: 'openai' (aiohttp), 'http2'/'httpx' ou 'fake')."""
+    global _default_backend
+    if _default_backend is None:
+        kind = os.getenv("NPC_LLM_BACKEND", "openai").strip().lower()
+        if kind == "fake":
+            _default_backend = FakeBackend()
+        elif kind in ("http2", "httpx"):
+            _default_backend = HTTPXBackend(http2=(kind == "http2"))
+        elif kind in ("openai", "http", ""):
+            _default_backend = OpenAIHTTPBackend()
+        else:
+            raise ValueError(f"NPC_LLM_BACKEND inválido: {kind!r}")
+    return _default_backend
+
+
+def set_default_backend(backend: Optional[LLMBackend]) -> None:
+    """Troca o backend padrão do processo (None volta a ler NPC_LLM_BACKEND)."""
+    global _default_backend
+    _default_backend = backend
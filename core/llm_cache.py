@@ -0,0 +1,254 @@
+"""
+Cache persistente de respostas LLM, endereçado por conteúdo.
+
+A chave é um hash estável de (model, temperature, max_tokens, mensagens
+normalizadas). Há dois níveis:
+- memória: LRU com TTL e limite de itens;
+- disco: um arquivo JSON por entrada em `cache/llm/<aa>/<hash>.json`, com TTL e
+  limite de arquivos (os mais antigos são removidos primeiro).
+
+Em código assíncrono use `aget`/`aset`: a memória é consultada na hora e o
+acesso ao disco (leitura, gravação e a poda periódica) roda no executor padrão,
+sem bloquear o event loop. O lock protege só o LRU e os contadores.
+
+Útil para agentes de baixa temperatura que repetem prompts idênticos
+(ex.: auto_memorize, relationship) e para replays de cena.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .serialization import canonical_dumps, read_json, write_json
+
+logger = logging.getLogger("npc.core.llm_cache")
+
+
+def _normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Mantém apenas campos relevantes e remove espaços nas bordas do conteúdo."""
+    norm = []
+    for m in messages:
+        item = {"role": m.get("role", "user"), "content": str(m.get("content", "")).strip()}
+        if m.get("name"):
+            item["name"] = m["name"]
+        norm.append(item)
+    return norm
+
+
+def cache_key(
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    messages: List[Dict[str, Any]],
+    response_format: Optional[Dict[str, Any]] = None,
+    stop: Optional[List[str]] = None,
+) -> str:
+    """Hash estável (sha256) de uma requisição /chat/completions."""
+    payload = {
+        "model": model,
+        "temperature": round(float(temperature), 4),
+        "max_tokens": max_tokens,
+        "messages": _normalize_messages(messages),
+    }
+    if response_format:
+        payload["response_format"] = response_format
+    if stop:
+        payload["stop"] = list(stop)
+    blob = canonical_dumps(payload)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Cache LRU em memória + armazenamento em disco, ambos com TTL."""
+
+    def __init__(
+        self,
+        cache_dir: str = "cache/llm",
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_memory_items: int = 512,
+        max_disk_items: int = 5000,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.lock = threading.Lock()
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._writes_since_prune = 0
+        self._pruning = False
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return self.ttl_seconds > 0 and (time.time() - entry.get("created_at", 0)) > self.ttl_seconds
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._memory.pop(key, None)
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _load_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        """Lê a entrada do disco (sem o lock); remove o arquivo se corrompido/expirado."""
+        p = self._path(key)
+        if not p.exists():
+            return None
+        try:
+            entry = read_json(p)
+        except Exception:
+            entry = None
+        if entry is None or self._expired(entry):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _finish_get(self, key: str, entry: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._remember(key, entry)
+            self.hits += 1
+            return entry
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Retorna a entrada ({content, usage, ...}) ou None se ausente/expirada."""
+        entry = self._get_memory(key)
+        if entry is not None:
+            return entry
+        return self._finish_get(key, self._load_disk(key))
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """Como `get`, mas a leitura do disco roda no executor (fora do event loop)."""
+        entry = self._get_memory(key)
+        if entry is not None:
+            return entry
+        loop = asyncio.get_running_loop()
+        return self._finish_get(key, await loop.run_in_executor(None, self._load_disk, key))
+
+    def _new_entry(self, key: str, content: str, usage: Optional[Dict[str, Any]], model: Optional[str]) -> Dict[str, Any]:
+        entry = {
+            "key": key,
+            "model": model,
+            "created_at": time.time(),
+            "content": content,
+            "usage": usage or {},
+        }
+        with self.lock:
+            self._remember(key, entry)
+        return entry
+
+    def _store_disk(self, key: str, entry: Dict[str, Any]) -> None:
+        """Grava a entrada no disco (sem o lock) e poda a cada 100 gravações."""
+        p = self._path(key)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            # Nome temporário por thread: gravações concorrentes da mesma chave não se atropelam
+            tmp = p.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            write_json(tmp, entry)
+            os.replace(tmp, p)
+        except OSError as e:
+            logger.warning("llm_cache: falha ao gravar %s: %s", p, e)
+            return
+        with self.lock:
+            self._writes_since_prune += 1
+            prune = self._writes_since_prune >= 100 and not self._pruning
+            if prune:
+                self._writes_since_prune = 0
+                self._pruning = True
+        if prune:
+            try:
+                self._prune_disk()
+            finally:
+                self._pruning = False
+
+    def set(self, key: str, content: str, usage: Optional[Dict[str, Any]] = None, model: Optional[str] = None) -> None:
+        self._store_disk(key, self._new_entry(key, content, usage, model))
+
+    async def aset(self, key: str, content: str, usage: Optional[Dict[str, Any]] = None, model: Optional[str] = None) -> None:
+        """Como `set`: a memória é atualizada na hora; gravação e poda do disco rodam no executor."""
+        entry = self._new_entry(key, content, usage, model)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._store_disk, key, entry)
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self) -> None:
+        """Remove entradas expiradas e, acima do limite, as mais antigas (por mtime)."""
+        if not self.cache_dir.exists():
+            return
+        files = []
+        for f in self.cache_dir.glob("*/*.json"):
+            try:
+                files.append((f.stat().st_mtime, f))
+            except OSError:
+                # Removido por outra thread/processo entre o glob e o stat
+                continue
+        files.sort(key=lambda item: item[0])
+        now = time.time()
+        excess = len(files) - self.max_disk_items
+        for i, (mtime, f) in enumerate(files):
+            too_old = self.ttl_seconds > 0 and (now - mtime) > self.ttl_seconds
+            if i < excess or too_old:
+                try:
+                    f.unlink()
+                except OSError:
+                    pass
+
+    def clear(self) -> None:
+        with self.lock:
+            self._memory.clear()
+            for f in self.cache_dir.glob("*/*.json"):
+                try:
+                    f.unlink()
+                except OSError:
+                    pass
+
+
+# Instância global do cache (habilitada via NPC_LLM_CACHE=1 ou por harness)
+_global_cache: Optional[LLMResponseCache] = None
+
+
+def cache_enabled_by_env() -> bool:
+    return os.getenv("NPC_LLM_CACHE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Retorna a instância global do cache (configurável via ambiente)."""
+    global _global_cache
+    if _global_cache is None:
+        _global_cache = LLMResponseCache(
+            cache_dir=os.getenv("NPC_LLM_CACHE_DIR", "cache/llm"),
+            ttl_seconds=float(os.getenv("NPC_LLM_CACHE_TTL", str(7 * 24 * 3600))),
+            max_memory_items=int(os.getenv("NPC_LLM_CACHE_MEMORY_ITEMS", "512")),
+            max_disk_items=int(os.getenv("NPC_LLM_CACHE_DISK_ITEMS", "5000")),
+        )
+    return _global_cache
+
+
+def set_llm_cache(cache: Optional[LLMResponseCache]):
+    """Define a instância global do cache."""
+    global _global_cache
+    _global_cache = cache
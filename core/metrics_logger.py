@@ -3,43 +3,107 @@ Módulo para logging de métricas de uso da API (LLM, TTS, Transcription) em arq
 """
 
 import csv
+import math
 import os
+from collections import OrderedDict, deque
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Deque, Dict, Optional, Tuple
 import threading
 
+from .call_context import current_call_context
+
+
+# Colunas do CSV de métricas LLM (novas colunas entram sempre no final)
+LLM_METRICS_COLUMNS = [
+    'timestamp',
+    'agent',
+    'model',
+    'prompt_tokens',
+    'completion_tokens',
+    'total_tokens',
+    'response_time_ms',
+    'status',
+    'error_message',
+    'npc_id',
+    'attempt_number',
+    'ttft_ms',  # Streaming: tempo até o primeiro token
+    'tokens_per_sec',  # Tokens de completion por segundo
+    'cache',  # Cache de respostas: 'hit', 'miss' ou vazio (desabilitado)
+    'coalesced',  # 1 se o chamador reaproveitou uma requisição idêntica em andamento
+    'queue_wait_ms',  # Espera na fila de admissão do scheduler
+    'lane',  # Lane de prioridade ('interactive' ou 'background')
+    'hedge',  # Requisições com hedging: 'primary' ou 'hedge'
+    'thread_id',  # Do contexto de atribuição do turno
+    'turn_id',
+    'cached_tokens',  # prompt_tokens_details.cached_tokens (cache de prefixo do provedor)
+    'finish_reason',  # 'stop', 'length' (bateu no teto de max_tokens) etc.
+    'max_tokens',  # Teto de completion enviado (perfil de geração do agente)
+]
+
+# Status de chamadas que chegaram ao provedor e consomem tokens (desperdício em turnos cancelados)
+BILLED_STATUSES = ('success', 'cancelled', 'hedge_lost')
+
+# Colunas do CSV de eventos operacionais (circuit breaker etc.)
+EVENT_COLUMNS = [
+    'timestamp',
+    'event',  # Tipo do evento (ex: 'circuit_breaker')
+    'model',
+    'detail',  # Ex: transição 'closed->open'
+    'value',  # Valor numérico associado (ex: falhas consecutivas)
+    'reason',
+    'npc_id',
+    'agent',
+    'turn_id',
+]
+
 
 class MetricsLogger:
     """Logger thread-safe para métricas de API em CSV."""
 
-    def __init__(self, csv_file: str = "metrics/llm_metrics.csv", audio_metrics_file: str = "metrics/audio_metrics.csv"):
+    def __init__(
+        self,
+        csv_file: str = "metrics/llm_metrics.csv",
+        audio_metrics_file: str = "metrics/audio_metrics.csv",
+        events_file: str = "metrics/llm_events.csv",
+    ):
         self.csv_file = Path(csv_file)
         self.audio_metrics_file = Path(audio_metrics_file)
+        self.events_file = Path(events_file)
         self.csv_file.parent.mkdir(parents=True, exist_ok=True)
         self.audio_metrics_file.parent.mkdir(parents=True, exist_ok=True)
+        self.events_file.parent.mkdir(parents=True, exist_ok=True)
         self.lock = threading.Lock()
+        # Janela de latências recentes (sucessos upstream) por (agente, modelo)
+        self.latency_window = 200
+        self._recent_latency: Dict[Tuple[str, str], Deque[float]] = {}
+        # Tokens gastos por turno (turn_id), para medir o desperdício de turnos cancelados
+        self.max_tracked_turns = 1024
+        self._turn_tokens: "OrderedDict[str, int]" = OrderedDict()
         self._ensure_header()
         self._ensure_audio_header()
+        self._ensure_events_header()
 
     def _ensure_header(self):
-        """Garante que o arquivo CSV tenha o cabeçalho."""
+        """Garante que o arquivo CSV tenha o cabeçalho (migrando arquivos com colunas antigas)."""
         if not self.csv_file.exists():
             with open(self.csv_file, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
-                writer.writerow([
-                    'timestamp',
-                    'agent',
-                    'model',
-                    'prompt_tokens',
-                    'completion_tokens',
-                    'total_tokens',
-                    'response_time_ms',
-                    'status',
-                    'error_message',
-                    'npc_id',
-                    'attempt_number',
-                ])
+                writer.writerow(LLM_METRICS_COLUMNS)
+            return
+
+        with open(self.csv_file, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        if rows and rows[0] == LLM_METRICS_COLUMNS:
+            return
+        # Cabeçalho antigo: reescreve com as colunas novas, completando linhas antigas com vazio
+        width = len(LLM_METRICS_COLUMNS)
+        body = rows[1:] if rows else []
+        with open(self.csv_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(LLM_METRICS_COLUMNS)
+            for row in body:
+                writer.writerow((row + [''] * width)[:width])
 
     def _ensure_audio_header(self):
         """Garante que o arquivo CSV de áudio tenha o cabeçalho."""
@@ -63,6 +127,12 @@ class MetricsLogger:
                     'language',  # Para transcrição: idioma
                 ])
 
+    def _ensure_events_header(self):
+        """Garante que o arquivo CSV de eventos tenha o cabeçalho."""
+        if not self.events_file.exists():
+            with open(self.events_file, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(EVENT_COLUMNS)
+
     def log_metrics(
         self,
         agent: str,
@@ -75,6 +145,16 @@ class MetricsLogger:
         error_message: Optional[str] = None,
         npc_id: Optional[str] = None,
         attempt_number: int = 1,
+        ttft_ms: Optional[float] = None,
+        tokens_per_sec: Optional[float] = None,
+        cache_status: Optional[str] = None,
+        coalesced: bool = False,
+        queue_wait_ms: Optional[float] = None,
+        lane: Optional[str] = None,
+        hedge: Optional[str] = None,
+        cached_tokens: Optional[int] = None,
+        finish_reason: Optional[str] = None,
+        max_tokens: Optional[int] = None,
     ):
         """
         Registra métricas de uma chamada LLM no CSV.
@@ -86,12 +166,31 @@ class MetricsLogger:
             completion_tokens: Número de tokens na resposta
             total_tokens: Total de tokens
             response_time_ms: Tempo de resposta em milissegundos
-            status: Status da chamada ('success' ou 'error')
+            status: Status da chamada ('success', 'error', 'cancelled', 'hedge_lost' ou 'circuit_open')
             error_message: Mensagem de erro (se houver)
             npc_id: ID do NPC (se disponível)
             attempt_number: Número da tentativa (para retries)
+            ttft_ms: Tempo até o primeiro token em milissegundos (streaming)
+            tokens_per_sec: Tokens de completion por segundo
+            cache_status: Resultado do cache de respostas ('hit', 'miss' ou None)
+            coalesced: Se a chamada foi atendida por outra requisição idêntica em andamento
+            queue_wait_ms: Tempo de espera na fila de admissão (scheduler) em milissegundos
+            lane: Lane de prioridade da chamada
+            hedge: Papel da requisição num hedge ('primary' ou 'hedge')
+            cached_tokens: Tokens do prompt servidos do cache de prefixo do provedor
+            finish_reason: Motivo de término informado pelo provedor ('length' = saída cortada)
+            max_tokens: Teto de tokens de completion da requisição
         """
+        ctx = current_call_context()
         with self.lock:
+            # Só respostas reais do provedor entram na janela de latência
+            if status == 'success' and cache_status != 'hit' and not coalesced:
+                window = self._recent_latency.setdefault((agent, model), deque(maxlen=self.latency_window))
+                window.append(response_time_ms)
+            if ctx.turn_id and status in BILLED_STATUSES and total_tokens:
+                self._turn_tokens[ctx.turn_id] = self._turn_tokens.pop(ctx.turn_id, 0) + total_tokens
+                if len(self._turn_tokens) > self.max_tracked_turns:
+                    self._turn_tokens.popitem(last=False)
             timestamp = datetime.now().isoformat()
             with open(self.csv_file, 'a', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
@@ -107,8 +206,37 @@ class MetricsLogger:
                     error_message or '',
                     npc_id or '',
                     attempt_number,
+                    round(ttft_ms, 2) if ttft_ms is not None else '',
+                    round(tokens_per_sec, 2) if tokens_per_sec is not None else '',
+                    cache_status or '',
+                    1 if coalesced else '',
+                    round(queue_wait_ms, 2) if queue_wait_ms is not None else '',
+                    lane or '',
+                    hedge or '',
+                    ctx.thread_id or '',
+                    ctx.turn_id or '',
+                    cached_tokens if cached_tokens is not None else '',
+                    finish_reason or '',
+                    max_tokens if max_tokens is not None else '',
                 ])
 
+    def pop_turn_tokens(self, turn_id: str) -> int:
+        """Tokens gastos no turno até agora (chamadas com resposta, canceladas ou perdedoras de hedge); esquece o turno."""
+        with self.lock:
+            return self._turn_tokens.pop(turn_id, 0)
+
+    def latency_percentile(self, agent: str, model: str, percentile: float, min_samples: int = 10) -> Optional[float]:
+        """Percentil (0-100) da latência recente de um agente/modelo, em ms.
+
+        Retorna None se ainda não houver amostras suficientes.
+        """
+        with self.lock:
+            samples = sorted(self._recent_latency.get((agent, model), ()))
+        if len(samples) < min_samples:
+            return None
+        rank = max(0, min(len(samples) - 1, math.ceil(percentile / 100.0 * len(samples)) - 1))
+        return samples[rank]
+
     def log_audio_metrics(
         self,
         service_type: str,  # 'tts' ou 'transcription'
@@ -134,7 +262,7 @@ class MetricsLogger:
             input_size_bytes: Tamanho do input em bytes
             output_size_bytes: Tamanho do output em bytes
             response_time_ms: Tempo de resposta em milissegundos
-            status: Status da chamada ('success' ou 'error')
+            status: Status da chamada ('success', 'error' ou 'cancelled')
             error_message: Mensagem de erro (se houver)
             npc_id: ID do NPC (se disponível)
             input_duration_seconds: Duração do áudio de entrada (para transcrição)
@@ -164,6 +292,39 @@ class MetricsLogger:
                     language or '',
                 ])
 
+    def log_event(
+        self,
+        event: str,
+        model: str = '',
+        detail: str = '',
+        value: Optional[float] = None,
+        reason: Optional[str] = None,
+    ):
+        """
+        Registra um evento operacional (ex: transição de estado do circuit breaker).
+
+        Args:
+            event: Tipo do evento (ex: 'circuit_breaker')
+            model: Modelo afetado
+            detail: Descrição curta (ex: 'closed->open')
+            value: Valor numérico associado (ex: falhas consecutivas)
+            reason: Motivo legível
+        """
+        ctx = current_call_context()
+        with self.lock:
+            with open(self.events_file, 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow([
+                    datetime.now().isoformat(),
+                    event,
+                    model,
+                    detail,
+                    '' if value is None else value,
+                    reason or '',
+                    ctx.npc_id or '',
+                    ctx.agent or '',
+                    ctx.turn_id or '',
+                ])
+
 
 # Instância global do logger
 _global_logger: Optional[MetricsLogger] = None
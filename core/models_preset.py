@@ -8,6 +8,45 @@ SCENE_MODEL = "gpt-4.1-mini"         # scene
 PLANNER_MODEL = "gpt-4o"
 DIALOGUE_MODEL = "gpt-4o"
 CRITIC_MODEL = "gpt-4.1"             # ou "gpt-4o" se quiser unificar
+FAST_TURN_MODEL = "gpt-4o"           # turno rápido: planner + dialogue + critic numa chamada
 
 # Voz
-TTS_MODEL = "gpt-4o-mini-tts"
\ No newline at end of file
+TTS_MODEL = "gpt-4o-mini-tts"
+
+# Hedging (opt-in) para as chamadas mais lentas do núcleo dramático (planner/dialogue):
+# percentil da latência recente do agente que dispara uma requisição duplicada (ex.: 95).
+HEDGE_PERCENTILE = None
+
+# Saídas estruturadas (core/structured_output.py): como pedir JSON ao provedor.
+# "json_schema" (guiado pelo schema do agente), "json_object" (JSON mode) ou "off" (só o parser local).
+STRUCTURED_OUTPUT_MODE = "json_schema"
+
+# Cascata de modelos (opt-in, core/cascade.py): o agente chama primeiro o modelo barato daqui e só
+# escala para o modelo acima quando a saída falha na validação (FALA_NPC vazia, JSON do crítico
+# inválido, INTENÇÃO ausente). None desliga a cascata para o agente.
+CASCADE_MODELS = {
+    "planner": None,    # ex.: "gpt-4.1-mini"
+    "dialogue": None,   # ex.: "gpt-4.1-mini"
+    "critic": None,     # ex.: "gpt-4.1-mini"
+}
+
+# Perfis de geração por agente (LLMHarness(..., profile="<agente>")): teto de tokens de completion,
+# stop sequences, timeout (s), temperatura e orçamento do prompt (max_prompt_tokens: acima dele o
+# harness corta o bloco dinâmico ou falha com PromptBudgetExceeded; NPC_LLM_MAX_PROMPT_TOKENS troca
+# o padrão). Tetos justos cortam a cauda de latência; respostas que batem no teto
+# (finish_reason=length) aparecem em `finish_reason` no CSV e como evento `completion_overrun`.
+# As temperaturas mantêm os valores de antes dos perfis (0.7; auto_memorize 0.2).
+# Argumentos explícitos do harness têm precedência sobre o perfil.
+DEFAULT_GENERATION_PROFILE = {"max_tokens": 1000, "stop": None, "timeout": 45, "temperature": 0.7, "max_prompt_tokens": 8000}
+GENERATION_PROFILES = {
+    # Núcleo dramático (lane interactive)
+    "planner": {"max_tokens": 400, "timeout": 25, "temperature": 0.7, "max_prompt_tokens": 6000},            # ~11 linhas rotuladas
+    "dialogue": {"max_tokens": 300, "timeout": 20, "temperature": 0.7, "max_prompt_tokens": 4000},           # 1–3 frases + NOTA_CRITICO
+    "critic": {"max_tokens": 300, "timeout": 20, "temperature": 0.7, "max_prompt_tokens": 6000},             # JSON {fala, justificativa}
+    "fast_turn": {"max_tokens": 400, "timeout": 25, "temperature": 0.7, "max_prompt_tokens": 8000},          # JSON {intencao, plano, fala, notas_critico}
+    # Análise em JSON pequeno
+    "dinamic_emotion": {"max_tokens": 250, "timeout": 20, "temperature": 0.7, "max_prompt_tokens": 4000},
+    "context_awareness": {"max_tokens": 300, "timeout": 20, "temperature": 0.7, "max_prompt_tokens": 6000},
+    "relationship": {"max_tokens": 300, "timeout": 30, "temperature": 0.7, "max_prompt_tokens": 4000},
+    "auto_memorize": {"max_tokens": 800, "timeout": 30, "temperature": 0.2, "max_prompt_tokens": 6000},
+}
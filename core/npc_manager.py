@@ -13,9 +13,10 @@ class NPCManager:
         persona: Optional[Persona] = None,
         *,
         initial_memories: Optional[List[Any]] = None,
+        pipeline: Optional[str] = None,
     ) -> None:
         if npc_id not in self._graphs:
-            graph = NPCGraph(persona=persona or DEFAULT_PERSONA, npc_id=npc_id)
+            graph = NPCGraph(persona=persona or DEFAULT_PERSONA, npc_id=npc_id, pipeline=pipeline)
             self._graphs[npc_id] = graph
             if initial_memories:
                 self.seed_memories(npc_id, initial_memories)
@@ -33,9 +34,21 @@ class NPCManager:
         *,
         thread_id: Optional[str] = None,
         events: Optional[List[Dict[str, Any]]] = None,
+        pipeline: Optional[str] = None,
     ) -> Dict[str, Any]:
         graph = self.get(npc_id)
-        return await graph.respond_once(user_text, thread_id=thread_id, events=events)
+        return await graph.respond_once(user_text, thread_id=thread_id, events=events, pipeline=pipeline)
+
+    async def flush(self, npc_id: Optional[str] = None) -> None:
+        """Aguarda o pós-processamento (relacionamento, KB) de um NPC ou de todos."""
+        graphs = [self._graphs[npc_id]] if npc_id is not None else list(self._graphs.values())
+        for graph in graphs:
+            await graph.flush()
+
+    async def aclose(self) -> None:
+        """Conclui o pós-processamento pendente de todos os NPCs e encerra as filas."""
+        for graph in list(self._graphs.values()):
+            await graph.aclose()
 
     def seed_memories(self, npc_id: str, entries: List[Any]) -> None:
         graph = self.get(npc_id)
@@ -0,0 +1,124 @@
+"""
+Pós-processamento do turno fora do caminho da resposta.
+
+Trabalhos que não mudam a fala (análise de relacionamento, auto_memorize pós-
+resposta) entram numa fila asyncio limitada por NPC e rodam em segundo plano,
+um de cada vez, na ordem de envio. O turno seguinte do mesmo NPC aguarda a fila
+esvaziar (`flush`) antes de começar, então sempre enxerga as atualizações
+concluídas.
+
+- Fila cheia (`NPC_POST_TURN_MAX`, padrão 8): `submit` espera vaga (backpressure)
+  em vez de descartar trabalho.
+- Cada trabalho roda com o contexto de atribuição do turno que o enviou
+  (core/call_context.py): métricas e logs continuam com npc_id/turn_id certos.
+- Falhas são logadas e viram o evento `post_turn_failed`; a fila segue.
+- A fila é por event loop: se o NPC passar a rodar em outro loop, uma nova fila
+  é criada (aguarde `flush()` antes de fechar um loop criado manualmente).
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from .metrics_logger import get_metrics_logger
+
+Job = Callable[[], Awaitable[Any]]
+
+_logger = logging.getLogger("npc.core.post_turn")
+
+
+def _default_maxsize() -> int:
+    try:
+        return max(1, int(os.getenv("NPC_POST_TURN_MAX", "8")))
+    except ValueError:
+        return 8
+
+
+class PostTurnQueue:
+    """Fila FIFO de trabalhos pós-turno de um NPC, executados por um único worker."""
+
+    def __init__(self, npc_id: str, maxsize: Optional[int] = None):
+        self.npc_id = npc_id
+        self.maxsize = maxsize or _default_maxsize()
+        self._queue: Optional["asyncio.Queue[Tuple[str, Job, contextvars.Context, float]]"] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_worker(self) -> "asyncio.Queue[Tuple[str, Job, contextvars.Context, float]]":
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop or self._worker is None or self._worker.done():
+            if self._queue is not None and self._loop is not loop and self._queue.qsize():
+                _logger.warning("post_turn[%s]: %d trabalho(s) perdidos com o loop anterior", self.npc_id, self._queue.qsize())
+            self._loop = loop
+            self._queue = asyncio.Queue(self.maxsize)
+            self._pending = 0
+            self._worker = loop.create_task(self._run(self._queue), name=f"post_turn:{self.npc_id}")
+        return self._queue
+
+    @property
+    def pending(self) -> int:
+        """Trabalhos enviados e ainda não concluídos (inclui o que está rodando)."""
+        return self._pending
+
+    async def submit(self, name: str, job: Job) -> None:
+        """Enfileira `job` (função assíncrona sem argumentos); espera vaga se a fila estiver cheia."""
+        queue = self._ensure_worker()
+        # Captura o contexto do turno (agente, npc_id, turn_id) para o trabalho
+        ctx = contextvars.copy_context()
+        self._pending += 1
+        try:
+            await queue.put((name, job, ctx, time.time()))
+        except BaseException:
+            # Cancelado esperando vaga: o trabalho não entrou na fila
+            if queue is self._queue:
+                self._pending -= 1
+            raise
+
+    async def flush(self) -> float:
+        """Aguarda todos os trabalhos enviados até agora. Retorna a espera em ms."""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return 0.0
+        start = time.time()
+        await self._queue.join()
+        return (time.time() - start) * 1000
+
+    async def aclose(self) -> None:
+        """Conclui os trabalhos pendentes e encerra o worker."""
+        await self.flush()
+        worker, self._worker = self._worker, None
+        if worker is not None and not worker.done():
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self, queue: "asyncio.Queue[Tuple[str, Job, contextvars.Context, float]]") -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            name, job, ctx, enqueued = await queue.get()
+            task: Optional[asyncio.Task] = None
+            try:
+                # A task herda o contexto do turno que enviou o trabalho
+                task = ctx.run(loop.create_task, job())
+                await task
+                self.completed += 1
+                _logger.debug("post_turn[%s]: %s ok (%.0f ms desde o envio)", self.npc_id, name, (time.time() - enqueued) * 1000)
+            except asyncio.CancelledError:
+                if task is not None and not task.done():
+                    task.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                _logger.warning("post_turn[%s]: %s falhou: %s", self.npc_id, name, e)
+                get_metrics_logger().log_event(event="post_turn_failed", detail=f"{self.npc_id}:{name}", reason=str(e)[:200])
+            finally:
+                if queue is self._queue:
+                    self._pending -= 1
+                queue.task_done()
@@ -1,10 +1,11 @@
 from __future__ import annotations
-import json
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+from .serialization import read_json, write_json
+
 
 @dataclass
 class RelationshipStore:
@@ -23,18 +24,16 @@ class RelationshipStore:
         if not p.exists():
             return {}
         try:
-            with p.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    return data
-                return {}
+            data = read_json(p)
+            if isinstance(data, dict):
+                return data
+            return {}
         except Exception:
             return {}
 
     def write(self, relationships: Dict[str, Dict[str, Any]]) -> None:
         """Escreve todos os relacionamentos no arquivo."""
-        with self.path.open("w", encoding="utf-8") as f:
-            json.dump(relationships, f, ensure_ascii=False, indent=2)
+        write_json(self.path, relationships, indent=True)
 
     def get_relationship(self, character_name: str) -> Dict[str, Any]:
         """Obtém o relacionamento com um personagem específico."""
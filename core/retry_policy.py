@@ -0,0 +1,216 @@
+"""
+Política de retry e circuit breaker para chamadas ao provedor LLM.
+
+- `RetryPolicy`: classifica erros em retryable x fatais, calcula o backoff com
+  "decorrelated jitter" e respeita `Retry-After` / `retry-after-ms` /
+  `x-ratelimit-reset-*` quando o provedor informa.
+- `CircuitBreaker`: um por modelo. Após N falhas consecutivas do upstream
+  (5xx, timeouts, conexão) abre e passa a falhar rápido (ou desviar para o
+  modelo de fallback) durante `cooldown_s`; depois libera uma chamada de
+  teste (half-open). Mudanças de estado vão para o CSV de eventos.
+"""
+
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Mapping, Optional
+
+import aiohttp
+
+from .metrics_logger import get_metrics_logger
+
+logger = logging.getLogger("npc.core.retry_policy")
+
+
+class LLMHTTPError(Exception):
+    """Resposta HTTP de erro do provedor, com status e dica de espera."""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None, body: str = ""):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+        self.body = body
+
+
+class CircuitOpenError(Exception):
+    """O circuit breaker do modelo está aberto: a chamada falha sem ir ao provedor."""
+
+
+_DURATION_RE = re.compile(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?$")
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Converte '1s', '6m0s', '250ms' ou '2.5' em segundos."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    m = _DURATION_RE.match(value)
+    if not m or not any(m.groups()):
+        return None
+    h, mi, sec, ms = (float(g) if g else 0.0 for g in m.groups())
+    return h * 3600 + mi * 60 + sec + ms / 1000
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Extrai quantos segundos esperar a partir dos headers de rate limit."""
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    ra = headers.get("Retry-After") or headers.get("retry-after")
+    if ra:
+        seconds = _parse_duration(ra)
+        if seconds is not None:
+            return max(0.0, seconds)
+        try:
+            when = email.utils.parsedate_to_datetime(ra)
+            return max(0.0, when.timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    resets = [
+        _parse_duration(headers[h])
+        for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        if headers.get(h)
+    ]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+
+class RetryPolicy:
+    """Decide se/quanto esperar antes de repetir uma chamada."""
+
+    RETRYABLE_STATUS = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+    def __init__(self, base_delay_s: float = 0.5, max_delay_s: float = 20.0, max_retry_after_s: float = 60.0):
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+        self.max_retry_after_s = max_retry_after_s
+
+    def is_retryable(self, error: BaseException) -> bool:
+        if isinstance(error, LLMHTTPError):
+            return error.status in self.RETRYABLE_STATUS or error.status >= 500
+        if isinstance(error, CircuitOpenError):
+            return False
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+            return True
+        # Erros de programação não se resolvem repetindo; resposta malformada/sem choices sim
+        return not isinstance(error, (TypeError, KeyError, AttributeError))
+
+    def is_upstream_failure(self, error: BaseException) -> bool:
+        """Falhas que indicam provedor degradado (contam para o circuit breaker)."""
+        if isinstance(error, LLMHTTPError):
+            return error.status >= 500
+        return isinstance(error, (asyncio.TimeoutError, TimeoutError, aiohttp.ClientConnectionError))
+
+    def next_delay(self, previous_delay: Optional[float], error: Optional[BaseException] = None) -> float:
+        """Backoff com decorrelated jitter; `Retry-After` do provedor tem precedência."""
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after_s)
+        prev = previous_delay if previous_delay is not None else self.base_delay_s
+        return min(self.max_delay_s, random.uniform(self.base_delay_s, prev * 3))
+
+
+class CircuitBreaker:
+    """Circuit breaker clássico (closed → open → half_open → closed) para um modelo."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown_s: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def _transition(self, new_state: str, reason: str) -> None:
+        old = self.state
+        self.state = new_state
+        logger.warning("circuit_breaker[%s]: %s -> %s (%s)", self.name, old, new_state, reason)
+        get_metrics_logger().log_event(
+            event="circuit_breaker",
+            model=self.name,
+            detail=f"{old}->{new_state}",
+            value=self.failures,
+            reason=reason,
+        )
+
+    def allow(self) -> bool:
+        """True se a chamada pode ir ao provedor agora."""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown_s:
+                    return False
+                self._transition(self.HALF_OPEN, "cooldown elapsed")
+            # half-open: deixa passar uma única chamada de teste
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED, "probe succeeded")
+
+    def record_failure(self, reason: str = "") -> None:
+        with self.lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._transition(self.OPEN, reason or f"{self.failures} consecutive failures")
+
+    def release_probe(self) -> None:
+        """Libera a vaga de teste sem contar sucesso/falha (ex.: erro do cliente, cancelamento)."""
+        with self.lock:
+            self._probe_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    """Circuit breaker compartilhado do modelo (criado na primeira consulta).
+
+    Configurável por NPC_LLM_BREAKER_THRESHOLD (falhas consecutivas, padrão 5)
+    e NPC_LLM_BREAKER_COOLDOWN_S (segundos aberto, padrão 30).
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                model,
+                failure_threshold=int(os.getenv("NPC_LLM_BREAKER_THRESHOLD", "5")),
+                cooldown_s=float(os.getenv("NPC_LLM_BREAKER_COOLDOWN_S", "30")),
+            )
+            _breakers[model] = breaker
+        return breaker
+
+
+def reset_circuit_breakers() -> None:
+    """Esquece o estado de todos os breakers (útil em testes/benchmarks)."""
+    with _breakers_lock:
+        _breakers.clear()
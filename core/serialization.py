@@ -0,0 +1,172 @@
+"""
+Serialização JSON do framework, com backend rápido opcional.
+
+Todos os pontos quentes (payload/resposta de cada chamada LLM, chunks SSE,
+stores de memória/KB/relacionamentos, cache de respostas e cassete) passam por
+aqui. Backends, em ordem de preferência:
+- `orjson` (`pip install orjson`);
+- `msgspec` (`pip install msgspec`);
+- `json` da biblioteca padrão (sempre disponível).
+
+NPC_JSON_BACKEND=auto|orjson|msgspec|stdlib força um backend (`auto` é o padrão).
+
+A saída é a mesma em qualquer backend: UTF-8 sem escapes, compacta (ou com
+indentação de 2 espaços). Erros de leitura são sempre `JSONDecodeError` (subclasse
+de ValueError). `canonical_dumps` usa sempre a stdlib: hashes (cache, cassete) não
+podem mudar conforme o que está instalado.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+logger = logging.getLogger("npc.core.serialization")
+
+JSONDecodeError = json.JSONDecodeError
+
+Default = Optional[Callable[[Any], Any]]
+
+
+class _StdlibBackend:
+    name = "stdlib"
+
+    def dumps(self, obj: Any, indent: bool, sort_keys: bool, default: Default) -> bytes:
+        return json.dumps(
+            obj,
+            ensure_ascii=False,
+            indent=2 if indent else None,
+            separators=(",", ": ") if indent else (",", ":"),
+            sort_keys=sort_keys,
+            default=default,
+        ).encode("utf-8")
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class _OrjsonBackend:
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+
+    def dumps(self, obj: Any, indent: bool, sort_keys: bool, default: Default) -> bytes:
+        o = self._orjson
+        # Chaves não-str (int, enum...) como na stdlib
+        option = o.OPT_NON_STR_KEYS
+        if indent:
+            option |= o.OPT_INDENT_2
+        if sort_keys:
+            option |= o.OPT_SORT_KEYS
+        return o.dumps(obj, default=default, option=option)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        # orjson.JSONDecodeError já é subclasse de json.JSONDecodeError
+        return self._orjson.loads(data)
+
+
+class _MsgspecBackend:
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self._msgspec = msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._sorted_encoder = msgspec.json.Encoder(order="sorted")
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj: Any, indent: bool, sort_keys: bool, default: Default) -> bytes:
+        if default is not None:
+            encoder = self._msgspec.json.Encoder(enc_hook=default, order="sorted" if sort_keys else None)
+        else:
+            encoder = self._sorted_encoder if sort_keys else self._encoder
+        data = encoder.encode(obj)
+        return self._msgspec.json.format(data, indent=2) if indent else data
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except self._msgspec.DecodeError as e:
+            text = data.decode("utf-8", errors="replace") if isinstance(data, bytes) else data
+            raise JSONDecodeError(str(e), text, 0) from e
+
+
+_BACKENDS = {"orjson": _OrjsonBackend, "msgspec": _MsgspecBackend, "stdlib": _StdlibBackend}
+
+
+def _load_backend(name: str):
+    name = (name or "auto").strip().lower()
+    if name == "auto":
+        for candidate in ("orjson", "msgspec"):
+            try:
+                return _BACKENDS[candidate]()
+            except ImportError:
+                continue
+        return _StdlibBackend()
+    if name not in _BACKENDS:
+        raise ValueError(f"Backend JSON desconhecido: {name!r} (use auto, orjson, msgspec ou stdlib)")
+    try:
+        return _BACKENDS[name]()
+    except ImportError:
+        logger.warning("serialization: '%s' não instalado; usando json da stdlib", name)
+        return _StdlibBackend()
+
+
+_backend = _load_backend(os.getenv("NPC_JSON_BACKEND", "auto"))
+
+
+def backend_name() -> str:
+    """Nome do backend ativo ('orjson', 'msgspec' ou 'stdlib')."""
+    return _backend.name
+
+
+def get_backend() -> Any:
+    """Backend ativo (objeto com `name`, `dumps` e `loads`)."""
+    return _backend
+
+
+def set_backend(backend: Any) -> str:
+    """Troca o backend do processo por nome ou por objeto (ex.: em benchmarks). Retorna o nome efetivo."""
+    global _backend
+    _backend = _load_backend(backend) if isinstance(backend, str) else backend
+    return _backend.name
+
+
+def dumps_bytes(obj: Any, *, indent: bool = False, sort_keys: bool = False, default: Default = None) -> bytes:
+    """Serializa para bytes UTF-8 (corpo de requisição, arquivos)."""
+    return _backend.dumps(obj, indent, sort_keys, default)
+
+
+def dumps(obj: Any, *, indent: bool = False, sort_keys: bool = False, default: Default = None) -> str:
+    """Serializa para str (prompts, logs, linhas JSONL)."""
+    return _backend.dumps(obj, indent, sort_keys, default).decode("utf-8")
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """Desserializa str ou bytes. Levanta `JSONDecodeError` em JSON inválido."""
+    if isinstance(data, bytearray):
+        data = bytes(data)
+    return _backend.loads(data)
+
+
+def canonical_dumps(obj: Any) -> str:
+    """Forma canônica (chaves ordenadas, compacta) para hashes; sempre via stdlib."""
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def read_json(path: Union[str, Path]) -> Any:
+    """Lê um arquivo JSON inteiro (bytes direto para o backend, sem decodificar antes)."""
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def write_json(path: Union[str, Path], obj: Any, *, indent: bool = False) -> None:
+    """Grava `obj` em `path` (sobrescreve)."""
+    data = dumps_bytes(obj, indent=indent)
+    with open(path, "wb") as f:
+        f.write(data)
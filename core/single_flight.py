@@ -0,0 +1,73 @@
+"""
+Coalescência "single-flight" de requisições idênticas em andamento.
+
+Quando vários chamadores disparam a MESMA requisição ao mesmo tempo (mesma
+impressão digital), apenas o primeiro ("líder") executa a chamada upstream; os
+demais aguardam o mesmo resultado. A chamada roda numa task própria, então o
+cancelamento de um chamador não derruba os outros; ela só é cancelada quando
+ninguém mais está esperando.
+
+O registro é por event loop, já que futures/tasks não podem cruzar loops.
+"""
+
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """Registro de chamadas em andamento indexado por chave."""
+
+    def __init__(self):
+        # loop -> {key: (task, [waiters])}
+        self._calls: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Tuple[asyncio.Task, list]]]" = weakref.WeakKeyDictionary()
+
+    def in_flight(self, key: str) -> bool:
+        loop = asyncio.get_running_loop()
+        return key in self._calls.get(loop, {})
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Executa `fn` uma única vez por chave em andamento.
+
+        Returns:
+            (resultado, shared): `shared` é True quando o chamador reaproveitou
+            a chamada de outro (não foi o líder).
+        """
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        shared = key in calls
+        if shared:
+            task, waiters = calls[key]
+        else:
+            task = loop.create_task(fn())
+            waiters = []
+            calls[key] = (task, waiters)
+
+            def _done(_t: asyncio.Task, _key: str = key) -> None:
+                current = calls.get(_key)
+                if current is not None and current[0] is _t:
+                    calls.pop(_key, None)
+
+            task.add_done_callback(_done)
+
+        token = object()
+        waiters.append(token)
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and len(waiters) == 1:
+                # Último interessado desistiu: não há por que manter a chamada viva
+                task.cancel()
+            raise
+        finally:
+            waiters.remove(token)
+        return result, shared
+
+
+# Instância global (uma por processo)
+_global_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """Retorna o registro global de chamadas em andamento."""
+    return _global_single_flight
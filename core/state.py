@@ -1,8 +1,34 @@
-from typing import Any, Dict, List, Optional, TypedDict
+from typing import Annotated, Any, Dict, Iterable, List, Optional, TypedDict
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from .persona import Persona
 
 
+# Marca de atualização parcial de um campo dict do estado (ver `merge_dict_channel`)
+PATCH_KEY = "__patch__"
+
+
+def dict_patch(updates: Dict[str, Any], removed: Iterable[str] = ()) -> Dict[str, Any]:
+    """Atualização parcial: chaves novas/alteradas e chaves removidas (serializável pelo checkpointer)."""
+    return {PATCH_KEY: True, "set": dict(updates), "removed": list(removed)}
+
+
+def merge_dict_channel(current: Optional[Dict[str, Any]], update: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reducer de `scratch` e `emotions`.
+
+    Um dict comum substitui o valor (seed do turno e nós sequenciais, que devolvem
+    o estado inteiro). Um `dict_patch` é mesclado sobre o valor corrente: é o que
+    os ramos paralelos do grafo devolvem, e patches do mesmo passo são aplicados
+    na ordem determinística dos nós.
+    """
+    if isinstance(update, dict) and update.get(PATCH_KEY):
+        merged = dict(current or {})
+        for key in update.get("removed", ()):
+            merged.pop(key, None)
+        merged.update(update.get("set") or {})
+        return merged
+    return update if update is not None else {}
+
+
 class ScratchState(TypedDict, total=False):
     # Saída do módulo de diálogo
     candidate_reply: str
@@ -34,8 +60,8 @@ class NPCState(TypedDict, total=False):
     messages: List[Any]  # HumanMessage | AIMessage | SystemMessage
     events: List[Dict[str, Any]]
     intent: Optional[str]
-    emotions: Dict[str, float]
-    scratch: ScratchState
+    emotions: Annotated[Dict[str, float], merge_dict_channel]
+    scratch: Annotated[ScratchState, merge_dict_channel]
     action: Optional[Dict[str, Any]]
     persona: Persona
     perceived_context: str
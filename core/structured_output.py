@@ -0,0 +1,170 @@
+"""
+Saídas estruturadas: extração/reparo local de JSON + validação por schema pydantic.
+
+Todos os agentes que pedem JSON ao LLM (dinamic_emotion, context_awareness,
+relationship, critic e o auto_memorize do runtime) passam por aqui, em vez de
+cada um remover cercas de código e chamar `json.loads` por conta própria.
+
+- `extract_json`: remove cercas ```json, isola o primeiro objeto/array e aplica
+  reparos locais baratos (vírgulas sobrando, aspas tipográficas, True/False/None,
+  chaves/colchetes/strings não fechados por truncamento). Evita descartar uma
+  chamada inteira por um detalhe de formatação.
+- `parse_structured`: extrai e valida com o schema do agente.
+- `json_response_format`: monta o `response_format` da API (JSON mode ou
+  JSON schema) a partir do schema, conforme `STRUCTURED_OUTPUT_MODE`.
+"""
+
+import re
+from typing import Any, Dict, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from .models_preset import STRUCTURED_OUTPUT_MODE
+from .serialization import loads
+
+M = TypeVar("M", bound=BaseModel)
+
+_FENCE_RE = re.compile(r"```[a-zA-Z0-9_-]*\s*\n?(.*?)```", re.DOTALL)
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "„": '"', "«": '"', "»": '"'})
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class StructuredOutputError(ValueError):
+    """A resposta do LLM não pôde ser convertida no schema esperado."""
+
+    def __init__(self, message: str, raw: str = ""):
+        super().__init__(message)
+        # Texto bruto recebido (útil para fallbacks em texto simples)
+        self.raw = raw
+
+
+def _strip_fences(text: str) -> str:
+    m = _FENCE_RE.search(text)
+    if m:
+        return m.group(1).strip()
+    if text.startswith("```"):
+        # Cerca aberta e nunca fechada (resposta truncada)
+        nl = text.find("\n")
+        return text[nl + 1:].strip() if nl != -1 else ""
+    return text
+
+
+def _repair(fragment: str) -> str:
+    """Percorre o fragmento fora de strings corrigindo os erros mais comuns de LLMs."""
+    out = []
+    stack = []
+    in_string = False
+    escaped = False
+    i = 0
+    n = len(fragment)
+    while i < n:
+        ch = fragment[i]
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                out[-1] = "\\n"
+            i += 1
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch in "}]":
+            # Vírgula sobrando antes do fechamento
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            i += 1
+            if not stack:
+                break
+            continue
+        elif ch.isalpha():
+            j = i
+            while j < n and (fragment[j].isalnum() or fragment[j] == "_"):
+                j += 1
+            word = fragment[i:j]
+            out.append(_PY_LITERALS.get(word, word))
+            i = j
+            continue
+        out.append(ch)
+        i += 1
+    # Resposta truncada: fecha string e estruturas abertas
+    if in_string:
+        if escaped:
+            out.pop()
+        out.append('"')
+    while out and (out[-1].isspace() or out[-1] in ",:"):
+        out.pop()
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def extract_json(text: str) -> Tuple[Any, bool]:
+    """Extrai o primeiro valor JSON (objeto ou array) de uma resposta de LLM.
+
+    Returns:
+        (valor, reparado): `reparado` é True quando foi preciso corrigir o texto.
+
+    Raises:
+        StructuredOutputError: se não houver JSON recuperável.
+    """
+    raw = text or ""
+    body = _strip_fences(raw.strip().lstrip("\ufeff"))
+    try:
+        return loads(body), False
+    except ValueError:
+        pass
+    starts = [p for p in (body.find("{"), body.find("[")) if p != -1]
+    if not starts:
+        raise StructuredOutputError("nenhum objeto JSON na resposta", raw=raw)
+    fragment = body[min(starts):].translate(_SMART_QUOTES)
+    try:
+        return loads(_repair(fragment)), True
+    except ValueError as e:
+        raise StructuredOutputError(f"JSON inválido: {e}", raw=raw) from e
+
+
+def parse_structured(text: str, schema: Type[M]) -> Tuple[M, bool]:
+    """Extrai o JSON da resposta e valida com `schema`. Retorna (objeto, reparado)."""
+    data, repaired = extract_json(text)
+    try:
+        return schema.model_validate(data), repaired
+    except ValidationError as e:
+        raise StructuredOutputError(f"schema {schema.__name__}: {e.error_count()} erro(s): {e.errors()[0].get('msg', '')}", raw=text or "") from e
+
+
+def json_response_format(schema: Type[BaseModel], mode: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """`response_format` da API para o schema.
+
+    mode: 'json_schema' (saída guiada pelo schema), 'json_object' (JSON mode
+    simples) ou None/'off' (sem restrição no provedor; só o parser local).
+    Sem `mode`, usa `STRUCTURED_OUTPUT_MODE` de core/models_preset.py.
+    """
+    if mode is None:
+        mode = STRUCTURED_OUTPUT_MODE
+    if not mode or mode == "off":
+        return None
+    if mode == "json_object":
+        return {"type": "json_object"}
+    if mode == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": schema.__name__,
+                "schema": schema.model_json_schema(),
+                # strict exige todos os campos obrigatórios e sem extras; os schemas aqui são tolerantes
+                "strict": False,
+            },
+        }
+    raise ValueError(f"STRUCTURED_OUTPUT_MODE inválido: {mode!r}")
@@ -0,0 +1,229 @@
+"""
+Contagem local de tokens para prompts de chat (sem chamada de rede no caminho da requisição).
+
+Usa `tiktoken` quando instalado. O encoding é carregado uma única vez numa
+thread em segundo plano (o primeiro uso pode baixar o arquivo BPE; defina
+TIKTOKEN_CACHE_DIR com o arquivo já presente para ambientes offline); até lá, e
+se o carregamento falhar, vale uma heurística local por palavras/pontuação, bem
+mais próxima do BPE do que `len(texto.split()) * 1.3`. Nenhuma contagem bloqueia
+o event loop esperando o encoding.
+
+As contagens por mensagem ficam em cache (LRU chaveado pelo hash do conteúdo),
+já que persona, prompts de sistema e histórico se repetem a cada turno.
+"""
+
+import hashlib
+import logging
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger("npc.core.tokenizer")
+
+try:
+    import tiktoken  # type: ignore
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None  # type: ignore
+    TIKTOKEN_AVAILABLE = False
+
+# Overhead do formato de chat da OpenAI: tokens por mensagem e para iniciar a resposta
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+REPLY_PRIMING_TOKENS = 3
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Encodings já carregados (None = indisponível) e os que estão carregando
+_encodings: Dict[str, Optional[Any]] = {}
+_loading: Set[str] = set()
+_encodings_lock = threading.Lock()
+
+
+def _encoding_name(model: str) -> str:
+    try:
+        return tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        # Modelos novos que o tiktoken ainda não conhece
+        return "o200k_base" if model.startswith(("gpt-4o", "gpt-4.1", "o1", "o3", "o4")) else "cl100k_base"
+
+
+def _load_encoding(name: str) -> None:
+    try:
+        enc = tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning("tokenizer: encoding %s indisponível (%s); usando heurística local", name, e)
+        enc = None
+    with _encodings_lock:
+        _encodings[name] = enc
+        _loading.discard(name)
+
+
+def _encoding_for(model: str) -> Optional[Any]:
+    """Encoding do modelo, se já carregado; senão dispara o carregamento em segundo plano e retorna None."""
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    name = _encoding_name(model)
+    with _encodings_lock:
+        if name in _encodings:
+            return _encodings[name]
+        if name in _loading:
+            return None
+        _loading.add(name)
+    threading.Thread(target=_load_encoding, args=(name,), name=f"tiktoken:{name}", daemon=True).start()
+    return None
+
+
+def warm_up(model: str = "gpt-4o") -> None:
+    """Carrega o encoding de `model` agora (bloqueante; para scripts e a inicialização, fora do event loop)."""
+    if TIKTOKEN_AVAILABLE:
+        name = _encoding_name(model)
+        with _encodings_lock:
+            if name in _encodings:
+                return
+        _load_encoding(name)
+
+
+def _heuristic_count(text: str) -> int:
+    # Palavras longas viram vários tokens BPE (~4 caracteres por token)
+    return sum(max(1, math.ceil(len(w) / 4)) for w in _WORD_RE.findall(text))
+
+
+def _count_with(enc: Optional[Any], text: str) -> int:
+    if enc is None:
+        return _heuristic_count(text)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def count_text_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Número de tokens de um texto para o modelo informado."""
+    if not text:
+        return 0
+    return _count_with(_encoding_for(model), text)
+
+
+# Cache das contagens por mensagem: chave = (hash do conteúdo, encoding), nunca o texto inteiro
+_COUNT_CACHE_SIZE = 4096
+_count_cache: "OrderedDict[Tuple[bytes, str], int]" = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+def _cached_text_tokens(text: str, model: str) -> int:
+    if not text:
+        return 0
+    enc = _encoding_for(model)
+    # A contagem heurística não depende do modelo; a do tiktoken, do encoding
+    key = (hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest(), enc.name if enc is not None else "")
+    with _count_cache_lock:
+        tokens = _count_cache.get(key)
+        if tokens is not None:
+            _count_cache.move_to_end(key)
+            return tokens
+    tokens = _count_with(enc, text)
+    with _count_cache_lock:
+        _count_cache[key] = tokens
+        if len(_count_cache) > _COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return tokens
+
+
+def count_message_tokens(message: Dict[str, Any], model: str = "gpt-4o") -> int:
+    """Tokens de uma mensagem no formato da API (inclui o overhead por mensagem)."""
+    tokens = TOKENS_PER_MESSAGE
+    tokens += _cached_text_tokens(str(message.get("role", "")), model)
+    tokens += _cached_text_tokens(str(message.get("content", "") or ""), model)
+    if message.get("name"):
+        tokens += TOKENS_PER_NAME + _cached_text_tokens(str(message["name"]), model)
+    return tokens
+
+
+def count_messages_tokens(messages: List[Dict[str, Any]], model: str = "gpt-4o") -> int:
+    """Tokens de prompt de uma lista de mensagens no formato da API."""
+    return sum(count_message_tokens(m, model) for m in messages) + REPLY_PRIMING_TOKENS
+
+
+# Seções do bloco dinâmico nunca são cortadas abaixo disto (mantém o rótulo e um começo legível)
+MIN_SECTION_TOKENS = 16
+_CUT_MARK = " […]"
+
+# Separador das seções do bloco dinâmico e a chave (`additional_kwargs`) em que
+# `build_prompt` anexa a lista de seções à HumanMessage
+SECTION_SEP = "\n\n"
+SECTIONS_KEY = "prompt_sections"
+
+
+def truncate_text_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """Corta o fim de `text` até caber em `max_tokens` (com marcador de corte)."""
+    tokens = count_text_tokens(text, model)
+    if tokens <= max_tokens:
+        return text
+    # Aproximação por caracteres, refinada até caber
+    cut = int(len(text) * max_tokens / tokens)
+    while cut > 0:
+        candidate = text[:cut].rstrip() + _CUT_MARK
+        if count_text_tokens(candidate, model) <= max_tokens:
+            return candidate
+        cut = int(cut * 0.9)
+    return _CUT_MARK.strip()
+
+
+def trim_sections_to_budget(sections: Sequence[str], max_tokens: int, model: str = "gpt-4o", sep: str = SECTION_SEP) -> str:
+    """Encolhe as seções de um bloco dinâmico (`build_prompt`) até caber em `max_tokens`.
+
+    Corta sempre a maior seção (lore, histórico, contexto) e nunca a última, que
+    traz a fala atual do jogador / o que o agente deve avaliar (inteira, mesmo
+    que tenha linhas em branco).
+    """
+    sections = list(sections)
+    if len(sections) < 2:
+        return sep.join(sections)
+    while True:
+        joined = sep.join(sections)
+        total = count_text_tokens(joined, model)
+        if total <= max_tokens:
+            return joined
+        sizes = [count_text_tokens(sec, model) for sec in sections[:-1]]
+        idx = max(range(len(sizes)), key=sizes.__getitem__)
+        if sizes[idx] <= MIN_SECTION_TOKENS:
+            return joined
+        target = max(MIN_SECTION_TOKENS, sizes[idx] - (total - max_tokens))
+        sections[idx] = truncate_text_tokens(sections[idx], target, model)
+
+
+def trim_messages_to_budget(
+    messages: List[Dict[str, Any]],
+    max_tokens: int,
+    model: str = "gpt-4o",
+    sections: Optional[Sequence[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Corta o prompt até caber no orçamento, em duas etapas.
+
+    1. Remove as mensagens mais antigas que não são de sistema (histórico de
+       conversas com várias mensagens, ex.: auto_memorize).
+    2. Se ainda passar e `sections` descrever a última mensagem (as seções do
+       bloco dinâmico de `build_prompt`: lore, contexto, scratch), encolhe as
+       seções, preservando a última.
+
+    Mensagens de sistema (instruções e persona) nunca são alteradas. O resultado
+    pode continuar acima do orçamento; cabe ao chamador decidir o que fazer.
+    """
+    kept = list(messages)
+    total = count_messages_tokens(kept, model)
+    i = 0
+    while total > max_tokens and i < len(kept) - 1:
+        if kept[i].get("role") == "system":
+            i += 1
+            continue
+        total -= count_message_tokens(kept[i], model)
+        del kept[i]
+    if total > max_tokens and sections and kept and kept[-1].get("role") != "system":
+        last = dict(kept[-1])
+        content = str(last.get("content", "") or "")
+        # Só corta se as seções ainda correspondem ao conteúdo enviado
+        if content == SECTION_SEP.join(sections):
+            budget = count_text_tokens(content, model) - (total - max_tokens)
+            last["content"] = trim_sections_to_budget(sections, max(0, budget), model)
+            kept[-1] = last
+    return kept
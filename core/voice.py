@@ -1,16 +1,41 @@
 # core/voice.py
+import asyncio
+import contextvars
+import functools
 import httpx
+import threading
 import time
 from typing import Optional
 from openai import OpenAI
 from core.persona import Persona
 from core.metrics_logger import get_metrics_logger
+from core.llm_backends import get_default_backend
+from core.http_pool import HTTP2_AVAILABLE
+from core.cassette import Cassette, get_cassette, replay_sleep, tts_fingerprint
 
-# Cliente HTTP com SSL verification desabilitado (para ambientes corporativos com proxy)
-_http_client = httpx.Client(verify=False)
+# Cliente HTTP com SSL verification desabilitado (para ambientes corporativos com proxy).
+# Com NPC_LLM_BACKEND=http2 (e o pacote `h2`), o TTS também multiplexa sobre HTTP/2.
+_http_client: Optional[httpx.Client] = None
 
-# Cliente global da OpenAI (pega OPENAI_API_KEY do ambiente)
-_client = OpenAI(http_client=_http_client)
+# Cliente global da OpenAI (pega OPENAI_API_KEY do ambiente); criado no primeiro uso,
+# para que o import funcione sem chave em execuções offline (NPC_LLM_BACKEND=fake)
+_client: Optional[OpenAI] = None
+# O TTS roda em threads (synthesize_npc_voice_bytes_async)
+_client_lock = threading.Lock()
+
+
+def _get_client() -> OpenAI:
+    global _client, _http_client
+    with _client_lock:
+        if _client is None:
+            http2 = bool(getattr(get_default_backend(), "http2", False)) and HTTP2_AVAILABLE
+            _http_client = httpx.Client(verify=False, http2=http2)
+            _client = OpenAI(http_client=_http_client)
+    return _client
+
+
+class SpeechCancelled(Exception):
+    """TTS abortado porque o turno que o pediu foi cancelado."""
 
 # Mapeia seus voice_id internos -> vozes da OpenAI
 VOICE_MAP = {
@@ -95,7 +120,7 @@ def transcribe_audio(audio_bytes: bytes, language: str = "pt", npc_id: Optional[
     if not audio_bytes:
         raise ValueError("audio_bytes está vazio")
     
-    logger.info(f"Transcrevendo áudio: {len(audio_bytes)} bytes, idioma={language}")
+    logger.info("Transcrevendo áudio: %d bytes, idioma=%s", len(audio_bytes), language)
     
     # Cria um arquivo temporário em memória
     audio_file = io.BytesIO(audio_bytes)
@@ -104,7 +129,7 @@ def transcribe_audio(audio_bytes: bytes, language: str = "pt", npc_id: Optional[
     start_time = time.time()
     try:
         # Usa a API de transcrição da OpenAI
-        transcript = _client.audio.transcriptions.create(
+        transcript = _get_client().audio.transcriptions.create(
             model="whisper-1",
             file=audio_file,
             language=language,
@@ -130,11 +155,11 @@ def transcribe_audio(audio_bytes: bytes, language: str = "pt", npc_id: Optional[
             language=language,
         )
         
-        logger.info(f"Transcrição concluída: {text[:50]}...")
+        logger.info("Transcrição concluída: %s...", text[:50])
         return text
     except Exception as e:
         response_time_ms = (time.time() - start_time) * 1000
-        logger.error(f"Erro ao transcrever áudio: {e}")
+        logger.error("Erro ao transcrever áudio: %s", e)
         import traceback
         logger.error(traceback.format_exc())
         
@@ -154,7 +179,12 @@ def transcribe_audio(audio_bytes: bytes, language: str = "pt", npc_id: Optional[
         raise
 
 
-def synthesize_npc_voice_bytes(text: str, persona: Persona, npc_id: Optional[str] = None) -> bytes:
+def synthesize_npc_voice_bytes(
+    text: str,
+    persona: Persona,
+    npc_id: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> bytes:
     """
     Gera áudio em memória (bytes) para a fala do NPC usando a API de voz da OpenAI.
     Não salva em disco.
@@ -163,6 +193,8 @@ def synthesize_npc_voice_bytes(text: str, persona: Persona, npc_id: Optional[str
         text: Texto a ser convertido em áudio
         persona: Persona do NPC (para escolher voz e estilo)
         npc_id: ID do NPC (opcional, para métricas)
+        cancel_event: Se sinalizado, o download em streaming é abortado entre pedaços
+            (levanta `SpeechCancelled` e registra status 'cancelled')
     
     Returns:
         Bytes do áudio gerado (formato MP3)
@@ -179,45 +211,103 @@ def synthesize_npc_voice_bytes(text: str, persona: Persona, npc_id: Optional[str
     model_name = "gpt-4o-mini-tts"
     
     input_size = len(text.encode('utf-8'))
-    start_time = time.time()
     
-    try:
-        with _client.audio.speech.with_streaming_response.create(
+    # Cassete (core/cassette.py): reproduz o áudio gravado ou grava o novo
+    cassette = get_cassette()
+    fingerprint = tts_fingerprint(model_name, api_voice, text, instructions) if cassette is not None else None
+    if cassette is not None and cassette.replaying:
+        entry = cassette.lookup("tts", fingerprint, npc_id=npc_id, agent="tts")
+        start_time = time.time()
+        replay_sleep(cassette, entry)
+        audio_bytes = Cassette.decode_audio(entry)
+        metrics_logger.log_audio_metrics(
+            service_type='tts',
             model=model_name,
-            voice=api_voice,
-            input=text,
-            response_format="mp3",
-            instructions=instructions,
-        ) as response:
-            chunks = []
-            for chunk in response.iter_bytes():
-                chunks.append(chunk)
-            audio_bytes = b"".join(chunks)
-            response_time_ms = (time.time() - start_time) * 1000
-            
-            # Estima duração do áudio MP3 (aproximação: ~16KB por segundo)
-            # Esta é uma estimativa, a API não retorna a duração exata
-            estimated_duration = len(audio_bytes) / 16000 if len(audio_bytes) > 0 else 0
-            
-            # Registra métricas
-            metrics_logger.log_audio_metrics(
-                service_type='tts',
+            input_size_bytes=input_size,
+            output_size_bytes=len(audio_bytes),
+            response_time_ms=(time.time() - start_time) * 1000,
+            status='success',
+            npc_id=npc_id,
+            output_duration_seconds=len(audio_bytes) / 16000,
+            text_length=len(text),
+            voice_id=api_voice,
+        )
+        return audio_bytes
+    
+    start_time = time.time()
+    try:
+        if cancel_event is not None and cancel_event.is_set():
+            raise SpeechCancelled("TTS cancelado antes de começar")
+        # Backends offline (ex.: NPC_LLM_BACKEND=fake) respondem o TTS sem rede
+        audio_bytes = get_default_backend().synthesize_speech(
+            text, voice=api_voice, model=model_name, instructions=instructions
+        )
+        if audio_bytes is None:
+            with _get_client().audio.speech.with_streaming_response.create(
                 model=model_name,
-                input_size_bytes=input_size,
-                output_size_bytes=len(audio_bytes),
-                response_time_ms=response_time_ms,
-                status='success',
+                voice=api_voice,
+                input=text,
+                response_format="mp3",
+                instructions=instructions,
+            ) as response:
+                chunks = []
+                for chunk in response.iter_bytes():
+                    if cancel_event is not None and cancel_event.is_set():
+                        # Sair do `with` fecha a resposta e aborta a conexão
+                        raise SpeechCancelled(f"TTS cancelado após {sum(len(c) for c in chunks)} bytes")
+                    chunks.append(chunk)
+                audio_bytes = b"".join(chunks)
+        response_time_ms = (time.time() - start_time) * 1000
+        
+        # Estima duração do áudio MP3 (aproximação: ~16KB por segundo)
+        # Esta é uma estimativa, a API não retorna a duração exata
+        estimated_duration = len(audio_bytes) / 16000 if len(audio_bytes) > 0 else 0
+        
+        # Registra métricas
+        metrics_logger.log_audio_metrics(
+            service_type='tts',
+            model=model_name,
+            input_size_bytes=input_size,
+            output_size_bytes=len(audio_bytes),
+            response_time_ms=response_time_ms,
+            status='success',
+            npc_id=npc_id,
+            output_duration_seconds=estimated_duration,
+            text_length=len(text),
+            voice_id=api_voice,
+        )
+        
+        logger.info("TTS gerado: %d bytes para texto de %d caracteres", len(audio_bytes), len(text))
+        if cassette is not None:
+            cassette.record(
+                "tts",
+                fingerprint,
+                response_time_ms,
                 npc_id=npc_id,
-                output_duration_seconds=estimated_duration,
-                text_length=len(text),
-                voice_id=api_voice,
+                agent="tts",
+                model=model_name,
+                voice=api_voice,
+                audio_b64=Cassette.encode_audio(audio_bytes),
             )
-            
-            logger.info(f"TTS gerado: {len(audio_bytes)} bytes para texto de {len(text)} caracteres")
-            return audio_bytes
+        return audio_bytes
+    except SpeechCancelled as e:
+        logger.info(str(e))
+        metrics_logger.log_audio_metrics(
+            service_type='tts',
+            model=model_name,
+            input_size_bytes=input_size,
+            output_size_bytes=0,
+            response_time_ms=(time.time() - start_time) * 1000,
+            status='cancelled',
+            error_message=str(e),
+            npc_id=npc_id,
+            text_length=len(text),
+            voice_id=api_voice,
+        )
+        raise
     except Exception as e:
         response_time_ms = (time.time() - start_time) * 1000
-        logger.error(f"Erro ao gerar TTS: {e}")
+        logger.error("Erro ao gerar TTS: %s", e)
         import traceback
         logger.error(traceback.format_exc())
         
@@ -236,3 +326,20 @@ def synthesize_npc_voice_bytes(text: str, persona: Persona, npc_id: Optional[str
         )
         
         raise
+
+
+async def synthesize_npc_voice_bytes_async(text: str, persona: Persona, npc_id: Optional[str] = None) -> bytes:
+    """
+    Versão assíncrona de `synthesize_npc_voice_bytes`: roda o TTS numa thread (sem
+    bloquear o event loop) e, se a task for cancelada, aborta o download em andamento.
+    """
+    cancel_event = threading.Event()
+    try:
+        # Executor com cópia do contexto de atribuição (npc_id/turn_id nas métricas), como o
+        # asyncio.to_thread, que não existe no Python 3.8
+        loop = asyncio.get_running_loop()
+        call = functools.partial(synthesize_npc_voice_bytes, text, persona, npc_id, cancel_event)
+        return await loop.run_in_executor(None, contextvars.copy_context().run, call)
+    except asyncio.CancelledError:
+        cancel_event.set()
+        raise
@@ -1,5 +1,8 @@
-from langchain_core.messages import SystemMessage
+from typing import List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from core.persona import Persona
+from core.tokenizer import SECTION_SEP, SECTIONS_KEY
 
 def sys_persona(persona: Persona) -> SystemMessage:
     return SystemMessage(
@@ -12,4 +15,43 @@ def sys_persona(persona: Persona) -> SystemMessage:
             f"Modo voz: {persona.spoken_mode_hint}\n"
             "Mantenha consistência de personalidade, lembranças e tom."
         )
-    )
\ No newline at end of file
+    )
+
+
+def persona_profile(persona: Optional[Persona]) -> str:
+    """Ficha da persona para os agentes de análise (estável por NPC)."""
+    return (
+        "PERSONA DO NPC:\n"
+        f"Nome: {persona.name if persona else 'NPC'}\n"
+        f"Backstory: {persona.backstory if persona and persona.backstory else 'N/A'}\n"
+        f"Traits: {', '.join(persona.traits) if persona and persona.traits else 'N/A'}"
+    )
+
+
+def build_prompt(
+    system: str,
+    persona: Optional[Persona] = None,
+    stable: Sequence[str] = (),
+    dynamic: Sequence[str] = (),
+) -> List[BaseMessage]:
+    """Monta o prompt de um agente na ordem amigável ao cache de prefixo do provedor.
+
+    1. `system`: instruções fixas do agente (idênticas para todos os NPCs);
+    2. `persona`: `sys_persona` do NPC (estável por NPC);
+    3. `stable`: outros blocos estáveis por NPC (ex.: `persona_profile`);
+    4. `dynamic`: o que muda a cada turno (eventos, emoções, falas), numa única
+       HumanMessage no final. Seções vazias são ignoradas. A lista de seções vai
+       junto na mensagem (`additional_kwargs`) para o corte por orçamento do
+       harness, que encolhe as maiores e nunca a última.
+
+    Qualquer conteúdo dinâmico antes dos blocos fixos muda o prefixo e invalida o
+    cache; por isso todos os agentes montam o prompt por aqui.
+    """
+    messages: List[BaseMessage] = [SystemMessage(content=system.strip())]
+    if persona is not None:
+        messages.append(sys_persona(persona))
+    messages.extend(SystemMessage(content=block) for block in stable if block)
+    sections = [section for section in dynamic if section]
+    if sections:
+        messages.append(HumanMessage(content=SECTION_SEP.join(sections), additional_kwargs={SECTIONS_KEY: sections}))
+    return messages
@@ -1,33 +1,153 @@
+import asyncio
+import re
 import uuid
 import logging
-import json
 import os
+import time
 from typing import Optional, Dict, Any, List
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from core.state import NPCState
-from graph.wiring import build_graph
+from graph.wiring import get_compiled_graph, shared_checkpointer
 from graph.prompts import sys_persona
 from core.persona import Persona, DEFAULT_PERSONA
 from core.memory import EpisodicMemory
 from tools import TOOLS_REGISTRY
 from core.json_memory import JSONMemoryStore, CategorizedMemoryStore
+from pydantic import BaseModel, Field, field_validator
 from core.llm import LLMHarness
+from core.metrics_logger import get_metrics_logger
+from core.call_context import call_context, traced_node
+from core.lazy_logging import Lazy, configure_logging, truncated
+from core.structured_output import StructuredOutputError, json_response_format
+from core.serialization import dumps
+from core.post_turn import PostTurnQueue
+from agents.relationship import relationship
+
+
+def _action_for_log(action: Any) -> Any:
+    """Cópia da action para log, com o áudio binário trocado pelo tamanho."""
+    if isinstance(action, dict) and "audio" in action:
+        action = dict(action)
+        action["audio"] = f"<bytes: {len(action['audio'] or b'')} bytes>"
+    return action
+
+
+class KBItem(BaseModel):
+    title: str
+    summary: str
+    metadata: Optional[Dict[str, Any]] = None
+
+
+class KBUpdate(BaseModel):
+    """Saída do auto_memorize: itens novos/atualizados por categoria do KB."""
+    life: List[KBItem] = Field(default_factory=list)
+    people: List[KBItem] = Field(default_factory=list)
+    places: List[KBItem] = Field(default_factory=list)
+    skills: List[KBItem] = Field(default_factory=list)
+    objects: List[KBItem] = Field(default_factory=list)
+
+    @field_validator("life", "people", "places", "skills", "objects", mode="before")
+    @classmethod
+    def _valid_items(cls, value: Any) -> List[Dict[str, Any]]:
+        # Descarta itens malformados em vez de perder a categoria inteira
+        if not isinstance(value, list):
+            return []
+        items = []
+        for it in value:
+            if not isinstance(it, dict):
+                continue
+            title = str(it.get("title", "") or "").strip()
+            summary = str(it.get("summary", "") or "").strip()
+            if title and summary:
+                meta = it.get("metadata") if isinstance(it.get("metadata"), dict) else None
+                items.append({"title": title, "summary": summary, "metadata": meta})
+        return items
+
+
+# Palavras que aparecem capitalizadas só por abrir a frase (não são entidades)
+_NOT_ENTITIES = {
+    "olá", "oi", "eu", "você", "voce", "vocês", "ele", "ela", "eles", "elas", "nós", "isso", "isto",
+    "aquilo", "esse", "essa", "este", "esta", "aqui", "ali", "lá", "sim", "não", "nao", "mas", "então",
+    "entao", "quando", "onde", "como", "porque", "por", "que", "quem", "qual", "hm", "hmm", "bem",
+    "bom", "boa", "ah", "oh", "ei", "obrigado", "obrigada", "talvez", "agora", "depois", "antes",
+    "se", "uma", "um", "os", "as", "bem-vindo", "bem-vinda", "meu", "minha", "seu", "sua", "nosso", "nossa", "e", "o", "a",
+}
+_ENTITY_RE = re.compile(r"\b[A-ZÀ-Ý][\wÀ-ÿ'’-]{2,}")
+
+
+def _new_entities(texts: List[str], known: str) -> List[str]:
+    """Nomes próprios (palavras capitalizadas) de `texts` que não aparecem em `known` (minúsculo)."""
+    found: List[str] = []
+    for text in texts:
+        for word in _ENTITY_RE.findall(text or ""):
+            low = word.lower()
+            if low in _NOT_ENTITIES or low in known or word in found:
+                continue
+            found.append(word)
+    return found
+
+
+def _kb_slice(kb: Dict[str, List[Dict[str, Any]]], text: str) -> Dict[str, Any]:
+    """Snapshot enxuto do KB: resumo completo só dos itens citados em `text`; dos demais, só o título."""
+    low = (text or "").lower()
+    out: Dict[str, Any] = {}
+    for cat, items in kb.items():
+        mentioned, others = [], []
+        for it in items if isinstance(items, list) else []:
+            title = str(it.get("title", "")).strip()
+            if not title:
+                continue
+            if title.lower() in low:
+                mentioned.append({"title": title, "summary": it.get("summary", "")})
+            else:
+                others.append(title)
+        out[cat] = {"citados": mentioned, "outros_titulos": others}
+    return out
+
 
 class NPCGraph:
-    def __init__(self, persona: Persona = DEFAULT_PERSONA, npc_id: Optional[str] = None):
+    def __init__(
+        self,
+        persona: Persona = DEFAULT_PERSONA,
+        npc_id: Optional[str] = None,
+        parallel: Optional[bool] = None,
+        background: Optional[bool] = None,
+        pipeline: Optional[str] = None,
+    ):
         # Configure logger
         self.logger = logging.getLogger("npc.runtime")
-        if not logging.getLogger().handlers:
-            logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(name)s: %(message)s")
+        # Fila não bloqueante, amostragem/truncamento por agente (core/lazy_logging.py)
+        configure_logging()
         self.persona = persona
         self.npc_id = npc_id or persona.name
         self.store = JSONMemoryStore(self.npc_id)
         self.kb = CategorizedMemoryStore(self.npc_id)
-        self.memory = MemorySaver()
-        # Initialize the graph with the checkpointer
-        graph = build_graph()
-        self.app = graph.compile(checkpointer=self.memory)
+        # Grafo e checkpointer são do processo (graph/wiring.py): o NPCGraph é só um handle
+        # com persona, stores e o prefixo `<npc_id>:` das threads no checkpointer
+        self.memory = shared_checkpointer()
+        # dinamic_emotion || context_awareness (NPC_GRAPH_PARALLEL=0 volta à cadeia serial)
+        if parallel is None:
+            parallel = os.getenv("NPC_GRAPH_PARALLEL", "1").strip().lower() not in ("0", "false", "no")
+        # "full" (planner → dialogue → critic) ou "fast" (uma chamada fast_turn); NPC_PIPELINE define o padrão
+        self.parallel = parallel
+        self.pipeline = pipeline or os.getenv("NPC_PIPELINE", "full").strip().lower()
+        self.app = get_compiled_graph(parallel=parallel, pipeline=self.pipeline)
+        # relationship e auto_memorize pós-resposta rodam depois do turno (core/post_turn.py);
+        # NPC_POST_TURN_BACKGROUND=0 aguarda os dois antes de devolver a resposta
+        if background is None:
+            background = os.getenv("NPC_POST_TURN_BACKGROUND", "1").strip().lower() not in ("0", "false", "no")
+        self.background = background
+        self.post_turn = PostTurnQueue(self.npc_id)
+        # NPC_KB_ENTITY_GATE=1: auto_memorize só chama o LLM quando o turno traz nomes próprios novos
+        self.kb_entity_gate = os.getenv("NPC_KB_ENTITY_GATE", "0").strip().lower() in ("1", "true", "yes")
+
+    async def flush(self) -> None:
+        """Aguarda o pós-processamento dos turnos já respondidos (testes, troca de loop, shutdown)."""
+        await self.post_turn.flush()
+
+    async def aclose(self) -> None:
+        """Conclui o pós-processamento pendente e encerra o worker da fila."""
+        await self.post_turn.aclose()
 
     def _seed(self) -> Dict[str, Any]:
         return {
@@ -73,17 +193,60 @@ class NPCGraph:
         content = "\n".join(lines)
         return SystemMessage(content=content)
 
-    async def respond_once(self, user_text: str, *, thread_id: Optional[str] = None, events: Optional[List[Dict[str, Any]]] = None):
+    async def respond_once(
+        self,
+        user_text: str,
+        *,
+        thread_id: Optional[str] = None,
+        events: Optional[List[Dict[str, Any]]] = None,
+        pipeline: Optional[str] = None,
+    ):
+        """Executa um turno. Cancelar a task aborta as requisições em voo (LLM e TTS) e os retries pendentes.
+
+        `pipeline` ("full" ou "fast") troca a variante do grafo só neste turno.
+        """
+        base_tid = thread_id or str(uuid.uuid4())
+        turn_id = uuid.uuid4().hex[:12]
+        metrics = get_metrics_logger()
+        start = time.time()
+        # Contexto de atribuição do turno: flui para LLMHarness, métricas e logs
+        with call_context(npc_id=self.npc_id, thread_id=f"{self.npc_id}:{base_tid}", turn_id=turn_id):
+            try:
+                return await self._respond_once(user_text, thread_id=base_tid, events=events, pipeline=pipeline)
+            except asyncio.CancelledError:
+                # Tokens já gastos no turno abandonado (respostas descartadas + requisições abortadas)
+                wasted = metrics.pop_turn_tokens(turn_id)
+                elapsed_ms = (time.time() - start) * 1000
+                self.logger.warning("turn cancelled after %.0f ms; %d tokens wasted", elapsed_ms, wasted)
+                metrics.log_event(event="turn_cancelled", detail=self.npc_id, value=wasted, reason=f"{elapsed_ms:.0f} ms")
+                raise
+            finally:
+                metrics.pop_turn_tokens(turn_id)
+
+    async def _respond_once(
+        self,
+        user_text: str,
+        *,
+        thread_id: Optional[str] = None,
+        events: Optional[List[Dict[str, Any]]] = None,
+        pipeline: Optional[str] = None,
+    ):
         base_tid = thread_id or str(uuid.uuid4())
         tid = f"{self.npc_id}:{base_tid}"
         config = {"configurable": {"thread_id": tid}}
+
+        # O turno anterior pode ainda estar atualizando relacionamento/KB em segundo plano
+        waited_ms = await self.post_turn.flush()
+        if waited_ms >= 1:
+            self.logger.info("[tid=%s] waited %.0f ms for previous post-turn work", tid, waited_ms)
+            get_metrics_logger().log_event(event="post_turn_wait", detail=self.npc_id, value=round(waited_ms, 1))
         
         # Initialize state
         state = self._seed()
         
-        self.logger.info(f"[tid={tid}] user: {user_text}")
+        self.logger.info("[tid=%s] user: %s", tid, user_text)
         if events:
-            self.logger.info(f"[tid={tid}] events: {len(events)}")
+            self.logger.info("[tid=%s] events: %d", tid, len(events))
         
         # Add the user's message
         if "messages" not in state:
@@ -96,38 +259,27 @@ class NPCGraph:
                 state["events"] = []
             state["events"].extend(events)
         
-        # Pre-memorize so o KB já influencie este mesmo turno
-        try:
-            await self._auto_memorize(user_text=user_text, reply_text="", events=events or [], messages=state.get("messages", []))
-            # Atualiza a SystemMessage de KB inserida no seed
-            msgs = state.get("messages", [])
-            if len(msgs) >= 2 and isinstance(msgs[1], SystemMessage):
-                msgs[1] = self._kb_system_message()
-                state["messages"] = msgs
-        except Exception as e:
-            self.logger.warning(f"[tid={tid}] pre_auto_memorize failed: {e}")
-            
+        # Sem auto_memorize antes do grafo: o KB do seed já inclui a extração do turno
+        # anterior (a fila pós-turno foi esvaziada acima) e a fala do jogador está nas mensagens
+
         # Ensure all required keys are present
         for key in ["intent", "emotions", "scratch", "action", "persona"]:
             if key not in state:
                 state[key] = None if key == "intent" or key == "action" else {}
                 
         # Invoke the graph
-        result = await self.app.ainvoke(state, config=config)
+        app = self.app if pipeline in (None, self.pipeline) else get_compiled_graph(parallel=self.parallel, pipeline=pipeline)
+        result = await app.ainvoke(state, config=config)
         scratch = result.get("scratch", {}) or {}
         
-        # Prepara action para log (remove áudio binário se existir)
-        action_for_log = result.get("action")
-        if action_for_log and isinstance(action_for_log, dict):
-            action_for_log = dict(action_for_log)
-            if "audio" in action_for_log:
-                action_for_log["audio"] = f"<bytes: {len(action_for_log['audio'])} bytes>"
-        
+        # action e scratch só são renderizados se o registro for emitido (áudio binário vira o tamanho)
         self.logger.info(
-            f"[tid={tid}] graph executed; intent={result.get('intent')} "
-            f"scratch_keys={list(scratch.keys())} "
-            f"action={action_for_log} "
-            f"final_reply={scratch.get('final_reply')}"
+            "[tid=%s] graph executed; intent=%s scratch_keys=%s action=%s final_reply=%s",
+            tid,
+            result.get("intent"),
+            Lazy(list, scratch.keys()),
+            truncated(Lazy(_action_for_log, result.get("action")), 500),
+            scratch.get("final_reply"),
         )
 
         action = result.get("action")
@@ -165,7 +317,7 @@ class NPCGraph:
                     # Se ainda não encontrou, cria action vazio para não quebrar
                     action = action or {"type": "say", "content": ""}
 
-        self.logger.info(f"[tid={tid}] reply={reply_text}")
+        self.logger.info("[tid=%s] reply=%s", tid, reply_text)
 
         # Persist minimal, readable memory per interaction
         try:
@@ -186,11 +338,8 @@ class NPCGraph:
         except Exception:
             pass
 
-        # Auto-build categorized KB from the latest turn
-        try:
-            await self._auto_memorize(user_text=user_text, reply_text=reply_text or "", events=events or [], messages=result.get("messages", []))
-        except Exception as e:
-            self.logger.warning(f"[tid={tid}] auto_memorize failed: {e}")
+        # Relacionamento e KB do turno não mudam a fala: seguem para a fila pós-turno
+        await self._post_turn(result, user_text=user_text, reply_text=reply_text or "", events=events or [])
 
         # Reduz mensagens para manter apenas as últimas N (EpisodicMemory)
         # Nota: O LangGraph já salva o estado automaticamente no checkpoint após ainvoke,
@@ -205,6 +354,21 @@ class NPCGraph:
             "audio": action.get("audio") if isinstance(action, dict) else None,
         }
 
+    async def _post_turn(self, result: Dict[str, Any], *, user_text: str, reply_text: str, events: List[Dict[str, Any]]) -> None:
+        """Enfileira relationship e auto_memorize do turno (em ordem); sem background, aguarda os dois."""
+        messages = list(result.get("messages", []))
+
+        async def update_relationship() -> None:
+            await traced_node("relationship", relationship)(result)
+
+        async def memorize() -> None:
+            await self._auto_memorize(user_text=user_text, reply_text=reply_text, events=events, messages=messages)
+
+        await self.post_turn.submit("relationship", update_relationship)
+        await self.post_turn.submit("auto_memorize", memorize)
+        if not self.background:
+            await self.post_turn.flush()
+
     async def _auto_memorize(self, *, user_text: str, reply_text: str, events: List[Dict[str, Any]], messages: List[Any]) -> None:
         """Usa LLM para detectar NOVAS ou ATUALIZADAS memórias e persistir no KB.
 
@@ -219,6 +383,18 @@ class NPCGraph:
         except Exception:
             kb_snapshot = {"life": [], "people": [], "places": [], "skills": [], "objects": []}
 
+        turn_texts = [user_text, reply_text] + [str(e.get("content", "")) for e in events or []]
+        # Filtro local opcional: sem eventos e sem nomes próprios novos, não chama o LLM
+        if self.kb_entity_gate and not events:
+            known = " ".join(
+                f"{it.get('title', '')} {it.get('summary', '')}"
+                for items in kb_snapshot.values() if isinstance(items, list) for it in items
+            ).lower() + f" {self.persona.name}".lower()
+            if not _new_entities(turn_texts, known):
+                self.logger.info("auto_memorize: no new entities this turn, skipping LLM")
+                get_metrics_logger().log_event(event="auto_memorize_skipped", detail=self.npc_id, reason="no_new_entities")
+                return
+
         # Constrói prompt instruindo comparação com o KB atual e JSON estrito
         sys = {
             "role": "system",
@@ -237,6 +413,7 @@ class NPCGraph:
                 "- Se incerto, NÃO adicione. Prefira não escrever a inventar.\n"
                 "- Você pode reformular/resumir, mas não inventar novos fatos.\n"
                 "Regras de atualização:\n"
+                "- KB_ATUAL traz, por categoria, os itens citados na conversa ('citados', com summary) e os títulos dos demais ('outros_titulos').\n"
                 "- Compare com o KB: se existir mesmo 'title', atualize 'summary' apenas se houver informação nova relevante.\n"
                 "- 'title' deve ser curto e desambiguado (ex.: 'Sanimimarruchi', 'Ruínas do templo ao norte', 'Relíquia antiga').\n"
                 "- 'summary' em 1–2 frases, incluindo atributos essenciais (ex.: profissão, relação, localização/rota, utilidade).\n"
@@ -248,7 +425,11 @@ class NPCGraph:
         }
         conv_payload: List[Dict[str, Any]] = [sys]
         # Anexa snapshot do KB como contexto
-        conv_payload.append({"role": "system", "content": f"KB_ATUAL=\n{json.dumps(kb_snapshot, ensure_ascii=False)}"})
+        # Só os itens citados no turno vão com resumo; o resto, só pelo título (para não duplicar)
+        recent_text = " ".join(turn_texts + [
+            str(getattr(m, "content", "") or "") for m in recent_msgs if getattr(m, "type", None) in ("human", "ai")
+        ])
+        conv_payload.append({"role": "system", "content": f"KB_ATUAL=\n{dumps(_kb_slice(kb_snapshot, recent_text))}"})
         # Inclui últimas mensagens como contexto bruto
         for m in recent_msgs:
             try:
@@ -274,45 +455,27 @@ class NPCGraph:
             conv_payload.append({"role": "assistant", "content": reply_text})
 
         # LLM obrigatório: não usar heurística
-        data = None
         try:
             from core.models_preset import NPC_KB_MODEL
-            harness = LLMHarness(model=NPC_KB_MODEL, temperature=0.2, max_retries=2, timeout=30)
-            raw = await harness.run(conv_payload, agent_name="auto_memorize", npc_id=self.npc_id)
+            harness = LLMHarness(
+                model=NPC_KB_MODEL,
+                profile="auto_memorize",
+                max_retries=2,
+                lane="background",
+                response_format=json_response_format(KBUpdate),
+            )
+            data = await harness.run_structured(conv_payload, KBUpdate, agent_name="auto_memorize", npc_id=self.npc_id)
+        except StructuredOutputError as e:
+            self.logger.warning("auto_memorize: invalid JSON, skipping memorization this turn: %s", e)
+            return
         except Exception as e:
-            self.logger.warning(f"auto_memorize: LLM failed, skipping memorization this turn: {e}")
+            self.logger.warning("auto_memorize: LLM failed, skipping memorization this turn: %s", e)
             return
-        # Tenta extrair JSON limpo (remove cercas de código, se houver)
-        txt = raw.strip()
-        if txt.startswith("```"):
-            # remove ```json ... ```
-            first = txt.find("\n")
-            last = txt.rfind("```")
-            if first != -1 and last != -1:
-                txt = txt[first+1:last].strip()
-        try:
-            data = json.loads(txt) if txt else None
-        except Exception:
-            data = None
 
-        def iter_items(cat: str):
-            items = data.get(cat, []) if isinstance(data, dict) else []
-            if isinstance(items, list):
-                for it in items:
-                    if not isinstance(it, dict):
-                        continue
-                    title = str(it.get("title", "")).strip()
-                    summary = str(it.get("summary", "")).strip()
-                    meta = it.get("metadata") if isinstance(it.get("metadata"), dict) else None
-                    if title and summary:
-                        yield title, summary, meta
-
-        if not isinstance(data, dict):
-            return
         for cat in ("life", "people", "places", "skills", "objects"):
-            for title, summary, meta in iter_items(cat):
+            for item in getattr(data, cat):
                 try:
-                    self.kb.upsert_item(category=cat, title=title, summary=summary, metadata=meta)
-                    self.logger.info(f"auto_memorize: +KB [{cat}] '{title}'")
+                    self.kb.upsert_item(category=cat, title=item.title, summary=item.summary, metadata=item.metadata)
+                    self.logger.info("auto_memorize: +KB [%s] '%s'", cat, item.title)
                 except Exception:
                     continue
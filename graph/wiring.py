@@ -1,5 +1,9 @@
+import threading
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, END
-from core.state import NPCState
+from core.state import NPCState, dict_patch
 from agents.perception import perception
 from agents.personality import personality
 from agents.dinamic_emotion import dinamic_emotion
@@ -8,24 +12,95 @@ from agents.world_model import world_model
 from agents.planner import planner
 from agents.dialogue import dialogue
 from agents.critic import critic
-from agents.relationship import relationship
+from agents.fast_turn import fast_turn
+from core.call_context import traced_node
 
+# Campos dict que os ramos paralelos devolvem como patch (reducer em core/state.py)
+_PATCHED_KEYS = ("scratch", "emotions")
 
-def build_graph() -> StateGraph[NPCState]:
+
+def parallel_branch(fn: Callable[[Any], Awaitable[Any]]) -> Callable[[Any], Awaitable[Dict[str, Any]]]:
+    """Adapta um nó que altera o estado in-place para rodar em paralelo com outro.
+
+    O nó recebe cópias próprias de `scratch`/`emotions` (os ramos não se enxergam)
+    e, no lugar do estado inteiro, devolve só o que mudou: patches para os campos
+    dict e os demais campos reatribuídos. Mutações in-place em listas (ex.:
+    `messages.append`) não são detectadas; os ramos paralelos não as fazem.
+    """
+    @wraps(fn)
+    async def node(state: Any) -> Dict[str, Any]:
+        local = dict(state)
+        for key in _PATCHED_KEYS:
+            local[key] = dict(state.get(key) or {})
+        out = await fn(local)
+        if out is None:
+            out = local
+        update: Dict[str, Any] = {}
+        for key, value in out.items():
+            if key in _PATCHED_KEYS:
+                before = state.get(key) or {}
+                value = value or {}
+                changed = {k: v for k, v in value.items() if k not in before or before[k] != v}
+                removed = [k for k in before if k not in value]
+                if changed or removed:
+                    update[key] = dict_patch(changed, removed)
+            elif key not in state or state[key] is not value:
+                update[key] = value
+        return update
+    return node
+
+
+async def scene_ready(state: NPCState) -> Dict[str, Any]:
+    """Ponto de encontro do ramo de cena (context_awareness, com ou sem world_model) com o de emoções."""
+    return {}
+
+
+PIPELINES = ("full", "fast")
+
+
+def build_graph(parallel: bool = True, pipeline: str = "full") -> StateGraph[NPCState]:
+    """Monta o grafo do NPC.
+
+    Com `parallel=True`, dinamic_emotion e context_awareness rodam no mesmo passo
+    (duas chamadas LLM concorrentes) e o planner espera os dois ramos. Nesse modo,
+    context_awareness vê as emoções de antes da atualização do turno.
+
+    `pipeline="fast"` troca planner → (world_model) → dialogue → critic por um único
+    nó `fast_turn` (intenção, fala final e notas do crítico numa chamada estruturada).
+    """
+    if pipeline not in PIPELINES:
+        raise ValueError(f"Pipeline desconhecido: {pipeline!r} (use {', '.join(PIPELINES)})")
+    fast = pipeline == "fast"
+    # Primeiro nó depois da cena pronta
+    after_scene = "fast_turn" if fast else "planner"
     g = StateGraph(NPCState)
-    g.add_node("perception", perception)
-    g.add_node("personality", personality)
-    g.add_node("dinamic_emotion", dinamic_emotion)
-    g.add_node("context_awareness", context_awareness)
-    g.add_node("planner", planner)
-    g.add_node("world_model", world_model)
-    g.add_node("dialogue", dialogue)
-    g.add_node("critic", critic)
-    g.add_node("relationship", relationship)
+    g.add_node("perception", traced_node("perception", perception))
+    g.add_node("personality", traced_node("personality", personality))
+    if parallel:
+        g.add_node("dinamic_emotion", traced_node("dinamic_emotion", parallel_branch(dinamic_emotion)))
+        g.add_node("context_awareness", traced_node("context_awareness", parallel_branch(context_awareness)))
+        g.add_node("scene_ready", scene_ready)
+    else:
+        g.add_node("dinamic_emotion", traced_node("dinamic_emotion", dinamic_emotion))
+        g.add_node("context_awareness", traced_node("context_awareness", context_awareness))
+    g.add_node("world_model", traced_node("world_model", world_model))
+    if fast:
+        g.add_node("fast_turn", traced_node("fast_turn", fast_turn))
+    else:
+        g.add_node("planner", traced_node("planner", planner))
+        g.add_node("dialogue", traced_node("dialogue", dialogue))
+        g.add_node("critic", traced_node("critic", critic))
     g.set_entry_point("perception")
     g.add_edge("perception", "personality")
-    g.add_edge("personality", "dinamic_emotion")
-    g.add_edge("dinamic_emotion", "context_awareness")
+    if parallel:
+        # Fan-out: os dois ramos partem de personality
+        g.add_edge("personality", "dinamic_emotion")
+        g.add_edge("personality", "context_awareness")
+        # Fan-in: o planner só roda quando emoções e cena estão prontas
+        g.add_edge(["dinamic_emotion", "scene_ready"], after_scene)
+    else:
+        g.add_edge("personality", "dinamic_emotion")
+        g.add_edge("dinamic_emotion", "context_awareness")
 
     def needs_world(state: NPCState) -> str:
         """Verifica se precisa acessar world_model."""
@@ -61,9 +136,18 @@ def build_graph() -> StateGraph[NPCState]:
     # context_awareness pode acessar world_model se necessário
     g.add_conditional_edges("context_awareness", needs_world, {
         "world_model": "world_model",
-        "next": "planner",
+        "next": "scene_ready" if parallel else after_scene,
     })
 
+    if fast:
+        # fast_turn não consulta o world_model; só o context_awareness volta dele
+        g.add_conditional_edges("world_model", world_model_return, {
+            "context_awareness": "context_awareness",
+            "planner": "context_awareness",
+        })
+        g.add_edge("fast_turn", END)
+        return g
+
     # planner pode acessar world_model se necessário
     g.add_conditional_edges("planner", needs_world, {
         "world_model": "world_model",
@@ -78,6 +162,46 @@ def build_graph() -> StateGraph[NPCState]:
         "context_awareness": "context_awareness",
         "planner": "planner",
     })
-    g.add_edge("critic", "relationship")
-    g.add_edge("relationship", END)
+    # relationship roda fora do grafo, na fila pós-turno do NPCGraph (core/post_turn.py)
+    g.add_edge("critic", END)
     return g
+
+
+# Grafos compilados do processo, por configuração do pipeline (compartilhados por todos os NPCs)
+_compiled: Dict[Tuple[Any, ...], Any] = {}
+_compile_lock = threading.Lock()
+_checkpointer: Optional[MemorySaver] = None
+
+
+def shared_checkpointer() -> MemorySaver:
+    """Checkpointer único do processo; cada NPC usa threads próprias (`<npc_id>:<thread_id>`)."""
+    global _checkpointer
+    with _compile_lock:
+        if _checkpointer is None:
+            _checkpointer = MemorySaver()
+        return _checkpointer
+
+
+def get_compiled_graph(parallel: bool = True, pipeline: str = "full") -> Any:
+    """Grafo compilado para a configuração pedida, montado uma vez por processo.
+
+    Os nós não guardam estado do NPC (persona, npc_id e stores vêm do estado do
+    turno), então a mesma instância atende todos os NPCs, inclusive em paralelo.
+    """
+    key = (bool(parallel), pipeline)
+    app = _compiled.get(key)
+    if app is not None:
+        return app
+    checkpointer = shared_checkpointer()
+    with _compile_lock:
+        app = _compiled.get(key)
+        if app is None:
+            app = build_graph(parallel=parallel, pipeline=pipeline).compile(checkpointer=checkpointer)
+            _compiled[key] = app
+        return app
+
+
+def clear_compiled_graphs() -> None:
+    """Esquece os grafos compilados (benchmarks, troca de nós em tempo de execução)."""
+    with _compile_lock:
+        _compiled.clear()
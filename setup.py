@@ -12,5 +12,11 @@ setup(
         'streamlit>=1.32.0',
         'python-dotenv>=1.0.1'
     ],
+    extras_require={
+        # Transporte HTTP/2 opcional (NPC_LLM_BACKEND=http2)
+        'http2': ['httpx[http2]'],
+        # Serialização JSON rápida (core/serialization.py)
+        'fast-json': ['orjson'],
+    },
     python_requires='>=3.8',
 )
@@ -10,6 +10,7 @@ from core.personas import PERSONAS
 from core.json_memory import JSONMemoryStore
 from core.npc_manager import NPCManager
 from core.voice import transcribe_audio
+from core.http_pool import close_http_sessions
 
 # Optional: allow overriding world lore used by world_model at runtime
 # We will try to load from data/world_lore.json and patch both modules' variables
@@ -64,6 +65,8 @@ def run_async(coro):
         try:
             return loop.run_until_complete(coro)
         finally:
+            # Sessões HTTP keep-alive são por loop: fecha antes de descartar o loop
+            loop.run_until_complete(close_http_sessions())
             loop.close()
     except Exception:
         # Fallback
@@ -711,12 +714,15 @@ with col_left:
 
         # Respond using the graph
         async def get_reply():
-            return await st.session_state.manager.respond_once(
+            result = await st.session_state.manager.respond_once(
                 npc_id=npc_id,
                 user_text=user_input,
                 thread_id=st.session_state.thread_id,
                 events=st.session_state.pending_events if st.session_state.pending_events else None,
             )
+            # O loop é descartado ao fim de run_async: conclui relacionamento/KB do turno antes
+            await st.session_state.manager.flush(npc_id)
+            return result
 
         try:
             result = run_async(get_reply())